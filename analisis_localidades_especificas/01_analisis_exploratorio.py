@@ -4,6 +4,8 @@ Análisis Exploratorio de Datos - Localidades Específicas de Chile
 Análisis de datos de calidad del aire para determinar mejores modelos de predicción
 """
 
+import os
+import sys
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
@@ -12,6 +14,9 @@ from datetime import datetime
 import warnings
 warnings.filterwarnings('ignore')
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+from dataset_profile import profile_dataset
+
 # Configurar estilo de gráficos
 plt.style.use('default')
 sns.set_palette("husl")
@@ -119,17 +124,22 @@ def analizar_distribucion_geografica(df):
     """
     print(f"\n=== ANÁLISIS DE DISTRIBUCIÓN GEOGRÁFICA ===")
     
+    # Perfil memorizado: conteos, parámetros y coordenadas por localidad en una pasada
+    profile = profile_dataset(df, 'parametro_nombre', 'localidad_buscada', 'fecha_desde_utc',
+                              value_col=None, category_cols=(),
+                              first_cols=('coordenadas_lat', 'coordenadas_lon'))
+    
     # Localidades únicas
-    localidades = df['localidad_buscada'].unique()
+    localidades = profile.uniques['localidad_buscada'].to_numpy()
     print(f"Localidades analizadas: {', '.join(localidades)}")
     
     # Estadísticas por localidad
     for localidad in localidades:
-        df_loc = df[df['localidad_buscada'] == localidad]
+        coordenadas = profile.location_first.loc[localidad]
         print(f"\n{localidad}:")
-        print(f"  - Mediciones: {len(df_loc):,}")
-        print(f"  - Coordenadas: ({df_loc['coordenadas_lat'].iloc[0]:.6f}, {df_loc['coordenadas_lon'].iloc[0]:.6f})")
-        print(f"  - Parámetros: {', '.join(df_loc['parametro_nombre'].unique())}")
+        print(f"  - Mediciones: {profile.location_counts(localidad):,}")
+        print(f"  - Coordenadas: ({coordenadas['coordenadas_lat']:.6f}, {coordenadas['coordenadas_lon']:.6f})")
+        print(f"  - Parámetros: {', '.join(profile.location_parameters[localidad])}")
     
     return localidades
 
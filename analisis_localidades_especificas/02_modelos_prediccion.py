@@ -4,6 +4,8 @@ Implementación de Modelos de Predicción - Calidad del Aire
 Comparación de diferentes enfoques para predicción y recomendaciones
 """
 
+import os
+import sys
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
@@ -12,6 +14,14 @@ from datetime import datetime, timedelta
 import warnings
 warnings.filterwarnings('ignore')
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+from unit_normalization import normalize_units
+from data_validation import filter_valid, validate_measurements
+from feature_store import build_features
+from data_utils import create_hourly_panel
+from spatial_features import StationNeighbors, cross_series_features
+from backtesting import WalkForwardBacktest
+
 # Modelos de Machine Learning
 from sklearn.linear_model import LinearRegression, Ridge
 from sklearn.ensemble import RandomForestRegressor
@@ -28,6 +38,29 @@ from statsmodels.graphics.tsaplots import plot_acf, plot_pacf
 plt.style.use('default')
 sns.set_palette("husl")
 
+# Caché compartida de características y especificación del dataset de modelado
+FEATURE_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'feature_cache')
+FEATURES_MODELADO = (['mes', 'hora', 'dia_semana', 'dia_ano']
+                     + [f'lag_{lag}' for lag in [1, 2, 3, 6, 12, 24]]
+                     + [f'media_movil_{window}' for window in [3, 6, 12, 24]])
+
+# Rezagos cruzados: otros contaminantes de la estación y estaciones vecinas
+CONTAMINANTES_CRUZADOS = ['pm25', 'pm10', 'co', 'no2']
+LAGS_CRUZADOS = [1, 3, 24]
+VECINOS_CRUZADOS = 2
+COBERTURA_MINIMA_CRUZADOS = 0.8
+
+# Backtesting walk-forward: bloques semanales y folds entrenados en caché
+BACKTEST_FOLD_HOURS = 24 * 7
+BACKTEST_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'backtest_cache')
+
+def features_cruzados(parametro):
+    """Rezagos de los otros contaminantes de la estación y del parámetro en los vecinos"""
+    propios = [f'{p}_lag_{lag}' for p in CONTAMINANTES_CRUZADOS if p != parametro for lag in LAGS_CRUZADOS]
+    vecinos = [f'vecino{r}_{parametro}_lag_{lag}' for r in range(1, VECINOS_CRUZADOS + 1)
+               for lag in LAGS_CRUZADOS]
+    return propios + vecinos
+
 def cargar_y_preparar_datos():
     """
     Cargar y preparar datos para modelado
@@ -41,6 +74,15 @@ def cargar_y_preparar_datos():
         print("✗ No se encontró el archivo de datos")
         return None
     
+    # Llevar a unidad canónica y validar antes de modelar
+    if 'valor_normalizado' not in df.columns:
+        df = normalize_units(df, 'parametro_nombre', 'unidad', 'valor',
+                             'valor_normalizado', 'unidad_codigo')
+    df = validate_measurements(df, 'parametro_nombre', 'valor_normalizado', 'fecha_desde_utc',
+                               'localidad_nombre', 'sensor_id', 'cobertura_porcentaje',
+                               'banderas_calidad')
+    df = filter_valid(df, 'banderas_calidad')
+    
     # Convertir fechas
     df['fecha_desde_utc'] = pd.to_datetime(df['fecha_desde_utc'])
     
@@ -56,9 +98,22 @@ def cargar_y_preparar_datos():
     print(f"✓ Datos preparados con features temporales")
     return df
 
-def crear_dataset_modelado(df, parametro='pm25', localidad='Indura'):
+def preparar_datos_cruzados(df):
+    """
+    Panel horario y tabla de vecinos por distancia, calculados una sola vez
+    para todas las combinaciones (parámetro, localidad)
+    """
+    panel = create_hourly_panel(df, 'fecha_desde_utc', 'localidad_buscada', 'parametro_nombre', 'valor')
+    vecinos = StationNeighbors.from_coordinates(df, 'localidad_buscada', 'coordenadas_lat',
+                                                'coordenadas_lon', k=VECINOS_CRUZADOS)
+    return panel, vecinos
+
+def crear_dataset_modelado(df, parametro='pm25', localidad='Indura', panel=None, vecinos=None):
     """
     Crear dataset específico para un parámetro y localidad
+    
+    panel y vecinos vienen de preparar_datos_cruzados; si faltan se calculan
+    aquí (conviene precalcularlos al crear varios datasets)
     """
     print(f"\n=== CREANDO DATASET PARA {parametro} en {localidad} ===")
     
@@ -77,19 +132,19 @@ def crear_dataset_modelado(df, parametro='pm25', localidad='Indura'):
         aggfunc='mean'
     ).fillna(method='ffill').fillna(method='bfill')
     
-    # Crear features adicionales
-    pivot_df['mes'] = pivot_df.index.month
-    pivot_df['hora'] = pivot_df.index.hour
-    pivot_df['dia_semana'] = pivot_df.index.dayofweek
-    pivot_df['dia_ano'] = pivot_df.index.dayofyear
+    # Calendario, lags y medias móviles desde el almacén compartido; los lags
+    # toman el valor de hace k horas, no de k filas atrás
+    features = build_features(pivot_df.reset_index(), FEATURES_MODELADO, 'fecha_desde_utc', 'valor',
+                              lag_mode='hours', directory=FEATURE_CACHE_DIR)
+    pivot_df = pd.concat([pivot_df, features.set_axis(pivot_df.index)], axis=1)
     
-    # Crear lags (valores anteriores)
-    for lag in [1, 2, 3, 6, 12, 24]:
-        pivot_df[f'lag_{lag}'] = pivot_df['valor'].shift(lag)
-    
-    # Crear medias móviles
-    for window in [3, 6, 12, 24]:
-        pivot_df[f'media_movil_{window}'] = pivot_df['valor'].rolling(window=window).mean()
+    # Estaciones vecinas y otros contaminantes por gather sobre el panel horario;
+    # se descartan las columnas con poca cobertura antes de eliminar nulos
+    if panel is None or vecinos is None:
+        panel, vecinos = preparar_datos_cruzados(df)
+    cruzados = cross_series_features(panel, pivot_df.index, localidad, features_cruzados(parametro),
+                                     vecinos, min_coverage=COBERTURA_MINIMA_CRUZADOS)
+    pivot_df = pd.concat([pivot_df, cruzados.set_axis(pivot_df.index)], axis=1)
     
     # Eliminar filas con valores nulos
     pivot_df = pivot_df.dropna()
@@ -291,6 +346,26 @@ def modelo_arima(train_df, val_df, test_df):
         print(f"✗ Error en modelo ARIMA: {e}")
         return None, None, None
 
+def backtesting_walk_forward(df, modo='expanding'):
+    """
+    Backtesting walk-forward de regresión lineal y Random Forest
+    
+    A diferencia de la división única 60/20/20, cada semana se predice con
+    modelos entrenados solo con las semanas anteriores.
+    """
+    print(f"\n=== BACKTESTING WALK-FORWARD ({modo}) ===")
+    
+    feature_cols = [col for col in df.columns if col != 'valor']
+    X = df[feature_cols].to_numpy(dtype=np.float32)
+    modelos = {
+        'Regresión Lineal': LinearRegression(),
+        'Random Forest': RandomForestRegressor(n_estimators=100, random_state=42)
+    }
+    
+    backtest = WalkForwardBacktest(fold_hours=BACKTEST_FOLD_HOURS, mode=modo,
+                                   cache_dir=BACKTEST_CACHE_DIR)
+    return backtest.run(modelos, X, df['valor'].to_numpy(), df.index)
+
 def comparar_modelos(resultados_modelos):
     """
     Comparar rendimiento de todos los modelos
@@ -512,8 +587,9 @@ def main():
     if df is None:
         return
     
-    # 2. Crear dataset para modelado
-    pivot_df, parametro, localidad = crear_dataset_modelado(df, 'pm25', 'Indura')
+    # 2. Crear dataset para modelado (panel y vecinos se calculan una vez)
+    panel, vecinos = preparar_datos_cruzados(df)
+    pivot_df, parametro, localidad = crear_dataset_modelado(df, 'pm25', 'Indura', panel, vecinos)
     if pivot_df is None:
         return
     
@@ -541,19 +617,27 @@ def main():
     # 5. Comparar modelos
     df_comparacion = comparar_modelos(resultados_modelos)
     
-    # 6. Generar recomendaciones
+    # 6. Backtesting walk-forward (sin fuga de datos futuros)
+    df_backtest = backtesting_walk_forward(pivot_df)
+    
+    # 7. Generar recomendaciones
     generar_recomendaciones_finales(df_comparacion, parametro, localidad)
     
-    # 7. Crear visualizaciones
+    # 8. Crear visualizaciones
     crear_visualizaciones_comparativas(resultados_modelos, df_comparacion)
     
-    # 8. Guardar resultados
+    # 9. Guardar resultados
     print(f"\n=== GUARDANDO RESULTADOS ===")
     
     # Guardar comparación de modelos
     df_comparacion.to_csv('comparacion_modelos.csv', index=False)
     print(f"✓ Comparación de modelos guardada en: comparacion_modelos.csv")
     
+    # Guardar métricas del backtesting por fold
+    if len(df_backtest):
+        df_backtest.to_csv('backtesting_walk_forward.csv', index=False)
+        print(f"✓ Backtesting guardado en: backtesting_walk_forward.csv")
+    
     # Guardar feature importance si existe
     if 'Random Forest' in resultados_modelos:
         feature_importance.to_csv('feature_importance_random_forest.csv', index=False)
@@ -4,6 +4,8 @@ Generador de Recomendaciones para Usuarios Finales - Calidad del Aire
 Sistema de alertas y recomendaciones basado en datos de contaminación
 """
 
+import os
+import sys
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
@@ -12,6 +14,11 @@ from datetime import datetime, timedelta
 import warnings
 warnings.filterwarnings('ignore')
 
+# Módulos compartidos del proyecto
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+from air_quality_index import QUALITY_LEVELS, classify_values, get_thresholds
+from unit_normalization import CANONICAL_UNITS, normalize_units
+
 # Configuración
 plt.style.use('default')
 sns.set_palette("husl")
@@ -29,6 +36,11 @@ def cargar_datos_analizados():
         # Convertir fechas
         df['fecha_desde_utc'] = pd.to_datetime(df['fecha_desde_utc'])
         
+        # Llevar cada parámetro a la unidad de los umbrales (una sola vez)
+        if 'valor_normalizado' not in df.columns:
+            df = normalize_units(df, 'parametro_nombre', 'unidad', 'valor',
+                                 'valor_normalizado', 'unidad_codigo')
+        
         # Crear features temporales
         df['mes'] = df['fecha_desde_utc'].dt.month
         df['hora'] = df['fecha_desde_utc'].dt.hour
@@ -52,56 +64,8 @@ def definir_umbrales_contaminacion():
     """
     print(f"\n=== DEFINIENDO UMBRALES DE CONTAMINACIÓN ===")
     
-    umbrales = {
-        'pm25': {
-            'excelente': 0,      # µg/m³
-            'bueno': 12,         # µg/m³
-            'moderado': 35.4,    # µg/m³
-            'malo': 55.4,        # µg/m³
-            'muy_malo': 150.4,   # µg/m³
-            'peligroso': 250.4   # µg/m³
-        },
-        'pm10': {
-            'excelente': 0,      # µg/m³
-            'bueno': 54,         # µg/m³
-            'moderado': 154,     # µg/m³
-            'malo': 254,         # µg/m³
-            'muy_malo': 354,     # µg/m³
-            'peligroso': 424     # µg/m³
-        },
-        'no2': {
-            'excelente': 0,      # ppb
-            'bueno': 53,         # ppb
-            'moderado': 100,     # ppb
-            'malo': 360,         # ppb
-            'muy_malo': 649,     # ppb
-            'peligroso': 1249    # ppb
-        },
-        'o3': {
-            'excelente': 0,      # ppb
-            'bueno': 54,         # ppb
-            'moderado': 70,      # ppb
-            'malo': 85,          # ppb
-            'muy_malo': 105,     # ppb
-            'peligroso': 200     # ppb
-        },
-        'so2': {
-            'excelente': 0,      # ppb
-            'bueno': 35,         # ppb
-            'moderado': 75,      # ppb
-            'malo': 185,         # ppb
-            'muy_malo': 304,     # ppb
-            'peligroso': 604     # ppb
-        },
-        'co': {
-            'excelente': 0,      # ppm
-            'bueno': 4.4,        # ppm
-            'moderado': 9.4,     # ppm
-            'malo': 12.4,        # ppm
-            'muy_malo': 15.4,    # ppm
-            'peligroso': 30.4    # ppm
-        }
-    }
+    # Tabla única de cortes compartida con los clasificadores vectorizados
+    umbrales = get_thresholds()
     
     print(f"✓ Umbrales definidos para {len(umbrales)} contaminantes")
     return umbrales
@@ -110,25 +74,19 @@ def clasificar_calidad_aire(valor, parametro, umbrales):
     """
     Clasificar la calidad del aire según el valor y parámetro
     """
-    if parametro not in umbrales:
-        return 'desconocido'
-    
-    umbral_param = umbrales[parametro]
+    return clasificar_calidad_aire_vectorizado([valor], parametro, umbrales)[0]
+
+def clasificar_calidad_aire_vectorizado(valores, parametro, umbrales):
+    """
+    Clasificar un arreglo completo de valores con la tabla de cortes
     
-    if valor <= umbral_param['excelente']:
-        return 'excelente'
-    elif valor <= umbral_param['bueno']:
-        return 'bueno'
-    elif valor <= umbral_param['moderado']:
-        return 'moderado'
-    elif valor <= umbral_param['malo']:
-        return 'malo'
-    elif valor <= umbral_param['muy_malo']:
-        return 'muy_malo'
-    elif valor <= umbral_param['peligroso']:
-        return 'peligroso'
-    else:
-        return 'peligroso'
+    Returns:
+        pd.Categorical: Calidad de cada valor ('desconocido' si el parámetro
+            no tiene umbrales o el valor falta)
+    """
+    codigos = classify_values(valores, parametro, umbrales)
+    codigos = np.where(codigos < 0, len(QUALITY_LEVELS), codigos)
+    return pd.Categorical.from_codes(codigos, categories=QUALITY_LEVELS + ['desconocido'])
 
 def generar_recomendaciones_salud(calidad, parametro):
     """
@@ -288,8 +246,8 @@ def generar_sistema_alertas(df, umbrales, parametro='pm25', localidad='Indura'):
         return None
     
     # Clasificar calidad del aire
-    df_reciente['calidad'] = df_reciente['valor'].apply(
-        lambda x: clasificar_calidad_aire(x, parametro, umbrales)
+    df_reciente['calidad'] = clasificar_calidad_aire_vectorizado(
+        df_reciente['valor_normalizado'].to_numpy(), parametro, umbrales
     )
     
     # Generar alertas
@@ -333,9 +291,9 @@ def generar_sistema_alertas(df, umbrales, parametro='pm25', localidad='Indura'):
                 'cambio': f"-{((1 - ultima_semana/semana_anterior) * 100):.1f}%"
             })
     
-    # Alerta por valores extremos
+    # Alerta por valores extremos (umbrales en la unidad canónica)
     valor_max = df_reciente['valor'].max()
-    if valor_max > umbrales[parametro]['muy_malo']:
+    if df_reciente['valor_normalizado'].max() > umbrales[parametro]['muy_malo']:
         alertas.append({
             'tipo': 'valor_extremo',
             'nivel': 'danger',
@@ -384,8 +342,8 @@ def crear_dashboard_recomendaciones(df, umbrales, parametro='pm25', localidad='I
     ax1 = axes[0, 0]
     df_filtrado = df_filtrado.sort_values('fecha_desde_utc')
     
-    # Graficar valores
-    ax1.plot(df_filtrado['fecha_desde_utc'], df_filtrado['valor'], 
+    # Graficar valores en la unidad de los umbrales
+    ax1.plot(df_filtrado['fecha_desde_utc'], df_filtrado['valor_normalizado'], 
              alpha=0.7, linewidth=1, label='Valor medido')
     
     # Graficar umbrales
@@ -399,7 +357,7 @@ def crear_dashboard_recomendaciones(df, umbrales, parametro='pm25', localidad='I
                        alpha=0.7, label=f'Umbral {nivel}')
     
     ax1.set_xlabel('Fecha')
-    ax1.set_ylabel(f'{parametro.upper()} ({df_filtrado["unidad"].iloc[0]})')
+    ax1.set_ylabel(f'{parametro.upper()} ({CANONICAL_UNITS.get(parametro, df_filtrado["unidad"].iloc[0])})')
     ax1.set_title('Evolución Temporal con Umbrales de Calidad')
     ax1.legend()
     ax1.grid(True, alpha=0.3)
@@ -407,11 +365,13 @@ def crear_dashboard_recomendaciones(df, umbrales, parametro='pm25', localidad='I
     
     # 2. Distribución de valores por calidad
     ax2 = axes[0, 1]
-    df_filtrado['calidad'] = df_filtrado['valor'].apply(
-        lambda x: clasificar_calidad_aire(x, parametro, umbrales)
+    df_filtrado['calidad'] = clasificar_calidad_aire_vectorizado(
+        df_filtrado['valor_normalizado'].to_numpy(), parametro, umbrales
     )
     
     calidad_counts = df_filtrado['calidad'].value_counts()
+    calidad_counts = calidad_counts[calidad_counts > 0]
+    calidad_counts.index = calidad_counts.index.astype(str)
     colores_calidad = ['green', 'lightgreen', 'yellow', 'orange', 'red', 'darkred']
     
     ax2.bar(calidad_counts.index, calidad_counts.values, 
@@ -471,8 +431,8 @@ def generar_reporte_final(df, umbrales, parametro='pm25', localidad='Indura'):
         return
     
     # Clasificar calidad del aire
-    df_filtrado['calidad'] = df_filtrado['valor'].apply(
-        lambda x: clasificar_calidad_aire(x, parametro, umbrales)
+    df_filtrado['calidad'] = clasificar_calidad_aire_vectorizado(
+        df_filtrado['valor_normalizado'].to_numpy(), parametro, umbrales
     )
     
     # Estadísticas generales
@@ -484,6 +444,7 @@ def generar_reporte_final(df, umbrales, parametro='pm25', localidad='Indura'):
     
     # Distribución de calidad
     distribucion_calidad = df_filtrado['calidad'].value_counts()
+    distribucion_calidad = distribucion_calidad[distribucion_calidad > 0]
     
     # Generar reporte
     reporte = f"""
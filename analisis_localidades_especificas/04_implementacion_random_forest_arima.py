@@ -11,6 +11,8 @@ Autor: Análisis de Datos - Proyecto en Ciencia de Datos
 Fecha: 2025
 """
 
+import os
+import sys
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
@@ -19,6 +21,13 @@ from datetime import datetime, timedelta
 import warnings
 warnings.filterwarnings('ignore')
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+from unit_normalization import normalize_units
+from data_validation import filter_valid, validate_measurements
+from feature_store import build_features
+from online_features import OnlineFeatureBank
+from incremental_refit import REFIT_FRACTION, incremental_refit
+
 # Machine Learning
 from sklearn.ensemble import RandomForestRegressor
 from sklearn.model_selection import train_test_split
@@ -39,6 +48,18 @@ sns.set_palette("husl")
 plt.rcParams['figure.figsize'] = (12, 8)
 plt.rcParams['font.size'] = 10
 
+# Caché compartida de características y especificación del modelo híbrido
+FEATURE_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'feature_cache')
+FEATURES_TEMPORALES = [
+    'year', 'month', 'day', 'hour', 'day_of_week', 'day_of_year',
+    'month_sin', 'month_cos', 'hour_sin', 'hour_cos', 'day_of_week_sin', 'day_of_week_cos',
+    'local_hour', 'is_holiday',
+    'lag_1', 'lag_2', 'lag_3', 'ma_3', 'ma_6', 'diff_1',
+]
+
+# Ventana de datos recientes del reentrenamiento incremental (horas)
+HORAS_RECIENTES_INCREMENTAL = 24 * 7
+
 class ModeloHibridoRFARIMA:
     """
     Clase que implementa el modelo híbrido Random Forest + ARIMA
@@ -58,6 +79,7 @@ class ModeloHibridoRFARIMA:
         self.scaler = StandardScaler()
         self.feature_selector = None
         self.feature_names = None
+        self.feature_spec = None
         self.is_fitted = False
         
     def cargar_datos(self, ruta_csv):
@@ -76,6 +98,15 @@ class ModeloHibridoRFARIMA:
             # Cargar datos
             df = pd.read_csv(ruta_csv)
             
+            # Llevar a unidad canónica y validar antes de modelar
+            if 'valor_normalizado' not in df.columns:
+                df = normalize_units(df, 'parametro_nombre', 'unidad', 'valor',
+                                     'valor_normalizado', 'unidad_codigo')
+            df = validate_measurements(df, 'parametro_nombre', 'valor_normalizado', 'fecha_desde_utc',
+                                       'localidad_nombre', 'sensor_id', 'cobertura_porcentaje',
+                                       'banderas_calidad')
+            df = filter_valid(df, 'banderas_calidad')
+            
             # Convertir fecha_desde_utc a datetime y renombrar
             df['timestamp'] = pd.to_datetime(df['fecha_desde_utc'])
             df = df.sort_values('timestamp').reset_index(drop=True)
@@ -83,6 +114,10 @@ class ModeloHibridoRFARIMA:
             # Filtrar por parámetro objetivo (usar parametro_nombre)
             df_filtrado = df[df['parametro_nombre'] == self.parametro_objetivo].copy()
             
+            # Seleccionar solo columnas necesarias: las de ingesta (valor_normalizado,
+            # unidad_codigo, banderas_calidad) y los metadatos del CSV no son features
+            df_filtrado = df_filtrado[['timestamp', 'parametro_nombre', 'valor', 'localidad_nombre']]
+            
             print(f"✅ Datos cargados exitosamente")
             print(f"   - Total de registros: {len(df_filtrado):,}")
             print(f"   - Parámetro objetivo: {self.parametro_objetivo}")
@@ -106,41 +141,22 @@ class ModeloHibridoRFARIMA:
         """
         print("🔧 Creando features temporales...")
         
-        df_features = df.copy()
-        
-        # Features básicos de tiempo
-        df_features['year'] = df_features['timestamp'].dt.year
-        df_features['month'] = df_features['timestamp'].dt.month
-        df_features['day'] = df_features['timestamp'].dt.day
-        df_features['hour'] = df_features['timestamp'].dt.hour
-        df_features['day_of_week'] = df_features['timestamp'].dt.dayofweek
-        df_features['day_of_year'] = df_features['timestamp'].dt.dayofyear
-        
-        # Features cíclicos (sin y cos para estacionalidad)
-        df_features['month_sin'] = np.sin(2 * np.pi * df_features['month'] / 12)
-        df_features['month_cos'] = np.cos(2 * np.pi * df_features['month'] / 12)
-        df_features['hour_sin'] = np.sin(2 * np.pi * df_features['hour'] / 24)
-        df_features['hour_cos'] = np.cos(2 * np.pi * df_features['hour'] / 24)
-        df_features['day_of_week_sin'] = np.sin(2 * np.pi * df_features['day_of_week'] / 7)
-        df_features['day_of_week_cos'] = np.cos(2 * np.pi * df_features['day_of_week'] / 7)
-        
-        # Lags temporales (solo los más importantes para evitar muchos NaN)
-        for lag in [1, 2, 3]:
-            df_features[f'lag_{lag}'] = df_features['valor'].shift(lag)
-        
-        # Promedios móviles (ventanas más pequeñas)
-        for window in [3, 6]:
-            df_features[f'ma_{window}'] = df_features['valor'].rolling(window=window).mean()
-        
-        # Diferencias temporales (solo primera diferencia)
-        df_features['diff_1'] = df_features['valor'].diff()
-        
-        # Features de localidad (one-hot encoding) - solo si no hay valores nulos
-        if 'localidad_nombre' in df_features.columns and df_features['localidad_nombre'].notna().all():
-            df_features = pd.get_dummies(df_features, columns=['localidad_nombre'], prefix='loc')
+        # Calendario, cíclicos, lags, promedios móviles y diferencias desde el almacén compartido
+        spec = list(FEATURES_TEMPORALES)
+        encoded = 'localidad_nombre' in df.columns and df['localidad_nombre'].notna().all()
+        # Features de localidad: one-hot si no hay valores nulos, si no un código numérico
+        spec.append('onehot:loc' if encoded else 'location_code')
+        self.feature_spec = spec
+        # Lags, promedios y diferencias por localidad: no cruzan de una estación a otra,
+        # y los lags y diferencias se miden en horas (t - k horas)
+        features = build_features(df, spec, 'timestamp', 'valor', 'localidad_nombre',
+                                  series_col='localidad_nombre', lag_mode='hours',
+                                  directory=FEATURE_CACHE_DIR)
+        if encoded:
+            df_features = pd.concat([df.drop(columns=['localidad_nombre']), features], axis=1)
         else:
-            # Si hay valores nulos, crear feature binaria simple
-            df_features['localidad_encoded'] = df_features['localidad_nombre'].astype('category').cat.codes
+            df_features = pd.concat([df, features.rename(columns={'location_code': 'localidad_encoded'})],
+                                    axis=1)
         
         print(f"✅ Features temporales creados: {df_features.shape[1]} columnas")
         
@@ -185,6 +201,29 @@ class ModeloHibridoRFARIMA:
         
         return X_selected, y
     
+    def crear_estado_en_linea(self, df):
+        """
+        Crea el estado de features en línea para pronosticar la próxima hora
+        
+        Cada localidad mantiene sus lags y promedios móviles en buffers
+        circulares; el vector sale en el orden de self.feature_names.
+        
+        Args:
+            df (pd.DataFrame): Historial con timestamp, valor y localidad_nombre
+            
+        Returns:
+            OnlineFeatureBank: Estados por localidad, listos para update/forecast
+        """
+        if self.feature_spec is None or self.feature_names is None:
+            print("❌ Primero se deben crear y seleccionar los features")
+            return None
+        
+        columnas = ['location_code' if col == 'localidad_encoded' else col for col in self.feature_names]
+        localidades = df['localidad_nombre'].dropna().unique()
+        banco = OnlineFeatureBank(self.feature_spec, columnas, localidades)
+        banco.warm_start(df, 'timestamp', 'valor', 'localidad_nombre', parameter=self.parametro_objetivo)
+        return banco
+    
     def dividir_datos_temporales(self, X, y, train_ratio=0.6, val_ratio=0.2):
         """
         Divide los datos temporalmente (no aleatoriamente)
@@ -260,6 +299,47 @@ class ModeloHibridoRFARIMA:
         
         return self.rf_model
     
+    def actualizar_random_forest(self, df_features, horas_recientes=HORAS_RECIENTES_INCREMENTAL,
+                                 fraccion=REFIT_FRACTION):
+        """
+        Reentrenamiento incremental del Random Forest con datos recientes
+        
+        Agrega árboles entrenados solo con las últimas horas (warm start) y
+        retira los más antiguos, en lugar de reentrenar con toda la historia.
+        
+        Args:
+            df_features (pd.DataFrame): Features de los datos nuevos (ver
+                crear_features_temporales)
+            horas_recientes (int): Horas recientes con que se entrenan los árboles nuevos
+            fraccion (float): Fracción de árboles que se renueva
+            
+        Returns:
+            RandomForestRegressor: Modelo actualizado (None si no estaba entrenado)
+        """
+        if self.rf_model is None or self.feature_selector is None:
+            print("❌ Primero se debe entrenar el Random Forest")
+            return None
+        
+        print("🌲 Actualizando Random Forest con datos recientes...")
+        
+        df_clean = df_features.dropna(subset=['valor'])
+        inicio = df_clean['timestamp'].max() - pd.Timedelta(hours=horas_recientes)
+        recientes = df_clean[df_clean['timestamp'] > inicio]
+        
+        # Mismas columnas que vio el selector (las localidades ausentes quedan en 0)
+        X = recientes.reindex(columns=self.feature_selector.feature_names_in_, fill_value=0).dropna()
+        y = recientes.loc[X.index, 'valor']
+        if len(X) == 0:
+            print("⚠ No hay datos recientes completos para actualizar")
+            return self.rf_model
+        
+        incremental_refit(self.rf_model, self.feature_selector.transform(X), y, fraccion)
+        
+        print(f"✅ Random Forest actualizado con {len(X):,} muestras recientes")
+        print(f"   - Árboles: {len(self.rf_model.estimators_)}")
+        
+        return self.rf_model
+    
     def entrenar_arima(self, y_train):
         """
         Entrena el modelo ARIMA
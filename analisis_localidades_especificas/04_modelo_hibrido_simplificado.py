@@ -8,6 +8,8 @@ Autor: Análisis de Datos - Proyecto en Ciencia de Datos
 Fecha: 2025
 """
 
+import os
+import sys
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
@@ -16,6 +18,11 @@ from datetime import datetime
 import warnings
 warnings.filterwarnings('ignore')
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+from unit_normalization import normalize_units
+from data_validation import filter_valid, validate_measurements
+from feature_store import build_features
+
 # Machine Learning
 from sklearn.ensemble import RandomForestRegressor
 from sklearn.metrics import mean_squared_error, mean_absolute_error, r2_score
@@ -28,6 +35,11 @@ plt.style.use('default')
 sns.set_palette("husl")
 plt.rcParams['figure.figsize'] = (12, 8)
 
+# Caché compartida de características y especificación del modelo simplificado
+FEATURE_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'feature_cache')
+FEATURES_BASICOS = ['hour', 'day', 'month', 'hour_sin', 'hour_cos', 'month_sin', 'month_cos',
+                    'lag_1', 'lag_2', 'ma_3', 'location_code']
+
 class ModeloHibridoSimplificado:
     """
     Clase simplificada del modelo híbrido Random Forest + ARIMA
@@ -47,6 +59,15 @@ class ModeloHibridoSimplificado:
             # Cargar datos
             df = pd.read_csv(ruta_csv)
             
+            # Llevar a unidad canónica y validar antes de modelar
+            if 'valor_normalizado' not in df.columns:
+                df = normalize_units(df, 'parametro_nombre', 'unidad', 'valor',
+                                     'valor_normalizado', 'unidad_codigo')
+            df = validate_measurements(df, 'parametro_nombre', 'valor_normalizado', 'fecha_desde_utc',
+                                       'localidad_nombre', 'sensor_id', 'cobertura_porcentaje',
+                                       'banderas_calidad')
+            df = filter_valid(df, 'banderas_calidad')
+            
             # Filtrar por parámetro objetivo
             df_filtrado = df[df['parametro_nombre'] == self.parametro_objetivo].copy()
             
@@ -72,28 +93,12 @@ class ModeloHibridoSimplificado:
         """Crea features básicos temporales"""
         print("🔧 Creando features básicos...")
         
-        df_features = df.copy()
-        
-        # Features de tiempo básicos
-        df_features['hour'] = df_features['timestamp'].dt.hour
-        df_features['day'] = df_features['timestamp'].dt.day
-        df_features['month'] = df_features['timestamp'].dt.month
-        
-        # Features cíclicos
-        df_features['hour_sin'] = np.sin(2 * np.pi * df_features['hour'] / 24)
-        df_features['hour_cos'] = np.cos(2 * np.pi * df_features['hour'] / 24)
-        df_features['month_sin'] = np.sin(2 * np.pi * df_features['month'] / 12)
-        df_features['month_cos'] = np.cos(2 * np.pi * df_features['month'] / 12)
-        
-        # Lags simples (solo 1 y 2)
-        df_features['lag_1'] = df_features['valor'].shift(1)
-        df_features['lag_2'] = df_features['valor'].shift(2)
-        
-        # Promedio móvil simple
-        df_features['ma_3'] = df_features['valor'].rolling(window=3).mean()
-        
-        # Feature de localidad (código numérico)
-        df_features['localidad_code'] = df_features['localidad_nombre'].astype('category').cat.codes
+        # Features de tiempo, cíclicos, lags, promedio móvil y código de localidad;
+        # los lags (en horas) y el promedio se calculan por localidad
+        features = build_features(df, FEATURES_BASICOS, 'timestamp', 'valor', 'localidad_nombre',
+                                  series_col='localidad_nombre', lag_mode='hours',
+                                  directory=FEATURE_CACHE_DIR)
+        df_features = pd.concat([df, features.rename(columns={'location_code': 'localidad_code'})], axis=1)
         
         # Eliminar NaN
         df_features = df_features.dropna()
@@ -14,6 +14,14 @@ import pandas as pd
 from datetime import datetime, timedelta
 import time
 import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+from unit_normalization import normalize_units
+from dataset_profile import profile_dataset
+from measurement_store import sync_store
+from data_utils import write_measurement_store
+from star_schema import build_star_schema
 
 def buscar_localidades_especificas(client, localidades_buscar):
     """
@@ -259,6 +267,10 @@ def convertir_a_dataframe(mediciones):
     
     df = pd.DataFrame(datos_lista)
     
+    # Normalizar unidades en la ingesta para guardarlas junto al valor original
+    df = normalize_units(df, 'parametro_nombre', 'unidad', 'valor',
+                         'valor_normalizado', 'unidad_codigo')
+    
     # Mostrar resumen del DataFrame
     print("Resumen del DataFrame:")
     print(f"  - Total de mediciones: {len(df)}")
@@ -291,6 +303,18 @@ def guardar_datos_completos(df, prefijo_archivo="localidades_especificas"):
     print(f"  - Tamaño del archivo: {len(df)} mediciones")
     print(f"  - Columnas: {', '.join(df.columns)}")
     
+    # Mantener sincronizado el almacén SQLite indexado para consultas ad hoc
+    sync_store(df, 'data/mediciones.sqlite', schema='localidades')
+    
+    # Almacén Parquet ordenado por grupos de filas para consultas con filtros empujados
+    try:
+        write_measurement_store(df, f"data/{prefijo_archivo}_{timestamp}.parquet", schema='localidades')
+    except Exception as e:
+        print(f"✗ Error al escribir el almacén Parquet: {e}")
+    
+    # Copia normalizada: hechos angostos + dimensiones de ubicaciones, parámetros y sensores
+    build_star_schema(df, 'localidades').save(f"data/{prefijo_archivo}_{timestamp}_estrella")
+    
     return nombre_archivo
 
 def mostrar_estadisticas_detalladas(df):
@@ -300,12 +324,16 @@ def mostrar_estadisticas_detalladas(df):
     if df is None or df.empty:
         return
     
+    # Perfil calculado una vez y memorizado para este dataset
+    profile = profile_dataset(df, 'parametro_nombre', 'localidad_buscada', 'fecha_desde_utc',
+                              value_col=None, category_cols=('ciudad', 'sensor_id', 'localidad_id'))
+    
     print("\n=== ESTADÍSTICAS DETALLADAS ===")
     
     # Estadísticas por localidad buscada
     if 'localidad_buscada' in df.columns:
         print("\n📊 Mediciones por localidad buscada:")
-        localidad_counts = df['localidad_buscada'].value_counts()
+        localidad_counts = profile.counts['localidad_buscada']
         for localidad, count in localidad_counts.items():
             if pd.notna(localidad):
                 print(f"  - {localidad}: {count} mediciones")
@@ -313,15 +341,15 @@ def mostrar_estadisticas_detalladas(df):
     # Estadísticas por parámetro
     if 'parametro_nombre' in df.columns:
         print("\n📊 Mediciones por parámetro:")
-        parametro_counts = df['parametro_nombre'].value_counts()
+        parametro_counts = profile.counts['parametro_nombre']
         for parametro, count in parametro_counts.items():
             if pd.notna(parametro):
                 print(f"  - {parametro}: {count} mediciones")
     
     # Estadísticas por ciudad
-    if 'ciudad' in df.columns and df['ciudad'].notna().any():
+    if profile.nunique('ciudad') > 0:
         print("\n📊 Mediciones por ciudad:")
-        ciudad_counts = df['ciudad'].value_counts()
+        ciudad_counts = profile.counts['ciudad']
         for ciudad, count in ciudad_counts.items():
             if pd.notna(ciudad):
                 print(f"  - {ciudad}: {count} mediciones")
@@ -329,16 +357,16 @@ def mostrar_estadisticas_detalladas(df):
     # Fechas
     if 'fecha_desde_utc' in df.columns:
         print(f"\n📅 Rango temporal:")
-        print(f"  - Fecha más reciente: {df['fecha_desde_utc'].max()}")
-        print(f"  - Fecha más antigua: {df['fecha_desde_utc'].min()}")
+        print(f"  - Fecha más reciente: {profile.time_max}")
+        print(f"  - Fecha más antigua: {profile.time_min}")
     
     # Estadísticas por sensor
     if 'sensor_id' in df.columns:
-        print(f"\n📊 Sensores únicos: {df['sensor_id'].nunique()}")
+        print(f"\n📊 Sensores únicos: {profile.nunique('sensor_id')}")
     
     # Estadísticas por localidad
     if 'localidad_id' in df.columns:
-        print(f"📊 Localidades únicas: {df['localidad_id'].nunique()}")
+        print(f"📊 Localidades únicas: {profile.nunique('localidad_id')}")
 
 def main():
     """
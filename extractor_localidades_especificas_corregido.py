@@ -14,6 +14,10 @@ import pandas as pd
 from datetime import datetime, timedelta
 import time
 import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+from dataset_profile import profile_dataset
 
 def buscar_localidades_especificas(client, localidades_buscar):
     """
@@ -289,40 +293,44 @@ def mostrar_estadisticas_detalladas(df):
     if df is None or df.empty:
         return
     
+    # Perfil calculado una vez y memorizado para este dataset
+    profile = profile_dataset(df, 'parametro_nombre', 'localidad_buscada', 'fecha_desde_utc',
+                              value_col=None, category_cols=('ciudad', 'sensor_id', 'localidad_id'))
+    
     print("\n=== ESTADÍSTICAS DETALLADAS ===")
     
     # Estadísticas por localidad buscada
     print("\n📊 Mediciones por localidad buscada:")
-    localidad_counts = df['localidad_buscada'].value_counts()
+    localidad_counts = profile.counts['localidad_buscada']
     for localidad, count in localidad_counts.items():
         print(f"  - {localidad}: {count} mediciones")
     
     # Estadísticas por parámetro
     print("\n📊 Mediciones por parámetro:")
-    parametro_counts = df['parametro_nombre'].value_counts()
+    parametro_counts = profile.counts['parametro_nombre']
     for parametro, count in parametro_counts.items():
         print(f"  - {parametro}: {count} mediciones")
     
     # Estadísticas por ciudad
-    if 'ciudad' in df.columns and df['ciudad'].notna().any():
+    if profile.nunique('ciudad') > 0:
         print("\n📊 Mediciones por ciudad:")
-        ciudad_counts = df['ciudad'].value_counts()
+        ciudad_counts = profile.counts['ciudad']
         for ciudad, count in ciudad_counts.items():
             if pd.notna(ciudad):
                 print(f"  - {ciudad}: {count} mediciones")
     
     # Fechas
     print(f"\n📅 Rango temporal:")
-    print(f"  - Fecha más reciente: {df['fecha_desde_utc'].max()}")
-    print(f"  - Fecha más antigua: {df['fecha_desde_utc'].min()}")
+    print(f"  - Fecha más reciente: {profile.time_max}")
+    print(f"  - Fecha más antigua: {profile.time_min}")
     
     # Estadísticas por sensor
     if 'sensor_id' in df.columns:
-        print(f"\n📊 Sensores únicos: {df['sensor_id'].nunique()}")
+        print(f"\n📊 Sensores únicos: {profile.nunique('sensor_id')}")
     
     # Estadísticas por localidad
     if 'localidad_id' in df.columns:
-        print(f"📊 Localidades únicas: {df['localidad_id'].nunique()}")
+        print(f"📊 Localidades únicas: {profile.nunique('localidad_id')}")
 
 def main():
     """
@@ -4,6 +4,7 @@ Análisis Principal de Calidad del Aire - Santiago de Chile
 Script principal que ejecuta todo el análisis de ciencia de datos
 """
 
+import io
 import os
 import sys
 import pandas as pd
@@ -22,11 +23,24 @@ from data_utils import (
     load_air_quality_data, convert_datetime_columns, create_temporal_features,
     get_parameter_statistics, detect_outliers, create_pivot_table,
     calculate_correlations, get_air_quality_index, save_processed_data,
-    print_data_summary
+    print_data_summary, create_hourly_panel
 )
+from cross_correlation import compute_lag_matrices
+from aqi_subindex import compute_aqi_panel
+from unit_normalization import normalize_units
+from output_writer import OutputWriter
+from dataset_profile import profile_dataset
+from data_validation import describe_flags, filter_valid, validate_measurements
+from global_model import GLOBAL_MODEL_PATH, GlobalSeriesModel
 
 from models.air_quality_predictor import AirQualityPredictor
 
+# Entrenar los modelos de todos los parámetros en paralelo (pool de procesos)
+PARALLEL_TRAINING = True
+
+# Entrenar además un modelo global para todas las series (ubicación, parámetro)
+GLOBAL_MODEL = True
+
 def main():
     """Función principal del análisis"""
     
@@ -36,6 +50,9 @@ def main():
     print("=" * 80)
     print(f"Fecha de ejecución: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
     
+    # Escritor en segundo plano: el cálculo continúa mientras se escribe a disco
+    writer = OutputWriter()
+    
     # 1. CARGAR Y EXPLORAR DATOS
     print("1. CARGA Y EXPLORACIÓN DE DATOS")
     print("-" * 50)
@@ -51,9 +68,19 @@ def main():
     # Convertir fechas
     df = convert_datetime_columns(df)
     
+    # Normalizar unidades una sola vez (valor canónico y código de unidad)
+    df = normalize_units(df)
+    
+    # Validar en la ingesta: banderas de calidad empaquetadas en bits
+    df = validate_measurements(df, value_col='value_normalized')
+    print(describe_flags(df['quality_flags']).to_string())
+    
     # Crear características temporales
     df = create_temporal_features(df)
     
+    # Solo mediciones sin banderas de rechazo llegan a correlaciones, AQI y modelos
+    df_valid = filter_valid(df)
+    
     # Mostrar resumen de datos
     print_data_summary(df)
     
@@ -85,7 +112,7 @@ def main():
     
     # Crear tabla pivot para análisis
     pivot_df = create_pivot_table(
-        df, 
+        df_valid, 
         index_cols=['location_name', 'date_from_utc'],
         columns_col='parameter_name',
         values_col='value'
@@ -93,22 +120,40 @@ def main():
     
     if pivot_df is not None:
         # Calcular correlaciones
-        correlation_matrix = calculate_correlations(pivot_df, exclude_cols=['year', 'month', 'day', 'hour', 'day_of_week'])
+        correlation_matrix, overlap_counts = calculate_correlations(
+            pivot_df, exclude_cols=['year', 'month', 'day', 'hour', 'day_of_week'],
+            return_counts=True
+        )
         
         if correlation_matrix is not None:
             print("\nCorrelaciones entre parámetros:")
             print(correlation_matrix.round(3))
+            print("\nObservaciones compartidas por par:")
+            print(overlap_counts)
             
-            # Guardar matriz de correlaciones
-            correlation_matrix.to_csv('data/processed/matriz_correlaciones.csv')
-            print("✓ Matriz de correlaciones guardada")
+            # Guardar matriz de correlaciones y conteos de solapamiento
+            writer.write_frame(correlation_matrix, 'data/processed/matriz_correlaciones.csv', index=True)
+            writer.write_frame(overlap_counts, 'data/processed/matriz_correlaciones_conteos.csv', index=True)
+            print("✓ Matriz de correlaciones y conteos enviados a escritura")
+    
+    # Correlación cruzada con desfases entre estaciones y contaminantes
+    hourly_panel = create_hourly_panel(df_valid, value_col='value_normalized')
+    peak_lags, peak_corr = compute_lag_matrices(hourly_panel, max_lag=168)
+    writer.write_frame(peak_lags, 'data/processed/desfases_pico.csv', index=True)
+    writer.write_frame(peak_corr, 'data/processed/correlacion_cruzada_pico.csv', index=True)
+    print("✓ Desfases y correlaciones pico enviados a escritura")
+    
+    # Índice AQI horario por ubicación (NowCast para material particulado)
+    aqi_subindices, aqi_by_location = compute_aqi_panel(hourly_panel)
+    writer.write_frame(aqi_by_location, 'data/processed/indice_aqi_horario.csv.gz', index=True)
+    print("✓ Índice AQI horario enviado a escritura")
     
     # 4. ANÁLISIS TEMPORAL
     print("\n4. ANÁLISIS TEMPORAL")
     print("-" * 50)
     
     # Crear visualizaciones temporales
-    create_temporal_visualizations(df)
+    create_temporal_visualizations(df, writer)
     
     # 5. MODELO DE PREDICCIÓN
     print("\n5. MODELO DE PREDICCIÓN")
@@ -120,27 +165,50 @@ def main():
     # Parámetros objetivo para predicción
     target_parameters = ['pm25', 'pm10', 'o3', 'no2']
     
+    # Solo mediciones sin banderas de rechazo llegan a los modelos
+    df_model = df_valid
+    
+    # Preparar características de todos los parámetros
+    datasets = {}
     for param in target_parameters:
-        print(f"\n--- Entrenando modelo para {param.upper()} ---")
-        
-        # Preparar características
-        X, y = predictor.prepare_features(df, param)
-        
+        print(f"\n--- Preparando características para {param.upper()} ---")
+        X, y = predictor.prepare_features(df_model, param, value_col='value_normalized')
         if X is not None and y is not None:
-            # Entrenar modelos
-            best_model, results = predictor.train_models(X, y, param)
+            datasets[param] = (X, y)
+    
+    # Entrenar modelos: todos los (parámetro, modelo) en un pool de procesos,
+    # o uno tras otro si el entrenamiento paralelo está desactivado
+    if PARALLEL_TRAINING:
+        trained = predictor.train_models_parallel(datasets)
+    else:
+        trained = {param: predictor.train_models(X, y, param) for param, (X, y) in datasets.items()}
+    
+    for param, (best_model, results) in trained.items():
+        if best_model is not None:
+            # Guardar modelo
+            model_path = f'models/modelo_{param}.pkl'
+            predictor.save_model(best_model, param, model_path)
             
-            if best_model is not None:
-                # Guardar modelo
-                model_path = f'models/modelo_{param}.pkl'
-                predictor.save_model(best_model, param, model_path)
-                
-                # Mostrar importancia de características
-                if param in predictor.feature_importance:
-                    print(f"\nImportancia de características para {param.upper()}:")
-                    top_features = predictor.feature_importance[param].head(10)
-                    for _, row in top_features.iterrows():
-                        print(f"  - {row['feature']}: {row['importance']:.3f}")
+            # Mostrar importancia de características
+            if param in predictor.feature_importance:
+                print(f"\nImportancia de características para {param.upper()}:")
+                top_features = predictor.feature_importance[param].head(10)
+                for _, row in top_features.iterrows():
+                    print(f"  - {row['feature']}: {row['importance']:.3f}")
+    
+    # Modelo global: un solo ajuste y un solo archivo para todas las series, con
+    # la serie, la estación y el parámetro como características
+    if GLOBAL_MODEL:
+        print("\n--- Entrenando modelo global para todas las series ---")
+        global_data = df_model[df_model['parameter_name'].isin(target_parameters)]
+        cutoff = global_data['date_from_utc'].quantile(0.8)
+        train_mask = (global_data['date_from_utc'] < cutoff).to_numpy()
+        
+        global_model = GlobalSeriesModel(value_col='value_normalized')
+        global_model.fit(global_data[train_mask])
+        print(f"Evaluación desde {cutoff}:")
+        global_model.evaluate(global_data, ~train_mask)
+        global_model.save(GLOBAL_MODEL_PATH)
     
     # 6. PREDICCIONES FUTURAS
     print("\n6. PREDICCIONES FUTURAS")
@@ -173,8 +241,8 @@ def main():
                         if predictions is not None:
                             # Guardar predicciones
                             pred_path = f'data/processed/predicciones_{param}_{location}.csv'
-                            predictions.to_csv(pred_path, index=False)
-                            print(f"  ✓ Predicciones guardadas en: {pred_path}")
+                            writer.write_frame(predictions, pred_path)
+                            print(f"  ✓ Predicciones enviadas a escritura: {pred_path}")
                             
                             # Generar recomendaciones
                             for _, row in predictions.iterrows():
@@ -193,8 +261,9 @@ def main():
     # Guardar dataset con características temporales
     save_processed_data(
         df, 
-        'data/processed/datos_completos_procesados.csv',
-        'Dataset completo con características temporales y análisis'
+        'data/processed/datos_completos_procesados.csv.gz',
+        'Dataset completo con características temporales y análisis',
+        writer=writer
     )
     
     # Guardar dataset pivot
@@ -202,14 +271,18 @@ def main():
         save_processed_data(
             pivot_df,
             'data/processed/datos_pivot_completo.csv',
-            'Dataset pivot para análisis de correlaciones'
+            'Dataset pivot para análisis de correlaciones',
+            writer=writer
         )
     
     # 8. GENERAR REPORTE FINAL
     print("\n8. GENERANDO REPORTE FINAL")
     print("-" * 50)
     
-    generate_final_report(df, target_parameters)
+    generate_final_report(df, target_parameters, writer)
+    
+    # Barrera final: esperar a que terminen todas las escrituras pendientes
+    writer.close()
     
     print("\n" + "=" * 80)
     print("¡ANÁLISIS COMPLETADO EXITOSAMENTE!")
@@ -220,8 +293,8 @@ def main():
     print("  - Reportes: reports/")
     print("  - Visualizaciones: reports/")
 
-def create_temporal_visualizations(df):
-    """Crear visualizaciones temporales"""
+def create_temporal_visualizations(df, writer):
+    """Crear visualizaciones temporales (las figuras se escriben vía writer)"""
     
     print("Creando visualizaciones temporales...")
     
@@ -263,7 +336,7 @@ def create_temporal_visualizations(df):
         ax.grid(True, alpha=0.3)
     
     plt.tight_layout()
-    plt.savefig('reports/evolucion_temporal.png', dpi=300, bbox_inches='tight')
+    writer.save_figure(fig, 'reports/evolucion_temporal.png', dpi=300, bbox_inches='tight')
     plt.show()
     
     # 2. Patrones estacionales
@@ -306,24 +379,28 @@ def create_temporal_visualizations(df):
         ax.grid(True, alpha=0.3)
     
     plt.tight_layout()
-    plt.savefig('reports/patrones_estacionales.png', dpi=300, bbox_inches='tight')
+    writer.save_figure(fig, 'reports/patrones_estacionales.png', dpi=300, bbox_inches='tight')
     plt.show()
     
     print("✓ Visualizaciones temporales creadas y guardadas")
 
-def generate_final_report(df, target_parameters):
-    """Generar reporte final del análisis"""
+def generate_final_report(df, target_parameters, writer):
+    """Generar reporte final del análisis (la escritura va por el OutputWriter)"""
     
     report_path = 'reports/reporte_final_analisis.txt'
     
-    with open(report_path, 'w', encoding='utf-8') as f:
+    # Perfil memorizado: el mismo que usó print_data_summary si el dataset no cambió
+    profile = profile_dataset(df)
+    parameters = profile.uniques['parameter_name']
+    
+    with io.StringIO() as f:
         f.write("REPORTE FINAL DEL ANÁLISIS DE CALIDAD DEL AIRE\n")
         f.write("=" * 60 + "\n\n")
         f.write(f"Fecha de generación: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-        f.write(f"Total de mediciones analizadas: {len(df):,}\n")
-        f.write(f"Parámetros disponibles: {', '.join(df['parameter_name'].unique())}\n")
-        f.write(f"Ubicaciones monitoreadas: {', '.join(df['location_name'].unique())}\n")
-        f.write(f"Rango temporal: {df['date_from_utc'].min()} a {df['date_from_utc'].max()}\n\n")
+        f.write(f"Total de mediciones analizadas: {profile.n_rows:,}\n")
+        f.write(f"Parámetros disponibles: {', '.join(parameters)}\n")
+        f.write(f"Ubicaciones monitoreadas: {', '.join(profile.uniques['location_name'])}\n")
+        f.write(f"Rango temporal: {profile.time_min} a {profile.time_max}\n\n")
         
         f.write("RESUMEN EJECUTIVO:\n")
         f.write("-" * 30 + "\n")
@@ -341,11 +418,11 @@ def generate_final_report(df, target_parameters):
         f.write("PARÁMETROS ANALIZADOS:\n")
         f.write("-" * 30 + "\n")
         for param in target_parameters:
-            if param in df['parameter_name'].unique():
-                stats = get_parameter_statistics(df, param)
-                if stats:
+            if param in parameters:
+                stats = profile.parameter_stats.loc[param]
+                if stats['count'] > 0:
                     f.write(f"{param.upper()}:\n")
-                    f.write(f"  - Mediciones: {stats['count']:,}\n")
+                    f.write(f"  - Mediciones: {int(stats['count']):,}\n")
                     f.write(f"  - Valor promedio: {stats['mean']:.3f}\n")
                     f.write(f"  - Variabilidad: {stats['std']/stats['mean']*100:.1f}%\n\n")
         
@@ -364,8 +441,8 @@ def generate_final_report(df, target_parameters):
         f.write("3. Análisis predictivo para planificación urbana\n")
         f.write("4. Sistema de monitoreo para instituciones educativas\n")
         f.write("5. Herramientas para políticas públicas de calidad del aire\n")
-    
-    print(f"✓ Reporte final generado: {report_path}")
+        
+        writer.write_text(f.getvalue(), report_path, description='Reporte final del análisis')
 
 if __name__ == "__main__":
     main()
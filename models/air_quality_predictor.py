@@ -3,9 +3,11 @@
 Modelo de predicción para la calidad del aire
 """
 
+import os
+import sys
 import pandas as pd
 import numpy as np
-from sklearn.model_selection import train_test_split, cross_val_score, GridSearchCV
+from sklearn.model_selection import train_test_split, cross_val_score
 from sklearn.ensemble import RandomForestRegressor, GradientBoostingRegressor
 from sklearn.linear_model import LinearRegression, Ridge, Lasso
 from sklearn.svm import SVR
@@ -14,8 +16,105 @@ from sklearn.metrics import mean_squared_error, r2_score, mean_absolute_error
 from sklearn.pipeline import Pipeline
 import joblib
 import warnings
+from concurrent.futures import ProcessPoolExecutor, as_completed
 warnings.filterwarnings('ignore')
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+from air_quality_index import breakpoint_bins
+from feature_store import build_features
+from calendar_features import calendar_features
+from model_matrix import LINEAR_FAMILY, TREE_FAMILY, ModelMatrix
+from shared_matrices import SharedMatrixArena, attach_matrix, close_segments
+from backtesting import WalkForwardBacktest
+from incremental_refit import REFIT_FRACTION, incremental_refit
+from hyperparameter_search import (DEFAULT_MAX_FITS, SEARCH_PRIORS_PATH, SuccessiveHalvingSearch,
+                                   load_priors, save_prior)
+
+# Recomendaciones por nivel: (recomendación, nivel de actividad)
+RECOMMENDATION_LEVELS = [
+    ("Excelente calidad del aire. Actividades al aire libre sin restricciones.",
+     "Sin restricciones"),
+    ("Calidad del aire moderada. Personas sensibles deben considerar reducir actividades al aire libre.",
+     "Moderadas restricciones"),
+    ("No saludable para grupos sensibles. Evitar actividades al aire libre prolongadas.",
+     "Restricciones significativas"),
+    ("Calidad del aire no saludable. Evitar TODAS las actividades al aire libre.",
+     "Restricciones severas"),
+]
+
+# Intervalo de la tabla de cortes -> índice en RECOMMENDATION_LEVELS
+RECOMMENDATION_BIN_TO_LEVEL = np.array([0, 0, 1, 2, 3, 3, 3], dtype=np.int8)
+
+# Características de calendario del modelo (ver calendar_features)
+CALENDAR_SPEC = [
+    'year', 'month', 'day', 'hour', 'day_of_week',
+    'month_sin', 'month_cos', 'hour_sin', 'hour_cos', 'day_sin', 'day_cos',
+]
+
+# Modelos que reciben la matriz densa con el código de ubicación; el resto
+# usa la variante CSR con la ubicación en one-hot
+TREE_MODELS = ('RandomForest', 'GradientBoosting')
+
+# Ventana de datos recientes del reentrenamiento incremental (horas)
+INCREMENTAL_RECENT_HOURS = 24 * 7
+
+def model_catalog():
+    """Modelos que se entrenan para cada parámetro (instancias nuevas)"""
+    return {
+        'RandomForest': RandomForestRegressor(n_estimators=100, random_state=42),
+        'GradientBoosting': GradientBoostingRegressor(random_state=42),
+        'LinearRegression': LinearRegression(),
+        'Ridge': Ridge(alpha=1.0),
+        'Lasso': Lasso(alpha=0.1),
+        'SVR': SVR(kernel='rbf')
+    }
+
+def model_family(name):
+    """Variante de matriz que usa un modelo del catálogo"""
+    return TREE_FAMILY if name in TREE_MODELS else LINEAR_FAMILY
+
+def fit_and_score(model, X_train, y_train, X_test, y_test):
+    """
+    Entrenar un modelo y medirlo sobre la partición de prueba
+    
+    Returns:
+        dict: Modelo entrenado, métricas (mse, rmse, mae, r2) y predicciones
+    """
+    model.fit(X_train, y_train)
+    y_pred = model.predict(X_test)
+    mse = mean_squared_error(y_test, y_pred)
+    return {
+        'model': model,
+        'mse': mse,
+        'rmse': np.sqrt(mse),
+        'mae': mean_absolute_error(y_test, y_pred),
+        'r2': r2_score(y_test, y_pred),
+        'y_pred': y_pred
+    }
+
+def _train_job(target_parameter, name, descriptors):
+    """
+    Trabajador del entrenamiento paralelo: entrena un modelo del catálogo
+    sobre las particiones publicadas en memoria compartida
+    
+    Returns:
+        tuple: (parámetro, modelo, resultado o None, error o None)
+    """
+    segments = []
+    try:
+        data = {}
+        for key, descriptor in descriptors.items():
+            data[key], opened = attach_matrix(descriptor)
+            segments += opened
+        result = fit_and_score(model_catalog()[name], data['X_train'], data['y_train'],
+                               data['X_test'], data['y_test'])
+        return target_parameter, name, result, None
+    except Exception as e:
+        return target_parameter, name, None, str(e)
+    finally:
+        data = None
+        close_segments(segments)
+
 class AirQualityPredictor:
     """
     Clase para predecir parámetros de calidad del aire
@@ -26,51 +125,37 @@ class AirQualityPredictor:
         self.scalers = {}
         self.feature_importance = {}
         self.best_params = {}
+        self.feature_layouts = {}
+        self.feature_times = {}
         
-    def prepare_features(self, df, target_parameter):
+    def prepare_features(self, df, target_parameter, value_col='value'):
         """
         Preparar características para el modelo
         
         Args:
             df (pd.DataFrame): DataFrame con los datos
             target_parameter (str): Parámetro objetivo a predecir
+            value_col (str): Columna objetivo (p. ej. 'value_normalized'
+                para trabajar en la unidad canónica)
             
         Returns:
-            tuple: (X, y) características y objetivo
+            tuple: (X, y) con X como ModelMatrix (float32 compartida entre
+                modelos) e y como arreglo float
         """
         # Filtrar datos del parámetro objetivo
-        param_data = df[df['parameter_name'] == target_parameter].copy()
+        param_data = df[df['parameter_name'] == target_parameter]
         
         if len(param_data) == 0:
             print(f"⚠ No hay datos para {target_parameter}")
             return None, None
         
-        # Crear características temporales
-        param_data['year'] = param_data['date_from_utc'].dt.year
-        param_data['month'] = param_data['date_from_utc'].dt.month
-        param_data['day'] = param_data['date_from_utc'].dt.day
-        param_data['hour'] = param_data['date_from_utc'].dt.hour
-        param_data['day_of_week'] = param_data['date_from_utc'].dt.dayofweek
-        
-        # Crear características cíclicas
-        param_data['month_sin'] = np.sin(2 * np.pi * param_data['month'] / 12)
-        param_data['month_cos'] = np.cos(2 * np.pi * param_data['month'] / 12)
-        param_data['hour_sin'] = np.sin(2 * np.pi * param_data['hour'] / 24)
-        param_data['hour_cos'] = np.cos(2 * np.pi * param_data['hour'] / 24)
-        param_data['day_sin'] = np.sin(2 * np.pi * param_data['day'] / 31)
-        param_data['day_cos'] = np.cos(2 * np.pi * param_data['day'] / 31)
-        
-        # Características de ubicación (one-hot encoding)
-        location_dummies = pd.get_dummies(param_data['location_name'], prefix='location')
-        
-        # Características finales
-        feature_cols = [
-            'year', 'month', 'day', 'hour', 'day_of_week',
-            'month_sin', 'month_cos', 'hour_sin', 'hour_cos', 'day_sin', 'day_cos'
-        ]
-        
-        X = pd.concat([param_data[feature_cols], location_dummies], axis=1)
-        y = param_data['value']
+        # Calendario y cíclicas desde el almacén compartido; la ubicación queda
+        # como código entero y el one-hot se arma disperso solo para los lineales
+        features = build_features(param_data, CALENDAR_SPEC, 'date_from_utc')
+        X = ModelMatrix.from_features(features, param_data['location_name'])
+        y = param_data[value_col].to_numpy(dtype=np.float64)
+        self.feature_layouts[target_parameter] = X.layout
+        self.feature_times[target_parameter] = param_data['date_from_utc'].to_numpy()
         
         print(f"✓ Características preparadas para {target_parameter}: {X.shape}")
         return X, y
@@ -80,71 +165,79 @@ class AirQualityPredictor:
         Entrenar múltiples modelos
         
         Args:
-            X (pd.DataFrame): Características
-            y (pd.Series): Variable objetivo
+            X (ModelMatrix): Características
+            y (np.ndarray): Variable objetivo
             target_parameter (str): Parámetro objetivo
         """
         print(f"\n=== ENTRENANDO MODELOS PARA {target_parameter.upper()} ===")
         
-        # Dividir datos
-        X_train, X_test, y_train, y_test = train_test_split(
-            X, y, test_size=0.2, random_state=42
-        )
-        
-        # Definir modelos
-        models = {
-            'RandomForest': RandomForestRegressor(n_estimators=100, random_state=42),
-            'GradientBoosting': GradientBoostingRegressor(random_state=42),
-            'LinearRegression': LinearRegression(),
-            'Ridge': Ridge(alpha=1.0),
-            'Lasso': Lasso(alpha=0.1),
-            'SVR': SVR(kernel='rbf')
-        }
+        partitions, y_train, y_test = self._partitions(X, y, self.feature_times.get(target_parameter))
         
         # Entrenar y evaluar modelos
         results = {}
         
-        for name, model in models.items():
+        for name, model in model_catalog().items():
             print(f"\nEntrenando {name}...")
             
             try:
-                # Entrenar modelo
-                model.fit(X_train, y_train)
-                
-                # Predicciones
-                y_pred = model.predict(X_test)
-                
-                # Métricas
-                mse = mean_squared_error(y_test, y_pred)
-                rmse = np.sqrt(mse)
-                mae = mean_absolute_error(y_test, y_pred)
-                r2 = r2_score(y_test, y_pred)
-                
-                results[name] = {
-                    'model': model,
-                    'mse': mse,
-                    'rmse': rmse,
-                    'mae': mae,
-                    'r2': r2,
-                    'y_pred': y_pred
-                }
-                
-                print(f"  ✓ {name}: R²={r2:.3f}, RMSE={rmse:.3f}, MAE={mae:.3f}")
-                
-                # Guardar importancia de características para Random Forest
-                if name == 'RandomForest':
-                    self.feature_importance[target_parameter] = pd.DataFrame({
-                        'feature': X.columns,
-                        'importance': model.feature_importances_
-                    }).sort_values('importance', ascending=False)
-                
+                X_train, X_test = partitions[model_family(name)]
+                results[name] = fit_and_score(model, X_train, y_train, X_test, y_test)
+                self._register_result(target_parameter, name, results[name], X)
             except Exception as e:
                 print(f"  ✗ Error con {name}: {e}")
         
-        # Guardar resultados
+        return self._select_best(target_parameter, results)
+    
+    def _partitions(self, X, y, times=None):
+        """
+        Particiones de entrenamiento y prueba de cada familia de modelos
+        
+        Con marcas de tiempo la prueba es el 20% más reciente (sin mezclar
+        futuro en el entrenamiento); sin ellas se usa una división al azar.
+        Las particiones de cada familia se arman una sola vez y todos los
+        modelos de la familia las comparten.
+        
+        Returns:
+            tuple: ({familia: (X_train, X_test)}, y_train, y_test)
+        """
+        if times is not None:
+            order = np.argsort(pd.DatetimeIndex(times).asi8, kind='stable')
+            cut = int(round(len(order) * 0.8))
+            train_rows, test_rows = np.sort(order[:cut]), np.sort(order[cut:])
+        else:
+            train_rows, test_rows = train_test_split(
+                np.arange(len(X)), test_size=0.2, random_state=42
+            )
+        partitions = {
+            family: (X.matrix(family, train_rows), X.matrix(family, test_rows))
+            for family in (TREE_FAMILY, LINEAR_FAMILY)
+        }
+        return partitions, y[train_rows], y[test_rows]
+    
+    def _register_result(self, target_parameter, name, result, X):
+        """Completar el modelo entrenado e informar sus métricas"""
+        model = result['model']
+        
+        # El diseño de columnas viaja con el modelo (también al guardarlo)
+        model.feature_layout_ = X.layout
+        model.feature_family_ = model_family(name)
+        
+        print(f"  ✓ {name}: R²={result['r2']:.3f}, RMSE={result['rmse']:.3f}, MAE={result['mae']:.3f}")
+        
+        # Guardar importancia de características para Random Forest
+        if name == 'RandomForest':
+            self.feature_importance[target_parameter] = pd.DataFrame({
+                'feature': X.columns,
+                'importance': model.feature_importances_
+            }).sort_values('importance', ascending=False)
+    
+    def _select_best(self, target_parameter, results):
+        """Guardar los resultados de un parámetro y elegir el mejor modelo"""
         self.models[target_parameter] = results
+        if not results:
+            print(f"\n✗ Ningún modelo se entrenó para {target_parameter}")
+            return None, results
         
-        # Seleccionar mejor modelo
         best_model_name = max(results.keys(), key=lambda x: results[x]['r2'])
         best_model = results[best_model_name]['model']
         
@@ -152,17 +245,166 @@ class AirQualityPredictor:
         
         return best_model, results
     
-    def hyperparameter_tuning(self, X, y, target_parameter, model_type='RandomForest'):
+    def train_models_parallel(self, datasets, max_workers=None):
         """
-        Ajuste de hiperparámetros
+        Entrenar todos los (parámetro, modelo) en un pool de procesos
+        
+        Las particiones de cada parámetro y familia se publican una vez en
+        memoria compartida; cada tarea recibe solo sus descriptores y vuelve
+        con el modelo entrenado y sus métricas. Las tareas se envían de la
+        más costosa a la más liviana (orden del catálogo) y los resultados
+        quedan en self.models igual que con train_models.
         
         Args:
-            X (pd.DataFrame): Características
-            y (pd.Series): Variable objetivo
+            datasets (dict): {parámetro: (X, y)} como devuelve prepare_features
+            max_workers (int): Procesos del pool (por defecto, núcleos disponibles)
+            
+        Returns:
+            dict: {parámetro: (mejor modelo, resultados)}
+        """
+        datasets = {target: (X, y) for target, (X, y) in datasets.items() if X is not None}
+        print(f"\n=== ENTRENAMIENTO PARALELO: {len(datasets)} parámetros x "
+              f"{len(model_catalog())} modelos ===")
+        
+        results = {target: {} for target in datasets}
+        with SharedMatrixArena() as arena:
+            # Publicar las particiones de cada parámetro y familia una sola vez
+            shared = {}
+            for target, (X, y) in datasets.items():
+                partitions, y_train, y_test = self._partitions(X, y, self.feature_times.get(target))
+                targets = {'y_train': arena.share(y_train), 'y_test': arena.share(y_test)}
+                for family, (X_train, X_test) in partitions.items():
+                    shared[target, family] = dict(targets, X_train=arena.share(X_train),
+                                                  X_test=arena.share(X_test))
+            print(f"✓ Particiones en memoria compartida: {arena.nbytes() / 1e6:.1f} MB")
+            
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                futures = [
+                    executor.submit(_train_job, target, name, shared[target, model_family(name)])
+                    for name in model_catalog() for target in datasets
+                ]
+                for future in as_completed(futures):
+                    target, name, result, error = future.result()
+                    if error is not None:
+                        print(f"  ✗ Error con {name} ({target}): {error}")
+                        continue
+                    print(f"[{target}]", end='')
+                    self._register_result(target, name, result, datasets[target][0])
+                    results[target][name] = result
+        
+        # Mantener el orden del catálogo en los resultados de cada parámetro
+        trained = {}
+        for target in datasets:
+            print(f"\n--- {target.upper()} ---", end='')
+            ordered = {name: results[target][name] for name in model_catalog() if name in results[target]}
+            trained[target] = self._select_best(target, ordered)
+        return trained
+    
+    def refit_incremental(self, X, y, target_parameter, recent_hours=INCREMENTAL_RECENT_HOURS,
+                          fraction=REFIT_FRACTION):
+        """
+        Reentrenamiento incremental de RandomForest y GradientBoosting
+        
+        En lugar de reentrenar con toda la historia, se agregan árboles
+        entrenados con las últimas recent_hours horas (warm start); el
+        bosque retira sus árboles más antiguos y el boosting suma etapas
+        sobre los residuos recientes (ver incremental_refit).
+        
+        Args:
+            X (ModelMatrix): Características con los datos nuevos (ver prepare_features)
+            y (np.ndarray): Variable objetivo
+            target_parameter (str): Parámetro objetivo ya entrenado
+            recent_hours (int): Horas recientes con que se entrenan los árboles nuevos
+            fraction (float): Fracción del ensamble que se renueva
+            
+        Returns:
+            dict: {modelo: True si se actualizó, False si requiere reentrenar completo}
+        """
+        print(f"\n=== REENTRENAMIENTO INCREMENTAL PARA {target_parameter.upper()} ===")
+        
+        results = self.models.get(target_parameter)
+        times = self.feature_times.get(target_parameter)
+        if not results or times is None:
+            print(f"⚠ No hay modelos entrenados ni datos preparados para {target_parameter}")
+            return {}
+        
+        # Filas de las últimas recent_hours horas
+        stamps = pd.DatetimeIndex(times)
+        recent_rows = np.flatnonzero(stamps > stamps.max() - pd.Timedelta(hours=recent_hours))
+        locations = np.asarray(X.layout.locations, dtype=object)[X.location_codes[recent_rows]]
+        y_recent = y[recent_rows]
+        print(f"✓ Datos recientes: {len(recent_rows):,} filas de las últimas {recent_hours} horas")
+        
+        updated = {}
+        for name in TREE_MODELS:
+            if name not in results:
+                continue
+            model = results[name]['model']
+            try:
+                # Codificar con el diseño del modelo (los códigos de ubicación no cambian)
+                X_recent = model.feature_layout_.encode(X.dense[recent_rows], locations, TREE_FAMILY)
+                updated[name] = incremental_refit(model, X_recent, y_recent, fraction)
+                if updated[name]:
+                    print(f"  ✓ {name}: {len(model.estimators_)} árboles/etapas")
+                else:
+                    print(f"  ⚠ {name}: alcanzó el máximo de etapas, requiere reentrenamiento completo")
+            except Exception as e:
+                updated[name] = False
+                print(f"  ✗ Error con {name}: {e}")
+        return updated
+    
+    def backtest_models(self, X, y, target_parameter, model_names=None, **options):
+        """
+        Backtesting walk-forward de los modelos del catálogo
+        
+        Cada fold entrena solo con datos anteriores a su mes de prueba; los
+        folds ya entrenados se leen de la caché (ver backtesting).
+        
+        Args:
+            X (ModelMatrix): Características
+            y (np.ndarray): Variable objetivo
+            target_parameter (str): Parámetro objetivo
+            model_names (list): Modelos del catálogo a evaluar (por defecto todos)
+            **options: Argumentos de WalkForwardBacktest (fold_hours, mode,
+                window_folds, max_folds, max_workers, cache_dir...)
+                
+        Returns:
+            pd.DataFrame: Métricas por modelo y fold
+        """
+        print(f"\n=== BACKTESTING WALK-FORWARD PARA {target_parameter.upper()} ===")
+        
+        times = self.feature_times.get(target_parameter)
+        if times is None:
+            print(f"⚠ No hay marcas de tiempo para {target_parameter} (usar prepare_features)")
+            return None
+        
+        catalog = model_catalog()
+        models = {name: catalog[name] for name in (model_names or catalog)}
+        matrices = {name: X.matrix(model_family(name)) for name in models}
+        return WalkForwardBacktest(**options).run(models, matrices, y, times)
+    
+    def hyperparameter_tuning(self, X, y, target_parameter, model_type='RandomForest',
+                              max_fits=DEFAULT_MAX_FITS, max_seconds=None, priors_path=SEARCH_PRIORS_PATH):
+        """
+        Ajuste de hiperparámetros por successive halving con presupuesto
+        
+        Se evalúa una muestra de la grilla (más los mejores parámetros de
+        corridas anteriores) descartando las peores configuraciones en
+        rondas con cada vez más filas, con validación cruzada temporal; el
+        mejor resultado queda como prior para la próxima corrida.
+        
+        Args:
+            X (ModelMatrix): Características
+            y (np.ndarray): Variable objetivo
             target_parameter (str): Parámetro objetivo
             model_type (str): Tipo de modelo a optimizar
+            max_fits (int): Ajustes máximos de la búsqueda (folds incluidos)
+            max_seconds (float): Tiempo máximo de la búsqueda (None = sin límite)
+            priors_path (str): Archivo de priors de hiperparámetros
         """
         print(f"\n=== AJUSTE DE HIPERPARÁMETROS PARA {target_parameter.upper()} ===")
+        layout = X.layout
+        X = X.matrix(TREE_FAMILY)
         
         if model_type == 'RandomForest':
             param_grid = {
@@ -186,20 +428,31 @@ class AirQualityPredictor:
             print(f"⚠ Tipo de modelo {model_type} no soportado para tuning")
             return None
         
-        # Grid search con validación cruzada
-        grid_search = GridSearchCV(
-            model, param_grid, cv=5, scoring='r2', n_jobs=-1, verbose=1
+        # Successive halving con validación cruzada, arrancando desde los priors
+        prior_key = f'{target_parameter}:{model_type}'
+        search = SuccessiveHalvingSearch(
+            model, param_grid, max_fits=max_fits, max_seconds=max_seconds, cv=5, scoring='r2',
+            priors=load_priors(prior_key, priors_path)
         )
         
-        grid_search.fit(X, y)
+        # Validación temporal: las filas se ordenan por tiempo si se conocen
+        times = self.feature_times.get(target_parameter)
+        if times is not None and len(times) != X.shape[0]:
+            times = None
+        search.fit(X, y, times=None if times is None else pd.DatetimeIndex(times).asi8)
         
-        print(f"✓ Mejores parámetros: {grid_search.best_params_}")
-        print(f"✓ Mejor score: {grid_search.best_score_:.3f}")
+        print(f"✓ Mejores parámetros: {search.best_params_}")
+        print(f"✓ Mejor score: {search.best_score_:.3f}")
         
-        # Guardar mejores parámetros
-        self.best_params[target_parameter] = grid_search.best_params_
+        # Guardar mejores parámetros (también como prior de la próxima corrida)
+        self.best_params[target_parameter] = search.best_params_
+        if np.isfinite(search.best_score_):
+            save_prior(prior_key, search.best_params_, search.best_score_, priors_path)
         
-        return grid_search.best_estimator_
+        best_model = search.best_estimator_
+        best_model.feature_layout_ = layout
+        best_model.feature_family_ = TREE_FAMILY
+        return best_model
     
     def predict_future(self, model, location_name, future_dates, target_parameter):
         """
@@ -216,40 +469,21 @@ class AirQualityPredictor:
         """
         print(f"\n=== PREDICIENDO VALORES FUTUROS PARA {target_parameter.upper()} ===")
         
-        # Crear características para fechas futuras
-        future_features = []
-        
-        for date in future_dates:
-            features = {
-                'year': date.year,
-                'month': date.month,
-                'day': date.day,
-                'hour': 12,  # Hora del mediodía como referencia
-                'day_of_week': date.dayofweek,
-                'month_sin': np.sin(2 * np.pi * date.month / 12),
-                'month_cos': np.cos(2 * np.pi * date.month / 12),
-                'hour_sin': np.sin(2 * np.pi * 12 / 24),
-                'hour_cos': np.cos(2 * np.pi * 12 / 24),
-                'day_sin': np.sin(2 * np.pi * date.day / 31),
-                'day_cos': np.cos(2 * np.pi * date.day / 31)
-            }
-            
-            # Agregar ubicación
-            for col in model.feature_names_in_:
-                if col.startswith('location_'):
-                    features[col] = 1 if col == f'location_{location_name}' else 0
-            
-            future_features.append(features)
-        
-        # Crear DataFrame de características
-        X_future = pd.DataFrame(future_features)
-        
-        # Asegurar que las columnas coincidan con el modelo
-        missing_cols = set(model.feature_names_in_) - set(X_future.columns)
-        for col in missing_cols:
-            X_future[col] = 0
-        
-        X_future = X_future[model.feature_names_in_]
+        # Características de calendario para todas las fechas en un solo gather,
+        # con la hora del mediodía como referencia
+        dates = pd.DatetimeIndex(future_dates)
+        if dates.tz is not None:
+            dates = dates.tz_localize(None)
+        calendar = calendar_features(dates.normalize() + pd.Timedelta(hours=12), CALENDAR_SPEC)
+        
+        # Misma codificación que en el entrenamiento: código de ubicación para
+        # árboles, one-hot disperso para lineales
+        layout = getattr(model, 'feature_layout_', self.feature_layouts.get(target_parameter))
+        if layout is None:
+            print(f"⚠ No hay diseño de características para {target_parameter}")
+            return None
+        family = getattr(model, 'feature_family_', TREE_FAMILY)
+        X_future = layout.encode(calendar, location_name, family)
         
         # Predicciones
         predictions = model.predict(X_future)
@@ -298,46 +532,38 @@ class AirQualityPredictor:
             print(f"✗ Error al cargar modelo: {e}")
             return None
     
+    def recommendation_levels(self, predicted_values, target_parameter):
+        """
+        Clasificar un arreglo de predicciones en niveles de recomendación
+        
+        Args:
+            predicted_values (array-like): Valores predichos en la unidad
+                canónica (ver unit_normalization)
+            target_parameter (str): Parámetro objetivo
+            
+        Returns:
+            np.ndarray: Índice en RECOMMENDATION_LEVELS (int8), -1 si el
+                parámetro no tiene estándares
+        """
+        param = target_parameter.lower()
+        bins = breakpoint_bins(predicted_values, param)
+        return np.where(bins >= 0, RECOMMENDATION_BIN_TO_LEVEL[bins], -1).astype(np.int8)
+    
     def generate_recommendations(self, predicted_value, target_parameter):
         """
         Generar recomendaciones basadas en predicciones
         
         Args:
-            predicted_value (float): Valor predicho
+            predicted_value (float): Valor predicho en la unidad canónica
             target_parameter (str): Parámetro objetivo
             
         Returns:
             dict: Recomendaciones
         """
-        # Estándares EPA simplificados
-        if target_parameter.lower() == 'pm25':
-            if predicted_value <= 12.0:
-                recommendation = "Excelente calidad del aire. Actividades al aire libre sin restricciones."
-                activity_level = "Sin restricciones"
-            elif predicted_value <= 35.4:
-                recommendation = "Calidad del aire moderada. Personas sensibles deben considerar reducir actividades al aire libre."
-                activity_level = "Moderadas restricciones"
-            elif predicted_value <= 55.4:
-                recommendation = "No saludable para grupos sensibles. Evitar actividades al aire libre prolongadas."
-                activity_level = "Restricciones significativas"
-            else:
-                recommendation = "Calidad del aire no saludable. Evitar TODAS las actividades al aire libre."
-                activity_level = "Restricciones severas"
-        
-        elif target_parameter.lower() == 'o3':
-            if predicted_value <= 0.054:
-                recommendation = "Excelente calidad del aire. Actividades al aire libre sin restricciones."
-                activity_level = "Sin restricciones"
-            elif predicted_value <= 0.070:
-                recommendation = "Calidad del aire moderada. Personas sensibles deben considerar reducir actividades al aire libre."
-                activity_level = "Moderadas restricciones"
-            elif predicted_value <= 0.085:
-                recommendation = "No saludable para grupos sensibles. Evitar actividades al aire libre prolongadas."
-                activity_level = "Restricciones significativas"
-            else:
-                recommendation = "Calidad del aire no saludable. Evitar TODAS las actividades al aire libre."
-                activity_level = "Restricciones severas"
+        level = self.recommendation_levels([predicted_value], target_parameter)[0]
         
+        if level >= 0:
+            recommendation, activity_level = RECOMMENDATION_LEVELS[level]
         else:
             recommendation = "Consultar estándares locales para este parámetro."
             activity_level = "No determinado"
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Clasificación vectorizada de la calidad del aire por tablas de cortes
+
+Una única tabla de umbrales por contaminante alimenta todos los
+clasificadores del proyecto. Los valores se etiquetan en bloque con
+np.searchsorted y se devuelven como códigos categóricos enteros.
+"""
+
+import copy
+
+import numpy as np
+import pandas as pd
+
+# Niveles de calidad en orden creciente de contaminación
+QUALITY_LEVELS = ['excelente', 'bueno', 'moderado', 'malo', 'muy_malo', 'peligroso']
+
+# Umbrales de contaminación según estándares internacionales (límite superior de cada nivel)
+UMBRALES_CONTAMINACION = {
+    'pm25': {
+        'excelente': 0,      # µg/m³
+        'bueno': 12,         # µg/m³
+        'moderado': 35.4,    # µg/m³
+        'malo': 55.4,        # µg/m³
+        'muy_malo': 150.4,   # µg/m³
+        'peligroso': 250.4   # µg/m³
+    },
+    'pm10': {
+        'excelente': 0,      # µg/m³
+        'bueno': 54,         # µg/m³
+        'moderado': 154,     # µg/m³
+        'malo': 254,         # µg/m³
+        'muy_malo': 354,     # µg/m³
+        'peligroso': 424     # µg/m³
+    },
+    'no2': {
+        'excelente': 0,      # ppb
+        'bueno': 53,         # ppb
+        'moderado': 100,     # ppb
+        'malo': 360,         # ppb
+        'muy_malo': 649,     # ppb
+        'peligroso': 1249    # ppb
+    },
+    'o3': {
+        'excelente': 0,      # ppb
+        'bueno': 54,         # ppb
+        'moderado': 70,      # ppb
+        'malo': 85,          # ppb
+        'muy_malo': 105,     # ppb
+        'peligroso': 200     # ppb
+    },
+    'so2': {
+        'excelente': 0,      # ppb
+        'bueno': 35,         # ppb
+        'moderado': 75,      # ppb
+        'malo': 185,         # ppb
+        'muy_malo': 304,     # ppb
+        'peligroso': 604     # ppb
+    },
+    'co': {
+        'excelente': 0,      # ppm
+        'bueno': 4.4,        # ppm
+        'moderado': 9.4,     # ppm
+        'malo': 12.4,        # ppm
+        'muy_malo': 15.4,    # ppm
+        'peligroso': 30.4    # ppm
+    }
+}
+
+def get_thresholds():
+    """
+    Obtener una copia de la tabla de umbrales por contaminante
+    
+    Returns:
+        dict: Umbrales por parámetro y nivel
+    """
+    return copy.deepcopy(UMBRALES_CONTAMINACION)
+
+def build_breakpoint_table(thresholds=None):
+    """
+    Construir la tabla de cortes (arreglo ordenado) de cada contaminante
+    
+    Args:
+        thresholds (dict): Umbrales por parámetro y nivel; por defecto
+            UMBRALES_CONTAMINACION
+            
+    Returns:
+        dict: Parámetro -> np.ndarray con los límites de QUALITY_LEVELS
+    """
+    if thresholds is None:
+        thresholds = UMBRALES_CONTAMINACION
+    return {
+        param: np.array([levels[level] for level in QUALITY_LEVELS], dtype=np.float64)
+        for param, levels in thresholds.items()
+    }
+
+_DEFAULT_BREAKPOINTS = build_breakpoint_table()
+
+def breakpoint_bins(values, parameter, thresholds=None, scale=1.0):
+    """
+    Ubicar cada valor entre los cortes de su contaminante
+    
+    El intervalo i cubre (corte[i-1], corte[i]]; el intervalo 0 son los
+    valores <= corte[0] y len(cortes) los que superan el último corte.
+    
+    Args:
+        values (array-like): Valores a clasificar
+        parameter (str): Nombre del parámetro
+        thresholds (dict): Umbrales alternativos; por defecto la tabla común
+        scale (float): Factor para expresar los cortes en la unidad de los
+            valores (p. ej. 0.001 para O3 en ppm)
+            
+    Returns:
+        np.ndarray: Intervalo de cada valor (int8), -1 para NaN o
+            parámetros sin tabla
+    """
+    values = np.asarray(values, dtype=np.float64)
+    table = _DEFAULT_BREAKPOINTS if thresholds is None else build_breakpoint_table(thresholds)
+    edges = table.get(str(parameter).lower())
+    
+    if edges is None:
+        return np.full(values.shape, -1, dtype=np.int8)
+    
+    bins = np.searchsorted(edges * scale, values, side='left').astype(np.int8)
+    bins[np.isnan(values)] = -1
+    return bins
+
+def classify_values(values, parameter, thresholds=None, scale=1.0):
+    """
+    Clasificar valores en los niveles de QUALITY_LEVELS
+    
+    Args:
+        values (array-like): Valores a clasificar
+        parameter (str): Nombre del parámetro
+        thresholds (dict): Umbrales alternativos; por defecto la tabla común
+        scale (float): Factor de unidad de los cortes (ver breakpoint_bins)
+        
+    Returns:
+        np.ndarray: Código del nivel (int8, índice en QUALITY_LEVELS),
+            -1 para NaN o parámetros sin tabla
+    """
+    bins = breakpoint_bins(values, parameter, thresholds, scale)
+    # Sobre el último corte se mantiene el nivel más alto
+    return np.where(bins >= 0, np.minimum(bins, len(QUALITY_LEVELS) - 1), -1).astype(np.int8)
+
+def classify_categorical(values, parameter, thresholds=None, scale=1.0):
+    """
+    Clasificar valores y devolverlos como pd.Categorical ordenado
+    
+    Args:
+        values (array-like): Valores a clasificar
+        parameter (str): Nombre del parámetro
+        thresholds (dict): Umbrales alternativos; por defecto la tabla común
+        scale (float): Factor de unidad de los cortes (ver breakpoint_bins)
+        
+    Returns:
+        pd.Categorical: Niveles de calidad (NaN donde no se pudo clasificar)
+    """
+    codes = classify_values(values, parameter, thresholds, scale)
+    return pd.Categorical.from_codes(codes, categories=QUALITY_LEVELS, ordered=True)
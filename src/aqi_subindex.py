@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+Sub-índices AQI (EPA) y NowCast vectorizados sobre el panel horario
+
+Calcula el índice numérico que ve el público: interpolación lineal por
+tramos de cada contaminante y NowCast ponderado de 12 horas para material
+particulado, usando ventanas deslizantes de NumPy en lugar de ciclos por hora.
+El O3 sigue la regla EPA: el índice de 8 horas sobre la media móvil de 8
+horas y el de 1 hora solo desde 125 ppb, quedándose con el mayor.
+"""
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+# Tramos del índice AQI
+AQI_INDEX_BREAKPOINTS = [(0, 50), (51, 100), (101, 150), (151, 200),
+                         (201, 300), (301, 400), (401, 500)]
+
+# Tramos de concentración EPA por contaminante (µg/m³, ppb para gases, ppm para CO).
+# 'o3' es la tabla de 8 horas (sin definición sobre 200 ppb) y 'o3_1h' la de
+# 1 hora, que empieza en el tramo 101-150 (ver AQI_FIRST_SEGMENT)
+AQI_CONCENTRATION_BREAKPOINTS = {
+    'pm25': [(0.0, 12.0), (12.1, 35.4), (35.5, 55.4), (55.5, 150.4),
+             (150.5, 250.4), (250.5, 350.4), (350.5, 500.4)],
+    'pm10': [(0, 54), (55, 154), (155, 254), (255, 354),
+             (355, 424), (425, 504), (505, 604)],
+    'o3': [(0, 54), (55, 70), (71, 85), (86, 105), (106, 200)],
+    'o3_1h': [(125, 164), (165, 204), (205, 404), (405, 504), (505, 604)],
+    'no2': [(0, 53), (54, 100), (101, 360), (361, 649),
+            (650, 1249), (1250, 1649), (1650, 2049)],
+    'so2': [(0, 35), (36, 75), (76, 185), (186, 304),
+            (305, 604), (605, 804), (805, 1004)],
+    'co': [(0.0, 4.4), (4.5, 9.4), (9.5, 12.4), (12.5, 15.4),
+           (15.5, 30.4), (30.5, 40.4), (40.5, 50.4)],
+}
+
+# Tramo de AQI_INDEX_BREAKPOINTS en que empieza cada tabla (0 si no figura)
+AQI_FIRST_SEGMENT = {'o3_1h': 2}
+
+# Decimales a los que EPA trunca cada concentración antes de interpolar
+AQI_TRUNCATION_DECIMALS = {'pm25': 1, 'pm10': 0, 'o3': 0, 'o3_1h': 0, 'no2': 0, 'so2': 0, 'co': 1}
+
+# Media móvil de O3: horas de la ventana y horas válidas mínimas (EPA: 6 de 8)
+O3_AVERAGING_HOURS = 8
+O3_MIN_HOURS = 6
+
+# Contaminantes cuyo índice se calcula sobre el NowCast en lugar del valor horario
+NOWCAST_PARAMETERS = ('pm25', 'pm10')
+
+# Series procesadas por bloque en el NowCast (acota la memoria de las ventanas)
+_NOWCAST_CHUNK = 64
+
+def _truncate(values, decimals):
+    """Truncar hacia abajo a la cantidad de decimales indicada"""
+    factor = 10.0 ** decimals
+    # El pequeño margen evita que 12.1 se trunque a 12.0 por representación binaria
+    return np.floor(values * factor + 1e-9) / factor
+
+def aqi_subindex(values, parameter):
+    """
+    Calcular el sub-índice AQI de un arreglo de concentraciones
+    
+    Args:
+        values (array-like): Concentraciones en la unidad de la tabla
+        parameter (str): Nombre del parámetro o tabla ('o3' = 8 horas,
+            'o3_1h' = 1 hora)
+        
+    Returns:
+        np.ndarray: Sub-índice entero como float64 (NaN para valores
+            faltantes, parámetros sin tabla o concentraciones fuera de una
+            tabla parcial); las tablas que llegan a 500 se saturan en 500
+    """
+    values = np.asarray(values, dtype=np.float64)
+    param = parameter.lower()
+    if param not in AQI_CONCENTRATION_BREAKPOINTS:
+        return np.full(values.shape, np.nan)
+    
+    conc = np.asarray(AQI_CONCENTRATION_BREAKPOINTS[param], dtype=np.float64)
+    first = AQI_FIRST_SEGMENT.get(param, 0)
+    index = np.asarray(AQI_INDEX_BREAKPOINTS[first:first + len(conc)], dtype=np.float64)
+    c_lo, c_hi = conc[:, 0], conc[:, 1]
+    i_lo, i_hi = index[:, 0], index[:, 1]
+    
+    c = _truncate(np.clip(values, 0.0, None), AQI_TRUNCATION_DECIMALS[param])
+    segment = np.minimum(np.searchsorted(c_hi, c, side='left'), len(c_hi) - 1)
+    
+    sub = (i_hi[segment] - i_lo[segment]) / (c_hi[segment] - c_lo[segment]) \
+        * (np.maximum(c, c_lo[segment]) - c_lo[segment]) + i_lo[segment]
+    sub = np.floor(np.minimum(sub, i_hi[-1]) + 0.5)
+    sub[np.isnan(values)] = np.nan
+    
+    # Tablas parciales: fuera de sus tramos el índice no está definido
+    if first > 0:
+        sub[c < c_lo[0]] = np.nan
+    if i_hi[-1] < AQI_INDEX_BREAKPOINTS[-1][1]:
+        sub[c > c_hi[-1]] = np.nan
+    return sub
+
+def rolling_mean(values, hours=O3_AVERAGING_HOURS, min_hours=O3_MIN_HOURS):
+    """
+    Media móvil de las últimas `hours` horas (la actual incluida) sobre
+    columnas horarias contiguas
+    
+    Args:
+        values (np.ndarray): Matriz (horas, series) con NaN en faltantes
+        hours (int): Largo de la ventana
+        min_hours (int): Horas válidas mínimas en la ventana
+        
+    Returns:
+        np.ndarray: Matriz con la misma forma que values (NaN si faltan horas)
+    """
+    values = np.asarray(values, dtype=np.float64)
+    padded = np.vstack([np.full((hours - 1,) + values.shape[1:], np.nan), values])
+    windows = sliding_window_view(padded, hours, axis=0)
+    valid = (~np.isnan(windows)).sum(axis=-1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.nansum(windows, axis=-1) / valid
+    return np.where(valid >= min_hours, mean, np.nan)
+
+def ozone_subindex(values):
+    """
+    Sub-índice EPA de O3 sobre valores horarios (ppb)
+    
+    El índice de 8 horas usa la media móvil de 8 horas (definido hasta 200
+    ppb) y el de 1 hora solo aplica desde 125 ppb; se reporta el mayor.
+    
+    Args:
+        values (np.ndarray): Matriz (horas, series) de O3 horario
+        
+    Returns:
+        np.ndarray: Sub-índice con la misma forma que values
+    """
+    values = np.asarray(values, dtype=np.float64)
+    sub_8h = aqi_subindex(rolling_mean(values), 'o3')
+    sub_1h = aqi_subindex(values, 'o3_1h')
+    return np.fmax(sub_8h, sub_1h)
+
+def nowcast(values, hours=12, min_weight=0.5, min_recent=2):
+    """
+    NowCast ponderado (EPA) sobre columnas horarias contiguas
+    
+    Para cada hora usa las últimas `hours` horas: w = max(cmin / cmax,
+    min_weight) y NowCast = Σ w^k c_k / Σ w^k, con k = 0 la hora actual.
+    Requiere al menos `min_recent` valores entre las 3 horas más recientes.
+    
+    Args:
+        values (np.ndarray): Matriz (horas, series) con NaN en faltantes
+        hours (int): Largo de la ventana
+        min_weight (float): Peso mínimo del factor de ponderación
+        min_recent (int): Valores mínimos en las 3 horas más recientes
+        
+    Returns:
+        np.ndarray: Matriz NowCast con la misma forma que values
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if values.ndim == 1:
+        return nowcast(values[:, None], hours, min_weight, min_recent)[:, 0]
+    
+    result = np.full(values.shape, np.nan)
+    powers = np.arange(hours, dtype=np.float64)
+    padded = np.vstack([np.full((hours - 1, values.shape[1]), np.nan), values])
+    
+    for lo in range(0, values.shape[1], _NOWCAST_CHUNK):
+        hi = min(lo + _NOWCAST_CHUNK, values.shape[1])
+        # Ventanas (horas, series, hours) con la hora actual en la posición 0
+        windows = sliding_window_view(padded[:, lo:hi], hours, axis=0)[..., ::-1]
+        valid = ~np.isnan(windows)
+        c = np.where(valid, windows, 0.0)
+        
+        c_max = np.max(np.where(valid, windows, -np.inf), axis=-1)
+        c_min = np.min(np.where(valid, windows, np.inf), axis=-1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            ratio = np.where(c_max > 0, c_min / c_max, 1.0)
+        w = np.maximum(ratio, min_weight)
+        
+        weights = np.power(w[..., None], powers) * valid
+        with np.errstate(invalid='ignore', divide='ignore'):
+            block = np.sum(weights * c, axis=-1) / np.sum(weights, axis=-1)
+        
+        enough = valid[..., :3].sum(axis=-1) >= min_recent
+        result[:, lo:hi] = np.where(enough, block, np.nan)
+    
+    return result
+
+def compute_aqi_panel(panel, nowcast_parameters=NOWCAST_PARAMETERS):
+    """
+    Sub-índices horarios por serie y AQI por ubicación sobre el panel
+    
+    Args:
+        panel (pd.DataFrame): Panel horario con columnas MultiIndex
+            (ubicación, parámetro), ver create_hourly_panel
+        nowcast_parameters (tuple): Parámetros calculados sobre el NowCast
+        
+    Returns:
+        tuple: (sub-índices por serie, AQI por ubicación como el máximo de
+            sus sub-índices)
+    """
+    parameters = panel.columns.get_level_values(-1).str.lower()
+    covered = parameters.isin([param for param in AQI_CONCENTRATION_BREAKPOINTS if param != 'o3_1h'])
+    values = panel.to_numpy(dtype=np.float64)
+    subindex = np.full(values.shape, np.nan)
+    
+    # Un solo cálculo por contaminante sobre todas sus estaciones
+    for param in parameters[covered].unique():
+        cols = np.flatnonzero(parameters == param)
+        block = values[:, cols]
+        if param == 'o3':
+            subindex[:, cols] = ozone_subindex(block)
+            continue
+        if param in nowcast_parameters:
+            block = _truncate(nowcast(block), AQI_TRUNCATION_DECIMALS[param])
+        subindex[:, cols] = aqi_subindex(block, param)
+    
+    sub_df = pd.DataFrame(subindex[:, covered], index=panel.index, columns=panel.columns[covered])
+    aqi_df = sub_df.T.groupby(level=0).max().T
+    
+    print(f"✓ Sub-índices AQI calculados: {sub_df.shape[1]} series, {len(sub_df):,} horas")
+    return sub_df, aqi_df
@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+"""
+Backtesting walk-forward sobre la línea de tiempo horaria
+
+La línea de tiempo se divide en bloques de fold_hours horas alineados a
+epoch, de modo que agregar datos nuevos al final no mueve los bloques
+anteriores. Cada fold prueba un bloque y entrena con los bloques previos:
+todos desde el inicio (ventana expansiva) o solo los últimos window_folds
+(ventana deslizante), nunca con datos posteriores al período de prueba.
+
+Cada bloque se resume una sola vez con un hash de sus filas (características
+y objetivo); la clave de un fold combina el modelo, sus parámetros y los
+hashes de sus bloques. El modelo entrenado y las predicciones de cada fold
+se guardan en disco con esa clave, así que agregar una familia de modelos o
+un mes nuevo solo entrena los folds que faltan. Los folds pendientes se
+entrenan en paralelo sobre matrices en memoria compartida.
+"""
+
+import hashlib
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import joblib
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from sklearn.base import clone
+
+from calendar_features import hour_of_epoch
+from output_writer import atomic_write
+from shared_matrices import SharedMatrixArena, attach_matrix, close_segments
+
+# Directorio por defecto de los folds entrenados
+BACKTEST_CACHE_DIR = 'data/backtest_cache'
+
+# Tipos de ventana de entrenamiento
+WINDOW_MODES = ('expanding', 'sliding')
+
+# Horas de cada bloque de prueba por defecto (30 días)
+DEFAULT_FOLD_HOURS = 24 * 30
+
+def _metrics(y_true, y_pred):
+    """RMSE, MAE y R² de un fold"""
+    errors = y_true - y_pred
+    ss_tot = float(((y_true - y_true.mean()) ** 2).sum())
+    return {
+        'rmse': float(np.sqrt(np.mean(errors ** 2))),
+        'mae': float(np.mean(np.abs(errors))),
+        'r2': 1 - float((errors ** 2).sum()) / ss_tot if ss_tot > 0 else np.nan,
+    }
+
+def _rows_digest(matrix, y, rows):
+    """Hash de las filas de un bloque (características y objetivo)"""
+    digest = hashlib.sha1()
+    block = matrix[rows]
+    if sparse.issparse(block):
+        block = block.tocsr()
+        for array in (block.data, block.indices, block.indptr):
+            digest.update(np.ascontiguousarray(array).tobytes())
+    else:
+        digest.update(np.ascontiguousarray(block).tobytes())
+    digest.update(np.ascontiguousarray(y[rows], dtype=np.float64).tobytes())
+    return digest.hexdigest()
+
+def model_key(estimator):
+    """Identidad estable de un estimador: clase y parámetros"""
+    params = sorted((name, repr(value)) for name, value in estimator.get_params(deep=False).items())
+    return f'{type(estimator).__module__}.{type(estimator).__name__}{params}'
+
+def _fit_fold(estimator, descriptors, train, test):
+    """
+    Trabajador: entrenar un fold sobre matrices en memoria compartida
+    
+    Args:
+        estimator: Estimador sin entrenar
+        descriptors (dict): Descriptores de X, y y el orden temporal
+        train (tuple): (inicio, fin) de las filas de entrenamiento en el orden temporal
+        test (tuple): (inicio, fin) de las filas de prueba
+        
+    Returns:
+        tuple: (modelo entrenado, predicciones de prueba)
+    """
+    segments = []
+    try:
+        data = {}
+        for key, descriptor in descriptors.items():
+            data[key], opened = attach_matrix(descriptor)
+            segments += opened
+        order = data['order']
+        train_rows, test_rows = order[train[0]:train[1]], order[test[0]:test[1]]
+        model = clone(estimator).fit(data['X'][train_rows], data['y'][train_rows])
+        return model, model.predict(data['X'][test_rows])
+    finally:
+        data = None
+        close_segments(segments)
+
+class WalkForwardBacktest:
+    """
+    Backtesting walk-forward con folds en caché y entrenamiento paralelo
+    
+    Atributos (después de run):
+        folds (list): Folds (bloque de prueba, rangos de filas y fechas)
+        predictions (pd.DataFrame): Predicciones de prueba por modelo y fila
+    """
+    
+    def __init__(self, fold_hours=DEFAULT_FOLD_HOURS, mode='expanding', window_folds=None,
+                 min_train_folds=3, max_folds=None, max_workers=None, cache_dir=BACKTEST_CACHE_DIR):
+        """
+        Args:
+            fold_hours (int): Horas de cada bloque de prueba
+            mode (str): 'expanding' (desde el inicio) o 'sliding' (últimos
+                window_folds bloques)
+            window_folds (int): Bloques de entrenamiento en modo sliding
+            min_train_folds (int): Bloques previos mínimos para el primer fold
+            max_folds (int): Solo los últimos max_folds folds (None = todos)
+            max_workers (int): Procesos del pool (1 = secuencial)
+            cache_dir (str): Directorio de la caché de folds (None = sin caché)
+        """
+        if mode not in WINDOW_MODES:
+            raise ValueError(f"Modo de ventana no soportado: {mode}")
+        if mode == 'sliding' and not window_folds:
+            raise ValueError("El modo sliding requiere window_folds")
+        self.fold_hours = int(fold_hours)
+        self.mode = mode
+        self.window_folds = window_folds
+        self.min_train_folds = max(int(min_train_folds), 1)
+        self.max_folds = max_folds
+        self.max_workers = max_workers
+        self.cache_dir = cache_dir
+        self.folds = []
+    
+    def split(self, times):
+        """
+        Folds walk-forward sobre las marcas de tiempo
+        
+        Args:
+            times (array-like): Marca de tiempo de cada fila
+            
+        Returns:
+            tuple: (orden temporal de las filas, (bloques, inicio y fin de
+                cada bloque en ese orden), folds como diccionarios con block,
+                train_blocks, train y test (rangos en el orden temporal),
+                test_start y test_end)
+        """
+        hours = hour_of_epoch(times)
+        if (hours == np.iinfo(np.int64).min).any():
+            raise ValueError("Hay marcas de tiempo nulas")
+        order = np.argsort(hours, kind='stable')
+        blocks = np.floor_divide(hours[order], self.fold_hours)
+        block_ids = np.unique(blocks)
+        starts = np.searchsorted(blocks, block_ids, side='left')
+        ends = np.searchsorted(blocks, block_ids, side='right')
+        
+        folds = []
+        for i in range(self.min_train_folds, len(block_ids)):
+            first = 0 if self.mode == 'expanding' else max(i - self.window_folds, 0)
+            block = int(block_ids[i])
+            folds.append({
+                'block': block,
+                'train_blocks': (first, i),
+                'train': (int(starts[first]), int(starts[i])),
+                'test': (int(starts[i]), int(ends[i])),
+                'test_start': pd.Timestamp(block * self.fold_hours * 3600, unit='s', tz='UTC'),
+                'test_end': pd.Timestamp((block + 1) * self.fold_hours * 3600, unit='s', tz='UTC'),
+            })
+        if self.max_folds:
+            folds = folds[-self.max_folds:]
+        return order, (block_ids, starts, ends), folds
+    
+    def _fold_key(self, name, estimator, digests, fold):
+        """Clave de un fold: modelo, ventana y hashes de sus bloques"""
+        first, last = fold['train_blocks']
+        payload = '|'.join([model_key(estimator), self.mode, str(self.fold_hours),
+                            *digests[first:last], '>', digests[last]])
+        prefix = re.sub(r'\W+', '_', name)
+        return f"{prefix}_{fold['block']}_{hashlib.sha1(payload.encode('utf-8')).hexdigest()[:20]}"
+    
+    def _load(self, key):
+        """Fold desde la caché (None si no está)"""
+        if self.cache_dir is None:
+            return None
+        path = os.path.join(self.cache_dir, f'{key}.joblib')
+        if not os.path.exists(path):
+            return None
+        try:
+            return joblib.load(path)
+        except Exception as e:
+            print(f"⚠ Fold en caché ilegible ({key}): {e}")
+            return None
+    
+    def _save(self, key, entry):
+        """Guardar un fold (un fallo solo desactiva la caché en disco)"""
+        if self.cache_dir is None:
+            return
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            atomic_write(os.path.join(self.cache_dir, f'{key}.joblib'), lambda f: joblib.dump(entry, f))
+        except OSError as e:
+            print(f"⚠ No se pudo guardar el fold en caché: {e}")
+    
+    def run(self, models, X, y, times):
+        """
+        Ejecutar el backtesting de uno o varios modelos
+        
+        Args:
+            models (dict): {nombre: estimador sin entrenar}
+            X (np.ndarray, sparse o dict): Características, o {nombre: matriz}
+                cuando cada modelo usa su propia variante (ver model_matrix)
+            y (array-like): Variable objetivo
+            times (array-like): Marca de tiempo de cada fila
+            
+        Returns:
+            pd.DataFrame: Métricas por modelo y fold (rmse, mae, r2, filas,
+                si vino de la caché)
+        """
+        y = np.asarray(y, dtype=np.float64)
+        matrices = X if isinstance(X, dict) else {name: X for name in models}
+        order, (_, starts, ends), self.folds = self.split(times)
+        print(f"✓ Backtesting {self.mode}: {len(self.folds)} folds de {self.fold_hours} h, "
+              f"{len(models)} modelos")
+        if not self.folds:
+            print("⚠ No hay suficientes bloques para formar folds")
+            return pd.DataFrame()
+        
+        # Hash de cada bloque una sola vez por matriz distinta
+        digests = {}
+        for name in models:
+            matrix = matrices[name]
+            if id(matrix) not in digests:
+                digests[id(matrix)] = [_rows_digest(matrix, y, order[s:e]) for s, e in zip(starts, ends)]
+        
+        # Folds en caché y folds pendientes
+        entries, pending = {}, []
+        for name, estimator in models.items():
+            for i, fold in enumerate(self.folds):
+                key = self._fold_key(name, estimator, digests[id(matrices[name])], fold)
+                entry = self._load(key)
+                if entry is not None:
+                    entries[name, i] = dict(entry, cached=True)
+                else:
+                    pending.append((name, i, key))
+        print(f"  - Folds en caché: {len(entries)}, por entrenar: {len(pending)}")
+        
+        if pending:
+            self._fit_pending(pending, models, matrices, y, order, entries)
+        
+        # Métricas y predicciones por fold
+        rows, predictions = [], []
+        for (name, i) in [(name, i) for name in models for i in range(len(self.folds)) if (name, i) in entries]:
+            entry, fold = entries[name, i], self.folds[i]
+            test_rows = order[fold['test'][0]:fold['test'][1]]
+            rows.append({'model': name, 'fold': i, 'test_start': fold['test_start'],
+                         'train_rows': fold['train'][1] - fold['train'][0], 'test_rows': len(test_rows),
+                         **_metrics(y[test_rows], entry['y_pred']), 'cached': entry['cached']})
+            predictions.append(pd.DataFrame({'model': name, 'fold': i, 'row': test_rows,
+                                             'y_true': y[test_rows], 'y_pred': entry['y_pred']}))
+        if not rows:
+            print("✗ Ningún fold se pudo entrenar")
+            return pd.DataFrame()
+        self.predictions = pd.concat(predictions, ignore_index=True)
+        results = pd.DataFrame(rows)
+        
+        summary = results.groupby('model', sort=False)[['rmse', 'mae', 'r2']].mean()
+        for name, row in summary.iterrows():
+            print(f"  ✓ {name}: R²={row['r2']:.3f}, RMSE={row['rmse']:.3f}, MAE={row['mae']:.3f} "
+                  f"(media de {len(self.folds)} folds)")
+        return results
+    
+    def _fit_pending(self, pending, models, matrices, y, order, entries):
+        """Entrenar los folds pendientes (en paralelo sobre memoria compartida)"""
+        
+        def _store(name, i, key, model, y_pred):
+            entry = {'model': model, 'y_pred': np.asarray(y_pred, dtype=np.float64)}
+            self._save(key, entry)
+            entries[name, i] = dict(entry, cached=False)
+        
+        if self.max_workers == 1:
+            for name, i, key in pending:
+                fold = self.folds[i]
+                train_rows = order[fold['train'][0]:fold['train'][1]]
+                test_rows = order[fold['test'][0]:fold['test'][1]]
+                matrix = matrices[name]
+                model = clone(models[name]).fit(matrix[train_rows], y[train_rows])
+                _store(name, i, key, model, model.predict(matrix[test_rows]))
+            return
+        
+        with SharedMatrixArena() as arena:
+            shared = {'y': arena.share(y), 'order': arena.share(order)}
+            descriptors = {}
+            for name in models:
+                if id(matrices[name]) not in descriptors:
+                    descriptors[id(matrices[name])] = arena.share(matrices[name])
+            
+            with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+                futures = {}
+                for name, i, key in pending:
+                    fold = self.folds[i]
+                    job = dict(shared, X=descriptors[id(matrices[name])])
+                    future = executor.submit(_fit_fold, models[name], job, fold['train'], fold['test'])
+                    futures[future] = (name, i, key)
+                for future in as_completed(futures):
+                    name, i, key = futures[future]
+                    try:
+                        model, y_pred = future.result()
+                    except Exception as e:
+                        print(f"  ✗ Error en el fold {i} de {name}: {e}")
+                        continue
+                    _store(name, i, key, model, y_pred)
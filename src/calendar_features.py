@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+"""
+Características de calendario desde tablas precalculadas por hora
+
+Cada marca de tiempo se reduce una sola vez a su hora desde epoch. Para el
+rango de horas presente se arma una tabla pequeña (una fila por hora) con
+los componentes de calendario UTC, sus versiones cíclicas, la hora local
+con horario de verano de Chile y los feriados chilenos; las
+características de todas las filas salen de un único gather sobre esa
+tabla en lugar de extraer .dt.* y evaluar sin/cos fila por fila.
+"""
+
+import hashlib
+import json
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+# Zona horaria de las estaciones para la hora local y los feriados
+CALENDAR_TIMEZONE = 'America/Santiago'
+
+# Componentes de calendario (UTC) y sus alias en español -> atributo de pandas
+CALENDAR_FIELDS = {
+    'year': 'year', 'month': 'month', 'day': 'day', 'hour': 'hour',
+    'day_of_week': 'dayofweek', 'day_of_year': 'dayofyear',
+    'mes': 'month', 'hora': 'hour', 'dia_semana': 'dayofweek', 'dia_ano': 'dayofyear',
+}
+
+# Período de las características cíclicas <componente>_sin / <componente>_cos
+CYCLIC_PERIODS = {'month': 12, 'hour': 24, 'day': 31, 'day_of_week': 7, 'local_hour': 24}
+
+# Componentes en hora local (con horario de verano) y feriados
+LOCAL_FIELDS = ('local_hour', 'local_day_of_week', 'is_weekend', 'is_holiday')
+
+# Feriados de fecha fija (mes, día) vigentes en todo el período
+FIXED_HOLIDAYS = [(1, 1), (5, 1), (5, 21), (7, 16), (8, 15), (9, 18), (9, 19),
+                  (11, 1), (12, 8), (12, 25)]
+
+# Día Nacional de los Pueblos Indígenas (solsticio de invierno, desde 2021):
+# fechas fijadas por ley; los demás años se derivan del solsticio
+INDIGENOUS_PEOPLES_DAY = {2021: (6, 21), 2022: (6, 21), 2023: (6, 21), 2024: (6, 20),
+                          2025: (6, 20), 2026: (6, 21)}
+INDIGENOUS_PEOPLES_DAY_SINCE = 2021
+
+# Margen (minutos) a la medianoche local bajo el cual el día del solsticio
+# calculado se informa como dudoso (la fórmula media erra unos 10 minutos)
+SOLSTICE_MARGIN_MINUTES = 60
+
+# Horas máximas de una tabla (unos 20 años); rangos mayores se arman por tramos
+MAX_TABLE_HOURS = 24 * 366 * 20
+
+def _easter(year):
+    """Domingo de Pascua (algoritmo de Meeus/Jones/Butcher)"""
+    a, b, c = year % 19, year // 100, year % 100
+    d, e = b // 4, b % 4
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = c // 4, c % 4
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month = (h + l - 7 * m + 114) // 31
+    day = (h + l - 7 * m + 114) % 31 + 1
+    return pd.Timestamp(year, month, day)
+
+# Años cuyo solsticio cercano a la medianoche ya se advirtió
+_SOLSTICE_WARNED = set()
+
+def june_solstice(year, timezone=CALENDAR_TIMEZONE):
+    """
+    Instante del solsticio de junio en hora local
+    
+    Usa la expresión media de Meeus (Astronomical Algorithms, cap. 27) para
+    los años 2000-3000, con un error de unos 10 minutos.
+    
+    Args:
+        year (int): Año
+        timezone (str): Zona horaria
+        
+    Returns:
+        pd.Timestamp: Solsticio con zona horaria
+    """
+    y = (year - 2000) / 1000
+    jde = 2451716.56767 + 365241.62603 * y + 0.00325 * y ** 2 - 0.00888 * y ** 3 - 0.00030 * y ** 4
+    # Día juliano de efemérides a UTC (ΔT de unos 69 s)
+    utc = pd.Timestamp('2000-01-01 12:00', tz='UTC') + pd.Timedelta(days=jde - 2451545.0, seconds=-69)
+    return utc.tz_convert(timezone)
+
+def indigenous_peoples_day(year):
+    """
+    Día Nacional de los Pueblos Indígenas de un año (None antes de 2021)
+    
+    Los años con fecha fijada por ley salen de INDIGENOUS_PEOPLES_DAY; los
+    demás son el día local del solsticio de junio, con una advertencia si
+    el solsticio cae cerca de la medianoche.
+    """
+    if year < INDIGENOUS_PEOPLES_DAY_SINCE:
+        return None
+    if year in INDIGENOUS_PEOPLES_DAY:
+        return pd.Timestamp(year, *INDIGENOUS_PEOPLES_DAY[year])
+    
+    solstice = june_solstice(year)
+    minutes = solstice.hour * 60 + solstice.minute
+    if min(minutes, 24 * 60 - minutes) < SOLSTICE_MARGIN_MINUTES and year not in _SOLSTICE_WARNED:
+        _SOLSTICE_WARNED.add(year)
+        print(f"⚠ Solsticio de {year} cerca de la medianoche ({solstice:%Y-%m-%d %H:%M}): "
+              f"verificar la fecha del feriado de Pueblos Indígenas")
+    return pd.Timestamp(year, solstice.month, solstice.day)
+
+def holiday_table_hash():
+    """Hash de las tablas de feriados (cambia si se edita alguna fecha)"""
+    tables = [FIXED_HOLIDAYS, sorted(INDIGENOUS_PEOPLES_DAY.items()), INDIGENOUS_PEOPLES_DAY_SINCE]
+    return hashlib.sha1(json.dumps(tables).encode('utf-8')).hexdigest()[:16]
+
+def _moved_to_monday(date):
+    """Feriados trasladables (Ley 19.668): mar-jue al lunes anterior, viernes al siguiente"""
+    weekday = date.dayofweek
+    if weekday in (1, 2, 3):
+        return date - pd.Timedelta(days=weekday)
+    if weekday == 4:
+        return date + pd.Timedelta(days=3)
+    return date
+
+def chile_holidays(years):
+    """
+    Feriados nacionales de Chile de los años indicados
+    
+    Incluye los de fecha fija, Viernes y Sábado Santo, San Pedro y San
+    Pablo y Encuentro de Dos Mundos trasladados a lunes, Iglesias
+    Evangélicas (desde 2008) y Pueblos Indígenas (desde 2021). No incluye
+    feriados de elecciones ni los decretados para un año puntual.
+    
+    Args:
+        years (iterable): Años
+        
+    Returns:
+        np.ndarray: Fechas (datetime64[D]) ordenadas
+    """
+    dates = []
+    for year in years:
+        dates += [pd.Timestamp(year, month, day) for month, day in FIXED_HOLIDAYS]
+        easter = _easter(year)
+        dates += [easter - pd.Timedelta(days=2), easter - pd.Timedelta(days=1)]
+        dates.append(_moved_to_monday(pd.Timestamp(year, 6, 29)))
+        dates.append(_moved_to_monday(pd.Timestamp(year, 10, 12)))
+        if year >= 2008:
+            # Iglesias Evangélicas: martes al viernes anterior, miércoles al viernes siguiente
+            reformation = pd.Timestamp(year, 10, 31)
+            shift = {1: -4, 2: 2}.get(reformation.dayofweek, 0)
+            dates.append(reformation + pd.Timedelta(days=shift))
+        indigenous = indigenous_peoples_day(year)
+        if indigenous is not None:
+            dates.append(indigenous)
+    return np.unique(np.array(dates, dtype='datetime64[D]'))
+
+def hour_of_epoch(times):
+    """
+    Horas enteras desde epoch (UTC) de cada marca de tiempo
+    
+    Args:
+        times (array-like): Marcas de tiempo (los ingenuos se asumen UTC)
+        
+    Returns:
+        np.ndarray: int64; NaT queda como el mínimo int64
+    """
+    index = pd.DatetimeIndex(times)
+    if index.tz is not None:
+        index = index.tz_convert('UTC').tz_localize(None)
+    seconds = index.values.astype('datetime64[s]').view(np.int64)
+    hours = np.floor_divide(seconds, 3600)
+    return np.where(seconds == np.iinfo(np.int64).min, np.iinfo(np.int64).min, hours)
+
+def is_calendar_feature(name):
+    """Indicar si el nombre corresponde a una característica de calendario"""
+    if name in CALENDAR_FIELDS or name in LOCAL_FIELDS:
+        return True
+    return name.endswith(('_sin', '_cos')) and name[:-4] in CYCLIC_PERIODS
+
+@lru_cache(maxsize=32)
+def _calendar_table(first_hour, n_hours, names, timezone):
+    """Tabla (horas, características) float64 para un rango de horas"""
+    utc = pd.DatetimeIndex(pd.to_datetime((first_hour + np.arange(n_hours)) * 3600, unit='s', utc=True))
+    local = utc.tz_convert(timezone)
+    components = {}
+    
+    def _component(name):
+        if name not in components:
+            if name in CALENDAR_FIELDS:
+                components[name] = np.asarray(getattr(utc, CALENDAR_FIELDS[name]), dtype=np.float64)
+            elif name == 'local_hour':
+                components[name] = np.asarray(local.hour, dtype=np.float64)
+            elif name == 'local_day_of_week':
+                components[name] = np.asarray(local.dayofweek, dtype=np.float64)
+            elif name == 'is_weekend':
+                components[name] = (np.asarray(local.dayofweek) >= 5).astype(np.float64)
+            elif name == 'is_holiday':
+                local_days = local.tz_localize(None).values.astype('datetime64[D]')
+                holidays = chile_holidays(range(local.year.min(), local.year.max() + 1))
+                components[name] = np.isin(local_days, holidays).astype(np.float64)
+        return components[name]
+    
+    table = np.empty((n_hours, len(names)), dtype=np.float64)
+    for j, name in enumerate(names):
+        if name.endswith(('_sin', '_cos')) and name[:-4] in CYCLIC_PERIODS:
+            base = name[:-4]
+            angle = 2 * np.pi * _component(base) / CYCLIC_PERIODS[base]
+            table[:, j] = np.sin(angle) if name.endswith('_sin') else np.cos(angle)
+        else:
+            table[:, j] = _component(name)
+    table.setflags(write=False)
+    return table
+
+def calendar_features(times, names, timezone=CALENDAR_TIMEZONE):
+    """
+    Características de calendario de cada marca de tiempo por gather
+    
+    Elementos admitidos en names:
+        - UTC: year, month, day, hour, day_of_week, day_of_year (o mes,
+          hora, dia_semana, dia_ano)
+        - cíclicas: month_sin, hour_cos, day_sin, day_of_week_cos,
+          local_hour_sin, ...
+        - locales: local_hour y local_day_of_week (con horario de verano),
+          is_weekend, is_holiday (feriados de Chile)
+          
+    Args:
+        times (array-like): Marcas de tiempo (los ingenuos se asumen UTC)
+        names (list): Características en el orden de salida
+        timezone (str): Zona horaria de los componentes locales
+        
+    Returns:
+        np.ndarray: Matriz (filas, características) float64; NaN para NaT
+    """
+    names = tuple(names)
+    unknown = [name for name in names if not is_calendar_feature(name)]
+    if unknown:
+        raise ValueError(f"Características de calendario no reconocidas: {unknown}")
+    
+    hours = hour_of_epoch(times)
+    valid = hours != np.iinfo(np.int64).min
+    result = np.full((len(hours), len(names)), np.nan)
+    if not valid.any():
+        return result
+    
+    first_hour = int(hours[valid].min())
+    n_hours = int(hours[valid].max()) - first_hour + 1
+    if n_hours > MAX_TABLE_HOURS:
+        # Rango muy amplio: una tabla por tramo de MAX_TABLE_HOURS
+        block = np.where(valid, (hours - first_hour) // MAX_TABLE_HOURS, -1)
+        for b in np.unique(block[valid]):
+            rows = block == b
+            result[rows] = calendar_features(pd.to_datetime(hours[rows] * 3600, unit='s', utc=True),
+                                             names, timezone)
+        return result
+    
+    table = _calendar_table(first_hour, n_hours, names, timezone)
+    result[valid] = table[hours[valid] - first_hour]
+    return result
+
+def calendar_row(hour, names, timezone=CALENDAR_TIMEZONE):
+    """
+    Características de calendario de una sola hora
+    
+    Usa la tabla del bloque de 24 horas que la contiene, que queda en caché
+    para las actualizaciones siguientes.
+    
+    Args:
+        hour (int): Hora desde epoch (ver hour_of_epoch)
+        names (tuple): Características de calendario
+        timezone (str): Zona horaria de los componentes locales
+        
+    Returns:
+        np.ndarray: Fila de solo lectura con una columna por característica
+    """
+    start = hour - hour % 24
+    return _calendar_table(start, 24, tuple(names), timezone)[hour - start]
@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""
+Motor incremental de correlaciones entre parámetros de calidad del aire
+
+Mantiene sumas de co-momentos por par de parámetros (conteo, suma, suma de
+cuadrados y suma de productos sobre las filas donde ambos están presentes),
+de modo que la matriz de correlaciones se actualiza al llegar nuevas horas
+sin recalcular desde cero, y admite ventanas móviles (por ejemplo 30 días).
+"""
+
+from bisect import insort
+
+import numpy as np
+import pandas as pd
+
+# Índices de las sumas dentro del arreglo de estadísticas (4, k, k)
+_N, _SX, _SXX, _SXY = 0, 1, 2, 3
+
+# Filas procesadas por bloque al acumular estadísticas por hora
+_CHUNK_ROWS = 65536
+
+# Cada cuántas expiraciones se reconstruyen los totales desde los buckets
+_RESYNC_EVERY = 1024
+
+
+class CorrelationEngine:
+    """
+    Matriz de correlaciones de Pearson con conteos de solapamiento por par,
+    actualizable de forma incremental y con ventana móvil opcional
+    """
+
+    def __init__(self, columns, window=None):
+        """
+        Args:
+            columns (list): Parámetros (columnas del pivot) a correlacionar
+            window (str | pd.Timedelta): Ventana móvil, p. ej. '30D'.
+                None acumula todo el historial
+        """
+        self.columns = list(columns)
+        self.window = pd.Timedelta(window) if window is not None else None
+        k = len(self.columns)
+        self._totals = np.zeros((4, k, k))
+        self._shift = None
+        self._bucket_hours = []
+        self._buckets = {}
+        self._evictions = 0
+        self.last_hour = None
+
+    def _values(self, frame):
+        """Extraer los valores como float64 centrados en el desplazamiento fijo"""
+        values = frame.reindex(columns=self.columns).to_numpy(dtype=np.float64)
+        if self._shift is None:
+            # Centrar con las medias del primer bloque evita cancelación numérica
+            with np.errstate(invalid='ignore'):
+                shift = np.nanmean(values, axis=0) if len(values) else np.zeros(len(self.columns))
+            self._shift = np.nan_to_num(shift)
+        return values - self._shift
+
+    @staticmethod
+    def _block_stats(values):
+        """
+        Sumas de co-momentos de un bloque completo
+
+        Args:
+            values (np.ndarray): Matriz (filas, k) con NaN en faltantes
+
+        Returns:
+            np.ndarray: Arreglo (4, k, k) con n, Σx, Σx² y Σxy por par
+        """
+        mask = ~np.isnan(values)
+        m = mask.astype(np.float64)
+        x = np.where(mask, values, 0.0)
+        return np.stack([m.T @ m, x.T @ m, (x * x).T @ m, x.T @ x])
+
+    @staticmethod
+    def _hourly_stats(values, hours):
+        """
+        Sumas de co-momentos agrupadas por hora
+
+        Args:
+            values (np.ndarray): Matriz (filas, k) ordenada por hora
+            hours (np.ndarray): Hora (int64) de cada fila, no decreciente
+
+        Returns:
+            tuple: (horas únicas, arreglo (horas, 4, k, k))
+        """
+        mask = ~np.isnan(values)
+        m = mask.astype(np.float64)
+        x = np.where(mask, values, 0.0)
+        unique_hours = np.unique(hours)
+        k = values.shape[1]
+        stats = np.zeros((len(unique_hours), 4, k, k))
+
+        for lo in range(0, len(values), _CHUNK_ROWS):
+            hi = min(lo + _CHUNK_ROWS, len(values))
+            xc, mc = x[lo:hi], m[lo:hi]
+            per_row = np.stack([
+                np.einsum('ri,rj->rij', mc, mc),
+                np.einsum('ri,rj->rij', xc, mc),
+                np.einsum('ri,rj->rij', xc * xc, mc),
+                np.einsum('ri,rj->rij', xc, xc),
+            ], axis=1)
+            # Posición de cada fila del bloque dentro de las horas únicas
+            group = np.searchsorted(unique_hours, hours[lo:hi])
+            first = np.r_[0, np.flatnonzero(np.diff(group)) + 1]
+            stats[group[first]] += np.add.reduceat(per_row, first, axis=0)
+
+        return unique_hours, stats
+
+    def update(self, frame, time_col=None):
+        """
+        Incorporar nuevas filas del pivot (una fila por hora y ubicación)
+
+        Args:
+            frame (pd.DataFrame): Filas nuevas con una columna por parámetro
+            time_col (str): Columna de fecha; si es None se usa el índice.
+                Solo es obligatoria con ventana móvil
+
+        Returns:
+            CorrelationEngine: La propia instancia, para encadenar llamadas
+        """
+        if len(frame) == 0:
+            return self
+
+        values = self._values(frame)
+
+        if self.window is None:
+            self._totals += self._block_stats(values)
+            return self
+
+        times = frame[time_col] if time_col is not None else frame.index
+        hours = pd.DatetimeIndex(times).floor('h').values.astype('datetime64[ns]').view(np.int64)
+        order = np.argsort(hours, kind='stable')
+        unique_hours, stats = self._hourly_stats(values[order], hours[order])
+
+        for hour, hour_stats in zip(unique_hours.tolist(), stats):
+            if hour in self._buckets:
+                self._buckets[hour] += hour_stats
+            else:
+                self._buckets[hour] = hour_stats
+                insort(self._bucket_hours, hour)
+            self._totals += hour_stats
+
+        newest = self._bucket_hours[-1]
+        self.last_hour = pd.Timestamp(newest)
+        self._evict(newest)
+        return self
+
+    def _evict(self, newest):
+        """Descontar las horas que quedaron fuera de la ventana móvil"""
+        cutoff = newest - self.window.value
+        while self._bucket_hours and self._bucket_hours[0] <= cutoff:
+            hour = self._bucket_hours.pop(0)
+            self._totals -= self._buckets.pop(hour)
+            self._evictions += 1
+
+        if self._evictions >= _RESYNC_EVERY:
+            # Reconstruir desde los buckets acota el error de las restas sucesivas
+            self._totals = sum(self._buckets.values(), np.zeros_like(self._totals))
+            self._evictions = 0
+
+    def overlap_counts(self):
+        """
+        Conteos de observaciones completas por par de parámetros
+
+        Returns:
+            pd.DataFrame: Matriz de conteos (enteros)
+        """
+        counts = np.rint(self._totals[_N]).astype(np.int64)
+        return pd.DataFrame(counts, index=self.columns, columns=self.columns)
+
+    def correlation(self, min_periods=2):
+        """
+        Matriz de correlaciones de Pearson con observaciones completas por par
+
+        Args:
+            min_periods (int): Mínimo de observaciones compartidas por par
+
+        Returns:
+            pd.DataFrame: Matriz de correlaciones
+        """
+        n, sx, sxx, sxy = self._totals
+        sy, syy = sx.T, sxx.T
+        cov = n * sxy - sx * sy
+        var_x = n * sxx - sx * sx
+        var_y = n * syy - sy * sy
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            corr = cov / np.sqrt(var_x * var_y)
+        corr[(n < max(min_periods, 2)) | (var_x <= 0) | (var_y <= 0)] = np.nan
+        corr = np.clip(corr, -1.0, 1.0)
+
+        matrix = pd.DataFrame(corr, index=self.columns, columns=self.columns)
+        matrix.index.name = 'parameter_name'
+        return matrix
+
+    def save_state(self, filepath):
+        """
+        Guardar el estado acumulado para continuar en la próxima ejecución
+
+        Args:
+            filepath (str): Ruta del archivo .npz
+        """
+        hours = np.array(self._bucket_hours, dtype=np.int64)
+        buckets = (np.stack([self._buckets[h] for h in self._bucket_hours])
+                   if self._bucket_hours else np.zeros((0,) + self._totals.shape))
+        np.savez(
+            filepath,
+            columns=np.array(self.columns, dtype=object),
+            window=np.int64(self.window.value if self.window is not None else -1),
+            shift=self._shift if self._shift is not None else np.zeros(0),
+            totals=self._totals,
+            hours=hours,
+            buckets=buckets,
+        )
+        print(f"✓ Estado de correlaciones guardado en: {filepath}")
+
+    @classmethod
+    def load_state(cls, filepath):
+        """
+        Restaurar un motor guardado con save_state
+
+        Args:
+            filepath (str): Ruta del archivo .npz
+
+        Returns:
+            CorrelationEngine: Motor con los totales y buckets restaurados
+        """
+        state = np.load(filepath, allow_pickle=True)
+        window = int(state['window'])
+        engine = cls(state['columns'].tolist(), window=pd.Timedelta(window) if window >= 0 else None)
+        engine._shift = state['shift'] if state['shift'].size else None
+        engine._totals = state['totals']
+        engine._bucket_hours = state['hours'].tolist()
+        engine._buckets = dict(zip(engine._bucket_hours, state['buckets']))
+        if engine._bucket_hours:
+            engine.last_hour = pd.Timestamp(engine._bucket_hours[-1])
+        return engine
@@ -9,6 +9,51 @@ from datetime import datetime, timedelta
 import warnings
 warnings.filterwarnings('ignore')
 
+from correlation_engine import CorrelationEngine
+from air_quality_index import breakpoint_bins
+from output_writer import write_frame
+from dataset_profile import profile_dataset
+from measurement_store import MEASUREMENT_SCHEMAS, MeasurementStore, detect_schema, is_store_path
+from series_blocks import SeriesBlockStore, is_blocks_path
+
+# Errores de filtros Parquet que se resuelven leyendo sin empujar el tiempo
+# (pyarrow es opcional: sin él no hay lectura Parquet)
+try:
+    import pyarrow.parquet as pq
+    from pyarrow.lib import ArrowException
+    PARQUET_FILTER_ERRORS = (TypeError, ValueError, NotImplementedError, ArrowException)
+except ImportError:
+    pq = None
+    PARQUET_FILTER_ERRORS = (TypeError, ValueError, NotImplementedError)
+
+# Categorías EPA: (categoría, implicancias para la salud, recomendación)
+EPA_CATEGORIES = [
+    ("Buena",
+     "La calidad del aire se considera satisfactoria",
+     "Ninguna"),
+    ("Moderada",
+     "Algunas personas pueden ser sensibles",
+     "Personas sensibles deben considerar reducir actividades al aire libre"),
+    ("No saludable para grupos sensibles",
+     "Mayor probabilidad de efectos adversos",
+     "Personas con problemas cardíacos o pulmonares deben evitar actividades al aire libre"),
+    ("No saludable",
+     "Algunos miembros del público pueden experimentar efectos adversos",
+     "Evitar actividades al aire libre"),
+    ("Muy no saludable",
+     "Advertencia de emergencia sanitaria",
+     "Evitar TODAS las actividades al aire libre"),
+    ("Peligrosa",
+     "Advertencia de emergencia sanitaria",
+     "Evitar TODAS las actividades al aire libre"),
+]
+
+# Recomendación para grupos sensibles en gases irritantes
+EPA_SENSITIVE_RESPIRATORY = "Personas con problemas respiratorios deben evitar actividades al aire libre"
+
+# Intervalo de la tabla de cortes -> índice en EPA_CATEGORIES
+EPA_BIN_TO_CATEGORY = np.array([0, 0, 1, 2, 3, 4, 5], dtype=np.int8)
+
 def load_air_quality_data(filepath):
     """
     Cargar datos de calidad del aire desde CSV
@@ -168,16 +213,61 @@ def create_pivot_table(df, index_cols, columns_col, values_col, aggfunc='mean'):
         print(f"✗ Error al crear tabla pivot: {e}")
         return None
 
-def calculate_correlations(pivot_df, exclude_cols=None):
+def create_hourly_panel(df, time_col='date_from_utc', location_col='location_name',
+                        parameter_col='parameter_name', value_col='value'):
     """
-    Calcular matriz de correlaciones
+    Crear panel horario denso: una fila por hora y una columna por
+    combinación (ubicación, parámetro), con NaN donde no hay medición
+
+    Args:
+        df (pd.DataFrame): DataFrame en formato largo
+        time_col (str): Columna de fecha
+        location_col (str): Columna de ubicación
+        parameter_col (str): Columna de parámetro
+        value_col (str): Columna de valor
+
+    Returns:
+        pd.DataFrame: Panel con índice horario continuo y columnas
+            MultiIndex (ubicación, parámetro)
+    """
+    hours = pd.to_datetime(df[time_col]).dt.floor('h')
+    series_codes, series_keys = pd.MultiIndex.from_arrays(
+        [df[location_col], df[parameter_col]]
+    ).factorize()
+
+    start = hours.min()
+    index = pd.date_range(start, hours.max(), freq='h')
+    row = ((hours - start) // pd.Timedelta(hours=1)).to_numpy(dtype=np.int64)
+    values = df[value_col].to_numpy(dtype=np.float64)
+    valid = (series_codes >= 0) & ~np.isnan(values)
+
+    # Promedio de las mediciones que caen en la misma hora y serie
+    shape = (len(index), len(series_keys))
+    flat = np.ravel_multi_index((row[valid], series_codes[valid]), shape)
+    sums = np.bincount(flat, weights=values[valid], minlength=shape[0] * shape[1])
+    counts = np.bincount(flat, minlength=shape[0] * shape[1])
+    with np.errstate(invalid='ignore'):
+        panel_values = (sums / counts).reshape(shape)
+
+    columns = pd.MultiIndex.from_tuples(list(series_keys), names=[location_col, parameter_col])
+    panel = pd.DataFrame(panel_values, index=index, columns=columns).sort_index(axis=1)
+    panel.index.name = time_col
+
+    print(f"✓ Panel horario creado: {panel.shape[0]:,} horas x {panel.shape[1]} series")
+    return panel
+
+def calculate_correlations(pivot_df, exclude_cols=None, return_counts=False):
+    """
+    Calcular matriz de correlaciones con observaciones completas por par
     
     Args:
         pivot_df (pd.DataFrame): DataFrame pivot
         exclude_cols (list): Columnas a excluir del análisis
+        return_counts (bool): Devolver también los conteos de solapamiento
         
     Returns:
-        pd.DataFrame: Matriz de correlaciones
+        pd.DataFrame: Matriz de correlaciones, o tupla (matriz, conteos)
+            si return_counts es True
     """
     if exclude_cols is None:
         exclude_cols = []
@@ -186,80 +276,53 @@ def calculate_correlations(pivot_df, exclude_cols=None):
     numeric_cols = pivot_df.select_dtypes(include=[np.number]).columns
     analysis_cols = [col for col in numeric_cols if col not in exclude_cols]
     
-    correlation_matrix = pivot_df[analysis_cols].corr()
+    engine = CorrelationEngine(analysis_cols).update(pivot_df)
+    correlation_matrix = engine.correlation()
     
     print(f"✓ Matriz de correlaciones calculada: {correlation_matrix.shape}")
+    if return_counts:
+        return correlation_matrix, engine.overlap_counts()
     return correlation_matrix
 
+def get_air_quality_categories(values, parameter_name):
+    """
+    Clasificar un arreglo de valores en categorías EPA
+    
+    Args:
+        values (array-like): Valores del parámetro en la unidad canónica
+            (ver unit_normalization)
+        parameter_name (str): Nombre del parámetro
+        
+    Returns:
+        np.ndarray: Índice en EPA_CATEGORIES (int8), -1 si no se puede clasificar
+    """
+    bins = breakpoint_bins(values, parameter_name.lower())
+    return np.where(bins >= 0, EPA_BIN_TO_CATEGORY[bins], -1).astype(np.int8)
+
 def get_air_quality_index(value, parameter_name):
     """
     Calcular índice de calidad del aire basado en estándares EPA
     
     Args:
-        value (float): Valor del parámetro
+        value (float): Valor del parámetro en la unidad canónica (CO en ppm,
+            O3, NO2 y SO2 en ppb, material particulado en μg/m³)
         parameter_name (str): Nombre del parámetro
         
     Returns:
         dict: Diccionario con categoría y recomendaciones
     """
-    # Estándares EPA para PM2.5 (μg/m³)
-    if parameter_name.lower() == 'pm25':
-        if value <= 12.0:
-            category = "Buena"
-            health_implications = "La calidad del aire se considera satisfactoria"
-            cautionary_statement = "Ninguna"
-        elif value <= 35.4:
-            category = "Moderada"
-            health_implications = "Algunas personas pueden ser sensibles"
-            cautionary_statement = "Personas sensibles deben considerar reducir actividades al aire libre"
-        elif value <= 55.4:
-            category = "No saludable para grupos sensibles"
-            health_implications = "Mayor probabilidad de efectos adversos"
-            cautionary_statement = "Personas con problemas cardíacos o pulmonares deben evitar actividades al aire libre"
-        elif value <= 150.4:
-            category = "No saludable"
-            health_implications = "Algunos miembros del público pueden experimentar efectos adversos"
-            cautionary_statement = "Evitar actividades al aire libre"
-        elif value <= 250.4:
-            category = "Muy no saludable"
-            health_implications = "Advertencia de emergencia sanitaria"
-            cautionary_statement = "Evitar TODAS las actividades al aire libre"
-        else:
-            category = "Peligrosa"
-            health_implications = "Advertencia de emergencia sanitaria"
-            cautionary_statement = "Evitar TODAS las actividades al aire libre"
-    
-    # Estándares para O3 (ppm)
-    elif parameter_name.lower() == 'o3':
-        if value <= 0.054:
-            category = "Buena"
-            health_implications = "La calidad del aire se considera satisfactoria"
-            cautionary_statement = "Ninguna"
-        elif value <= 0.070:
-            category = "Moderada"
-            health_implications = "Algunas personas pueden ser sensibles"
-            cautionary_statement = "Personas sensibles deben considerar reducir actividades al aire libre"
-        elif value <= 0.085:
-            category = "No saludable para grupos sensibles"
-            health_implications = "Mayor probabilidad de efectos adversos"
-            cautionary_statement = "Personas con problemas respiratorios deben evitar actividades al aire libre"
-        elif value <= 0.105:
-            category = "No saludable"
-            health_implications = "Algunos miembros del público pueden experimentar efectos adversos"
-            cautionary_statement = "Evitar actividades al aire libre"
-        elif value <= 0.200:
-            category = "Muy no saludable"
-            health_implications = "Advertencia de emergencia sanitaria"
-            cautionary_statement = "Evitar TODAS las actividades al aire libre"
-        else:
-            category = "Peligrosa"
-            health_implications = "Advertencia de emergencia sanitaria"
-            cautionary_statement = "Evitar TODAS las actividades al aire libre"
+    code = get_air_quality_categories([value], parameter_name)[0]
+    
+    if code < 0:
+        return {
+            'category': "No clasificado",
+            'health_implications': "Estándares no disponibles para este parámetro",
+            'cautionary_statement': "Consultar autoridades locales"
+        }
     
-    else:
-        category = "No clasificado"
-        health_implications = "Estándares no disponibles para este parámetro"
-        cautionary_statement = "Consultar autoridades locales"
+    category, health_implications, cautionary_statement = EPA_CATEGORIES[code]
+    if code == 2 and parameter_name.lower() in ('o3', 'no2', 'so2'):
+        cautionary_statement = EPA_SENSITIVE_RESPIRATORY
     
     return {
         'category': category,
@@ -267,17 +330,26 @@ def get_air_quality_index(value, parameter_name):
         'cautionary_statement': cautionary_statement
     }
 
-def save_processed_data(df, filepath, description=""):
+def save_processed_data(df, filepath, description="", writer=None):
     """
     Guardar datos procesados
     
+    El archivo se escribe de forma atómica y el formato se deduce de la
+    extensión (.csv, .csv.gz, .parquet). Con un OutputWriter la escritura
+    se encola en segundo plano y se confirma en writer.flush().
+    
     Args:
         df (pd.DataFrame): DataFrame a guardar
         filepath (str): Ruta donde guardar el archivo
         description (str): Descripción de los datos
+        writer (OutputWriter): Escritor asíncrono opcional
     """
+    if writer is not None:
+        writer.write_frame(df, filepath, description=description)
+        return
+    
     try:
-        df.to_csv(filepath, index=False, encoding='utf-8')
+        write_frame(df, filepath)
         print(f"✓ Datos guardados en: {filepath}")
         if description:
             print(f"  Descripción: {description}")
@@ -288,20 +360,297 @@ def print_data_summary(df):
     """
     Imprimir resumen de los datos
     
+    Los conteos salen del perfil memorizado del dataset (ver profile_dataset).
+    
     Args:
         df (pd.DataFrame): DataFrame a resumir
     """
+    profile = profile_dataset(df)
+    
     print("\n=== RESUMEN DE DATOS ===")
-    print(f"Total de mediciones: {len(df):,}")
-    print(f"Parámetros disponibles: {', '.join(df['parameter_name'].unique())}")
-    print(f"Ubicaciones: {', '.join(df['location_name'].unique())}")
+    print(f"Total de mediciones: {profile.n_rows:,}")
+    print(f"Parámetros disponibles: {', '.join(profile.uniques['parameter_name'])}")
+    print(f"Ubicaciones: {', '.join(profile.uniques['location_name'])}")
     
-    if 'date_from_utc' in df.columns:
-        print(f"Rango temporal: {df['date_from_utc'].min()} a {df['date_from_utc'].max()}")
+    if profile.time_min is not None:
+        print(f"Rango temporal: {profile.time_min} a {profile.time_max}")
     
-    print(f"Sensores utilizados: {df['sensor_id'].nunique()}")
+    print(f"Sensores utilizados: {profile.nunique('sensor_id')}")
     
     print("\nMediciones por parámetro:")
-    param_counts = df['parameter_name'].value_counts()
+    param_counts = profile.counts['parameter_name']
     for param, count in param_counts.items():
-        print(f"  - {param}: {count:,} mediciones ({count/len(df)*100:.1f}%)")
+        print(f"  - {param}: {count:,} mediciones ({count/profile.n_rows*100:.1f}%)")
+
+# Filas por bloque al leer CSV (acota la memoria del filtrado)
+QUERY_CSV_CHUNK_ROWS = 200_000
+
+# Filas por grupo al escribir el almacén Parquet
+STORE_ROW_GROUP_ROWS = 50_000
+
+def _source_format(source):
+    """Formato de la fuente según su extensión"""
+    if is_store_path(source):
+        return 'sqlite'
+    if is_blocks_path(source):
+        return 'blocks'
+    if str(source).endswith(('.parquet', '.pq')):
+        return 'parquet'
+    return 'csv'
+
+def _source_columns(source):
+    """Leer solo el encabezado (CSV), el esquema (Parquet) o la tabla (SQLite)"""
+    if _source_format(source) == 'sqlite':
+        with MeasurementStore(source) as store:
+            return store.columns()
+    if _source_format(source) == 'blocks':
+        return list(MEASUREMENT_SCHEMAS['store'].values())
+    if _source_format(source) == 'parquet':
+        import pyarrow.parquet as pq
+        return pq.read_schema(source).names
+    return list(pd.read_csv(source, nrows=0).columns)
+
+def _to_utc(timestamp):
+    """Convertir un límite temporal a Timestamp UTC (los ingenuos se asumen UTC)"""
+    ts = pd.Timestamp(timestamp)
+    return ts.tz_localize('UTC') if ts.tzinfo is None else ts.tz_convert('UTC')
+
+class MeasurementQuery:
+    """
+    Consulta perezosa sobre el almacén de mediciones
+    
+    Cada método devuelve una nueva consulta con el predicado agregado; nada
+    se lee hasta collect(). El plan empuja los filtros de parámetro,
+    ubicación y tiempo, y la proyección de columnas, hasta el lector:
+    en SQLite se traducen a un WHERE sobre el índice compuesto, en Parquet
+    se usan las estadísticas de cada grupo de filas para saltar los que no
+    aplican, en archivos de bloques (.sbk) los mapas de zonas descartan
+    bloques completos, y en CSV solo se interpretan las columnas pedidas.
+    
+    Ejemplo:
+        query('data/mediciones.parquet').parameter('pm25').location('Indura') \\
+            .between('2024-01-01', '2024-06-01').resample('1h').collect()
+    """
+    
+    def __init__(self, source, schema=None):
+        """
+        Args:
+            source (str): Archivo de mediciones (.csv, .csv.gz, .parquet,
+                almacén .sqlite o bloques .sbk)
+            schema (str): Clave de MEASUREMENT_SCHEMAS; se detecta si es None
+        """
+        self.source = source
+        self.schema = schema
+        self.parameters = None
+        self.locations = None
+        self.start = None
+        self.end = None
+        self.projection = None
+        self.freq = None
+        self.how = 'mean'
+    
+    def _with(self, **changes):
+        """Copiar la consulta con los cambios indicados"""
+        new = MeasurementQuery.__new__(MeasurementQuery)
+        new.__dict__.update(self.__dict__)
+        new.__dict__.update(changes)
+        return new
+    
+    def parameter(self, *names):
+        """Filtrar por uno o más parámetros (sin distinguir mayúsculas)"""
+        return self._with(parameters=[str(n).lower() for n in names])
+    
+    def location(self, *names):
+        """Filtrar por una o más ubicaciones"""
+        return self._with(locations=list(names))
+    
+    def between(self, start=None, end=None):
+        """Filtrar por rango temporal [start, end) en UTC"""
+        return self._with(start=None if start is None else _to_utc(start),
+                          end=None if end is None else _to_utc(end))
+    
+    def columns(self, *names):
+        """Proyectar columnas adicionales a las del esquema"""
+        return self._with(projection=list(names))
+    
+    def resample(self, freq, how='mean'):
+        """Agregar cada serie (ubicación, parámetro) a la frecuencia indicada"""
+        return self._with(freq=freq, how=how)
+    
+    def plan(self):
+        """
+        Construir el plan de lectura
+        
+        Returns:
+            dict: Esquema, columnas a leer y predicados empujados al lector
+        """
+        schema_name = self.schema or detect_schema(_source_columns(self.source))
+        cols = MEASUREMENT_SCHEMAS[schema_name]
+        
+        if self.freq is not None:
+            read_columns = [cols['location'], cols['parameter'], cols['time'], cols['value']]
+        else:
+            read_columns = list(dict.fromkeys(list(cols.values()) + (self.projection or [])))
+        
+        predicates = []
+        if self.parameters is not None:
+            predicates.append((cols['parameter'], 'in', self.parameters))
+        if self.locations is not None:
+            predicates.append((cols['location'], 'in', self.locations))
+        if self.start is not None:
+            predicates.append((cols['time'], '>=', self.start))
+        if self.end is not None:
+            predicates.append((cols['time'], '<', self.end))
+        
+        return {
+            'source': self.source,
+            'format': _source_format(self.source),
+            'schema': schema_name,
+            'columns': read_columns,
+            'predicates': predicates,
+            'resample': self.freq,
+        }
+    
+    def explain(self):
+        """Describir el plan en texto"""
+        plan = self.plan()
+        lines = [f"Fuente: {plan['source']} ({plan['format']}, esquema {plan['schema']})",
+                 f"Columnas: {', '.join(plan['columns'])}"]
+        lines += [f"Filtro: {col} {op} {value}" for col, op, value in plan['predicates']]
+        if plan['resample']:
+            lines.append(f"Remuestreo: {plan['resample']} ({self.how})")
+        return "\n".join(lines)
+    
+    def _read_parquet(self, plan):
+        """Lectura Parquet con filtros por estadísticas de grupo de filas"""
+        filters = [(col, op, list(value) if op == 'in' else value)
+                   for col, op, value in plan['predicates']]
+        try:
+            return pd.read_parquet(plan['source'], columns=plan['columns'], filters=filters or None)
+        except PARQUET_FILTER_ERRORS:
+            # Columna temporal guardada como texto: el tiempo se filtra después
+            time_col = MEASUREMENT_SCHEMAS[plan['schema']]['time']
+            filters = [f for f in filters if f[0] != time_col]
+            return pd.read_parquet(plan['source'], columns=plan['columns'], filters=filters or None)
+    
+    def _read_sqlite(self, plan):
+        """Lectura desde el almacén SQLite usando su índice compuesto"""
+        with MeasurementStore(plan['source']) as store:
+            return store.select(self.parameters, self.locations, self.start, self.end,
+                                columns=plan['columns'])
+    
+    def _read_blocks(self, plan):
+        """Lectura por bloques decodificando solo los que pasan los mapas de zonas"""
+        store = SeriesBlockStore.load(plan['source'])
+        return store.scan(self.locations, self.parameters, self.start, self.end)
+    
+    def _read_csv(self, plan):
+        """Lectura CSV por bloques con proyección y filtrado por bloque"""
+        chunks = []
+        reader = pd.read_csv(plan['source'], usecols=plan['columns'], chunksize=QUERY_CSV_CHUNK_ROWS)
+        for chunk in reader:
+            chunk = self._apply_predicates(chunk, plan)
+            if len(chunk):
+                chunks.append(chunk)
+        if not chunks:
+            return pd.DataFrame(columns=plan['columns'])
+        return pd.concat(chunks, ignore_index=True)
+    
+    def _apply_predicates(self, df, plan):
+        """Aplicar en memoria los predicados (baratos primero, fechas al final)"""
+        cols = MEASUREMENT_SCHEMAS[plan['schema']]
+        mask = np.ones(len(df), dtype=bool)
+        
+        if self.parameters is not None:
+            mask &= df[cols['parameter']].astype(str).str.lower().isin(self.parameters).to_numpy()
+        if self.locations is not None:
+            mask &= df[cols['location']].isin(self.locations).to_numpy()
+        df = df[mask]
+        
+        if len(df) and not pd.api.types.is_datetime64_any_dtype(df[cols['time']]):
+            df = df.assign(**{cols['time']: pd.to_datetime(df[cols['time']], utc=True)})
+        if self.start is not None:
+            df = df[df[cols['time']] >= self.start]
+        if self.end is not None:
+            df = df[df[cols['time']] < self.end]
+        return df
+    
+    def collect(self):
+        """
+        Ejecutar el plan
+        
+        Returns:
+            pd.DataFrame: Mediciones filtradas; con resample, formato largo
+                (ubicación, parámetro, tiempo, valor) a la frecuencia pedida
+        """
+        plan = self.plan()
+        if plan['format'] == 'sqlite':
+            df = self._read_sqlite(plan)
+        elif plan['format'] == 'blocks':
+            df = self._read_blocks(plan)
+        elif plan['format'] == 'parquet':
+            df = self._apply_predicates(self._read_parquet(plan), plan)
+        else:
+            df = self._read_csv(plan)
+        df = df.reset_index(drop=True)
+        
+        if self.freq is None or df.empty:
+            return df
+        
+        cols = MEASUREMENT_SCHEMAS[plan['schema']]
+        keys = [cols['location'], cols['parameter']]
+        return (df.set_index(cols['time'])
+                  .groupby(keys)[cols['value']]
+                  .resample(self.freq).agg(self.how)
+                  .reset_index())
+
+def query(source, schema=None):
+    """
+    Iniciar una consulta perezosa sobre un archivo de mediciones
+    
+    Args:
+        source (str): Archivo .csv, .csv.gz, .parquet, almacén .sqlite o bloques .sbk
+        schema (str): 'santiago', 'localidades' o 'store'; se detecta si es None
+        
+    Returns:
+        MeasurementQuery: Consulta sin predicados
+    """
+    return MeasurementQuery(source, schema)
+
+def write_measurement_store(df, filepath, schema=None, row_group_rows=STORE_ROW_GROUP_ROWS):
+    """
+    Escribir mediciones como almacén Parquet apto para consultas
+    
+    Las filas se ordenan por (parámetro, ubicación, tiempo) y se escriben en
+    grupos de tamaño fijo, de modo que las estadísticas min/max de cada
+    grupo acotan bien los filtros de MeasurementQuery. Requiere pyarrow; sin
+    él solo se informa y no se escribe nada.
+    
+    Args:
+        df (pd.DataFrame): Mediciones en formato largo
+        filepath (str): Ruta .parquet destino
+        schema (str): Clave de MEASUREMENT_SCHEMAS; se detecta si es None
+        row_group_rows (int): Filas por grupo
+    """
+    if pq is None:
+        print("⚠ pyarrow no está instalado: no se escribe el almacén Parquet")
+        return
+    
+    cols = MEASUREMENT_SCHEMAS[schema or detect_schema(df.columns)]
+    store = df.copy()
+    store[cols['parameter']] = store[cols['parameter']].astype(str).str.lower()
+    store[cols['time']] = pd.to_datetime(store[cols['time']], utc=True)
+    store = store.sort_values([cols['parameter'], cols['location'], cols['time']], kind='stable')
+    
+    write_frame(store, filepath, row_group_size=row_group_rows)
+    
+    # Verificación de ida y vuelta sobre los metadatos: filas completas y
+    # tiempo como timestamp (si no, el filtro temporal no se empuja)
+    metadata = pq.read_metadata(filepath)
+    time_type = str(metadata.schema.to_arrow_schema().field(cols['time']).type)
+    if metadata.num_rows != len(store) or not time_type.startswith('timestamp'):
+        print(f"✗ Almacén de mediciones inconsistente: {metadata.num_rows:,} filas de {len(store):,}, "
+              f"tiempo {time_type}")
+        return
+    print(f"✓ Almacén de mediciones escrito: {filepath} ({len(store):,} filas, "
+          f"{metadata.num_row_groups} grupos)")
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Validación vectorizada de mediciones y banderas de calidad
+
+Cada regla (rango por parámetro, valores centinela, cobertura mínima,
+orden temporal por sensor, marcas de tiempo duplicadas y valores pegados)
+se evalúa sobre todo el lote con operaciones de NumPy y marca un bit de
+una columna uint8 de banderas. Las reglas de orden, duplicados y valores
+pegados comparten un único ordenamiento por (serie, tiempo).
+"""
+
+import numpy as np
+import pandas as pd
+
+# Bits de la columna de banderas de calidad
+FLAG_MISSING = 1           # Valor o marca de tiempo faltante
+FLAG_OUT_OF_RANGE = 2      # Fuera del rango físico del parámetro
+FLAG_SENTINEL = 4          # Valor centinela del proveedor (-999, 9999, ...)
+FLAG_LOW_COVERAGE = 8      # Cobertura del promedio bajo el umbral
+FLAG_TIME_ORDER = 16       # Llega después de una medición posterior de la misma serie
+FLAG_DUPLICATE_TIME = 32   # Repite la marca de tiempo de otra medición de la serie
+FLAG_STUCK = 64            # Parte de una racha de valores idénticos
+
+FLAG_NAMES = {
+    FLAG_MISSING: 'faltante',
+    FLAG_OUT_OF_RANGE: 'fuera_de_rango',
+    FLAG_SENTINEL: 'centinela',
+    FLAG_LOW_COVERAGE: 'baja_cobertura',
+    FLAG_TIME_ORDER: 'desorden_temporal',
+    FLAG_DUPLICATE_TIME: 'tiempo_duplicado',
+    FLAG_STUCK: 'valor_pegado',
+}
+
+# Banderas que excluyen una medición del modelado (el desorden solo se informa)
+REJECT_FLAGS = (FLAG_MISSING | FLAG_OUT_OF_RANGE | FLAG_SENTINEL | FLAG_LOW_COVERAGE
+                | FLAG_DUPLICATE_TIME | FLAG_STUCK)
+
+# Rango físico plausible por parámetro en unidad canónica (ver unit_normalization)
+VALID_RANGES = {
+    'pm25': (0.0, 1000.0),    # µg/m³
+    'pm10': (0.0, 2000.0),    # µg/m³
+    'o3': (0.0, 500.0),       # ppb
+    'no2': (0.0, 2000.0),     # ppb
+    'so2': (0.0, 2000.0),     # ppb
+    'co': (0.0, 100.0),       # ppm
+}
+
+# Valores usados por proveedores para indicar dato inválido
+SENTINEL_VALUES = (-999.0, -9999.0, 9999.0, 99999.0)
+
+# Cobertura mínima (%) y largo mínimo de racha de valores pegados (mediciones)
+MIN_COVERAGE = 75.0
+MIN_STUCK_RUN = 12
+
+def _series_codes(df, columns, known=None):
+    """
+    Código entero por serie combinando las columnas disponibles (NaN incluido)
+    
+    Args:
+        df (pd.DataFrame): Datos
+        columns (list): Columnas que identifican la serie
+        known (dict): Columna -> (códigos, únicos) ya factorizados
+    """
+    known = known or {}
+    codes = np.zeros(len(df), dtype=np.int64)
+    for col in columns:
+        if col is None or col not in df.columns:
+            continue
+        col_codes, uniques = known[col] if col in known else pd.factorize(df[col])
+        codes = codes * (len(uniques) + 1) + (col_codes + 1)
+    return pd.factorize(codes)[0]
+
+def _sort_by_series_time(series, times):
+    """Orden estable por (serie, tiempo) con un único argsort cuando la clave cabe en int64"""
+    valid = times[times != np.iinfo(np.int64).min]
+    t_min = valid.min() if len(valid) else 0
+    span = (valid.max() - t_min + 2) if len(valid) else 2
+    if (int(series.max(initial=0)) + 1) * int(span) >= 2 ** 62:
+        return np.lexsort((times, series))
+    # NaT queda como -1, antes de cualquier marca válida de su serie
+    offset = np.where(times == np.iinfo(np.int64).min, -1, times - t_min)
+    return np.argsort(series.astype(np.int64) * span + offset, kind='stable')
+
+def _epoch_seconds(times):
+    """Marcas de tiempo en segundos UTC; NaT queda como el mínimo int64"""
+    if not pd.api.types.is_datetime64_any_dtype(times):
+        times = pd.to_datetime(times, utc=True, errors='coerce')
+    return times.values.astype('datetime64[s]').view(np.int64)
+
+def validate_measurements(df, parameter_col='parameter_name', value_col='value',
+                          time_col='date_from_utc', location_col='location_name',
+                          sensor_col='sensor_id', coverage_col='coverage_percent',
+                          flag_col='quality_flags', min_coverage=MIN_COVERAGE,
+                          min_stuck_run=MIN_STUCK_RUN, ranges=None):
+    """
+    Validar un lote de mediciones y agregar la columna de banderas
+    
+    Las series se identifican por (sensor, ubicación, parámetro); cuando el
+    sensor falta, la serie queda definida por ubicación y parámetro. El
+    rango se evalúa sobre value_col, que debe estar en unidad canónica.
+    
+    Args:
+        df (pd.DataFrame): Mediciones en formato largo
+        parameter_col, value_col, time_col, location_col, sensor_col,
+            coverage_col (str): Columnas del esquema (las que falten se omiten)
+        flag_col (str): Columna de salida (uint8, bits FLAG_*)
+        min_coverage (float): Cobertura mínima en %
+        min_stuck_run (int): Largo mínimo de una racha de valores idénticos
+        ranges (dict): Rangos alternativos por parámetro
+        
+    Returns:
+        pd.DataFrame: DataFrame con la columna de banderas agregada
+    """
+    ranges = VALID_RANGES if ranges is None else ranges
+    n = len(df)
+    flags = np.zeros(n, dtype=np.uint8)
+    values = df[value_col].to_numpy(dtype=np.float64)
+    times = _epoch_seconds(df[time_col])
+    missing_time = times == np.iinfo(np.int64).min
+    
+    flags[np.isnan(values) | missing_time] |= FLAG_MISSING
+    flags[np.isin(values, SENTINEL_VALUES)] |= FLAG_SENTINEL
+    
+    # Rango por parámetro: límites reunidos por código de parámetro
+    param_codes, params = pd.factorize(df[parameter_col])
+    bounds = np.array([ranges.get(str(p).lower(), (-np.inf, np.inf)) for p in params]
+                      + [(-np.inf, np.inf)],
+                      dtype=np.float64).reshape(-1, 2)
+    lo, hi = bounds[param_codes, 0], bounds[param_codes, 1]
+    flags[(values < lo) | (values > hi)] |= FLAG_OUT_OF_RANGE
+    
+    if coverage_col in df.columns:
+        coverage = df[coverage_col].to_numpy(dtype=np.float64)
+        flags[coverage < min_coverage] |= FLAG_LOW_COVERAGE
+    
+    # Un solo ordenamiento estable por (serie, tiempo); los empates quedan en orden de llegada
+    series = _series_codes(df, [sensor_col, location_col, parameter_col],
+                           known={parameter_col: (param_codes, params)})
+    order = _sort_by_series_time(series, times)
+    s_sorted, t_sorted = series[order], times[order]
+    same_series = np.concatenate([[False], s_sorted[1:] == s_sorted[:-1]])
+    valid_time = ~missing_time[order]
+    
+    # Duplicados: misma serie y misma marca que la fila anterior
+    duplicate = same_series & np.concatenate([[False], t_sorted[1:] == t_sorted[:-1]]) & valid_time
+    flags[order[duplicate]] |= FLAG_DUPLICATE_TIME
+    
+    # Desorden: alguna medición posterior en tiempo llegó antes (mínimo del sufijo por serie)
+    arrival = order.astype(np.int64) + series[order].astype(np.int64) * (n + 1)
+    suffix_min = np.minimum.accumulate(arrival[::-1])[::-1]
+    later_min = np.concatenate([suffix_min[1:], [np.iinfo(np.int64).max]])
+    next_same = np.concatenate([same_series[1:], [False]])
+    late = next_same & (later_min < arrival) & valid_time
+    flags[order[late]] |= FLAG_TIME_ORDER
+    
+    # Valores pegados: rachas de valores idénticos consecutivos dentro de la serie
+    v_sorted = values[order]
+    repeat = same_series & (v_sorted == np.concatenate([[np.nan], v_sorted[:-1]]))
+    run_id = np.cumsum(~repeat) - 1
+    run_length = np.bincount(run_id)
+    flags[order[run_length[run_id] >= min_stuck_run]] |= FLAG_STUCK
+    
+    df[flag_col] = flags
+    print(f"✓ Validación completada: {int((flags & REJECT_FLAGS != 0).sum()):,} de {n:,} "
+          f"mediciones rechazadas")
+    return df
+
+def describe_flags(flags):
+    """
+    Contar mediciones por bandera
+    
+    Args:
+        flags (array-like): Columna de banderas
+        
+    Returns:
+        pd.Series: Conteo por nombre de bandera
+    """
+    flags = np.asarray(flags, dtype=np.uint8)
+    return pd.Series({name: int((flags & bit != 0).sum()) for bit, name in FLAG_NAMES.items()},
+                     name='mediciones')
+
+def valid_mask(flags, reject=REJECT_FLAGS):
+    """
+    Máscara de mediciones aptas para modelado
+    
+    Args:
+        flags (array-like): Columna de banderas
+        reject (int): Bits que descartan una medición
+        
+    Returns:
+        np.ndarray: True para las mediciones sin bits de rechazo
+    """
+    return (np.asarray(flags, dtype=np.uint8) & reject) == 0
+
+def filter_valid(df, flag_col='quality_flags', reject=REJECT_FLAGS):
+    """
+    Quitar las mediciones con bits de rechazo antes del modelado
+    
+    Args:
+        df (pd.DataFrame): Mediciones validadas
+        flag_col (str): Columna de banderas
+        reject (int): Bits que descartan una medición
+        
+    Returns:
+        pd.DataFrame: Solo las mediciones aptas
+    """
+    mask = valid_mask(df[flag_col], reject)
+    if not mask.all():
+        print(f"  ⚠ {int((~mask).sum()):,} mediciones excluidas por banderas de calidad")
+    return df[mask]
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+Perfil del dataset calculado una sola vez y compartido por los reportes
+
+Los resúmenes, reportes y estadísticas detalladas leen conteos, valores
+únicos, rangos temporales y estadísticas por parámetro desde un
+DatasetProfile. El perfil se construye factorizando cada columna una vez y
+se memoriza contra la huella del dataset (un hash vectorizado de todas las
+filas perfiladas), de modo que las llamadas siguientes no vuelven a
+factorizar ni agregar las columnas.
+"""
+
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+# Perfiles memorizados (los más recientes al final)
+_PROFILE_CACHE = OrderedDict()
+_PROFILE_CACHE_SIZE = 8
+
+def dataset_fingerprint(df, columns, sample_rows=None):
+    """
+    Huella del dataset restringida a las columnas perfiladas
+    
+    Combina el largo, los tipos y el hash de todas las filas, de modo que
+    editar cualquier valor la cambia. Agregar columnas no perfiladas no la
+    cambia.
+    
+    Args:
+        df (pd.DataFrame): Datos
+        columns (list): Columnas que forman parte del perfil
+        sample_rows (int): Filas equiespaciadas que se hashean (None = todas);
+            solo para huellas aproximadas que toleran datos viejos
+        
+    Returns:
+        str: Huella hexadecimal
+    """
+    cols = [c for c in columns if c in df.columns]
+    n = len(df)
+    if sample_rows and n > sample_rows:
+        step = max(n // sample_rows, 1)
+        sample = df[cols].iloc[np.unique(np.append(np.arange(0, n, step), n - 1))]
+    else:
+        sample = df[cols]
+    
+    digest = hashlib.sha1()
+    digest.update(repr((n, cols, [str(df[c].dtype) for c in cols])).encode('utf-8'))
+    digest.update(pd.util.hash_pandas_object(sample, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+def _first_positions(codes):
+    """Posición de la primera aparición de cada código de pd.factorize"""
+    # factorize numera en orden de aparición: una fila es la primera de su
+    # código cuando este supera a todos los códigos anteriores
+    previous_max = np.maximum.accumulate(np.concatenate([[-1], codes[:-1]]))
+    return np.flatnonzero(codes > previous_max)
+
+class DatasetProfile:
+    """
+    Conteos, valores únicos y estadísticas de un dataset en formato largo
+    
+    Atributos principales:
+        n_rows (int): Total de filas
+        uniques (dict): Columna -> valores únicos en orden de aparición
+        counts (dict): Columna -> pd.Series de conteos (como value_counts)
+        time_min, time_max: Rango de la columna temporal
+        parameter_stats (pd.DataFrame): count, mean, std, min, max por parámetro
+        location_parameters (dict): Ubicación -> parámetros medidos
+        location_first (pd.DataFrame): Primera fila de first_cols por ubicación
+    """
+    
+    def __init__(self, df, parameter_col, location_col, time_col=None, value_col=None,
+                 category_cols=(), first_cols=()):
+        """
+        Construir el perfil recorriendo cada columna una vez
+        
+        Args:
+            df (pd.DataFrame): Datos en formato largo
+            parameter_col (str): Columna de parámetro
+            location_col (str): Columna de ubicación
+            time_col (str): Columna temporal (opcional)
+            value_col (str): Columna de valores (opcional)
+            category_cols (tuple): Otras columnas a contar (ciudad, sensor...)
+            first_cols (tuple): Columnas cuyo primer valor por ubicación se guarda
+        """
+        self.parameter_col = parameter_col
+        self.location_col = location_col
+        self.n_rows = len(df)
+        self.uniques = {}
+        self.counts = {}
+        codes = {}
+        
+        for col in dict.fromkeys((parameter_col, location_col) + tuple(category_cols)):
+            if col not in df.columns:
+                continue
+            col_codes, col_uniques = pd.factorize(df[col])
+            n_unique = len(col_uniques)
+            col_counts = np.bincount(col_codes[col_codes >= 0], minlength=n_unique)
+            order = np.argsort(-col_counts, kind='stable')
+            
+            codes[col] = col_codes
+            self.uniques[col] = pd.Index(col_uniques, name=col)
+            self.counts[col] = pd.Series(col_counts[order], index=pd.Index(col_uniques[order], name=col),
+                                         name='count')
+        
+        self.time_min = self.time_max = None
+        if time_col is not None and time_col in df.columns:
+            self.time_min = df[time_col].min()
+            self.time_max = df[time_col].max()
+        
+        self.parameter_stats = None
+        if value_col is not None and value_col in df.columns and parameter_col in codes:
+            self.parameter_stats = self._parameter_stats(codes[parameter_col],
+                                                         df[value_col].to_numpy(dtype=np.float64))
+        
+        self.location_parameters = {}
+        self.location_first = None
+        if location_col in codes and parameter_col in codes:
+            self.location_parameters = self._location_parameters(codes[location_col],
+                                                                 codes[parameter_col])
+        if location_col in codes and first_cols:
+            first = _first_positions(codes[location_col])
+            cols = [c for c in first_cols if c in df.columns]
+            self.location_first = df[cols].iloc[first].set_axis(self.uniques[location_col], axis=0)
+    
+    def _parameter_stats(self, param_codes, values):
+        """count (filas), mean, std (ddof=1), min y max de cada parámetro"""
+        n_params = len(self.uniques[self.parameter_col])
+        valid = (param_codes >= 0) & ~np.isnan(values)
+        p, v = param_codes[valid], values[valid]
+        
+        n_valid = np.bincount(p, minlength=n_params)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.bincount(p, weights=v, minlength=n_params) / n_valid
+            sq = np.bincount(p, weights=(v - mean[p]) ** 2, minlength=n_params)
+            std = np.where(n_valid > 1, np.sqrt(sq / (n_valid - 1)), np.nan)
+        
+        # Mínimos y máximos por bloque tras ordenar por parámetro
+        minimum = np.full(n_params, np.nan)
+        maximum = np.full(n_params, np.nan)
+        present = np.flatnonzero(n_valid)
+        if len(present):
+            sorted_v = v[np.argsort(p, kind='stable')]
+            starts = np.concatenate([[0], np.cumsum(n_valid)[:-1]])[present]
+            minimum[present] = np.minimum.reduceat(sorted_v, starts)
+            maximum[present] = np.maximum.reduceat(sorted_v, starts)
+        
+        rows = np.bincount(param_codes[param_codes >= 0], minlength=n_params)
+        return pd.DataFrame({
+            'count': rows, 'mean': mean, 'std': std, 'min': minimum, 'max': maximum
+        }, index=self.uniques[self.parameter_col])
+    
+    def _location_parameters(self, loc_codes, param_codes):
+        """Parámetros de cada ubicación en orden de aparición"""
+        n_params = max(len(self.uniques[self.parameter_col]), 1)
+        both = (loc_codes >= 0) & (param_codes >= 0)
+        pairs = pd.unique(loc_codes[both].astype(np.int64) * n_params + param_codes[both])
+        
+        locations = self.uniques[self.location_col]
+        parameters = self.uniques[self.parameter_col]
+        result = {loc: [] for loc in locations}
+        for loc_code, param_code in zip(pairs // n_params, pairs % n_params):
+            result[locations[loc_code]].append(parameters[param_code])
+        return result
+    
+    def nunique(self, col):
+        """Cantidad de valores únicos no nulos de una columna perfilada (0 si no existe)"""
+        return len(self.uniques[col]) if col in self.uniques else 0
+    
+    def location_counts(self, location):
+        """Cantidad de filas de una ubicación"""
+        return int(self.counts[self.location_col].get(location, 0))
+
+def profile_dataset(df, parameter_col='parameter_name', location_col='location_name',
+                    time_col='date_from_utc', value_col='value', category_cols=('sensor_id',),
+                    first_cols=(), refresh=False):
+    """
+    Obtener el perfil del dataset, reutilizándolo si la huella no cambió
+    
+    Args:
+        df (pd.DataFrame): Datos en formato largo
+        parameter_col, location_col, time_col, value_col: Columnas del esquema
+        category_cols (tuple): Otras columnas a contar
+        first_cols (tuple): Columnas cuyo primer valor por ubicación se guarda
+        refresh (bool): Recalcular aunque exista un perfil memorizado
+            (útil tras modificar filas en el lugar)
+            
+    Returns:
+        DatasetProfile: Perfil del dataset
+    """
+    category_cols = tuple(category_cols)
+    first_cols = tuple(first_cols)
+    columns = [parameter_col, location_col, time_col, value_col, *category_cols, *first_cols]
+    key = (dataset_fingerprint(df, [c for c in columns if c is not None]),
+           parameter_col, location_col, time_col, value_col, category_cols, first_cols)
+    
+    if not refresh and key in _PROFILE_CACHE:
+        _PROFILE_CACHE.move_to_end(key)
+        return _PROFILE_CACHE[key]
+    
+    profile = DatasetProfile(df, parameter_col, location_col, time_col, value_col,
+                             category_cols, first_cols)
+    _PROFILE_CACHE[key] = profile
+    while len(_PROFILE_CACHE) > _PROFILE_CACHE_SIZE:
+        _PROFILE_CACHE.popitem(last=False)
+    return profile
@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+"""
+Almacén compartido de características para los modelos
+
+Los modelos declaran sus características como una lista de nombres
+(calendario, cíclicas, rezagos, medias móviles, diferencias y codificación
+de ubicación). La matriz se calcula una sola vez por combinación de datos y
+especificación, se guarda como float32 contiguo en disco y las llamadas
+siguientes la abren con np.load(mmap_mode='r') en lugar de recalcularla.
+La clave combina el hash completo de las columnas usadas con el hash de la
+especificación, la versión del código de características y el hash de las
+tablas de feriados. El directorio se limita a FEATURE_CACHE_MAX_BYTES y, al
+superarlo, se eliminan las matrices usadas hace más tiempo.
+"""
+
+import hashlib
+import json
+import os
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from dataset_profile import dataset_fingerprint
+from output_writer import atomic_write
+from calendar_features import calendar_features, holiday_table_hash, is_calendar_feature
+from series_features import LAG_TOLERANCE_S, WINDOW_PATTERN, is_window_feature, time_lags, window_features
+
+# Versión del cálculo de características: subirla al cambiar calendar_features
+# o series_features invalida las matrices guardadas en disco
+FEATURE_STORE_VERSION = 2
+
+# Directorio por defecto de las matrices en caché
+FEATURE_CACHE_DIR = 'data/feature_cache'
+
+# Matrices abiertas que se mantienen en memoria (las más recientes al final)
+FEATURE_MEMORY_ITEMS = 16
+
+# Tamaño máximo de la caché en disco (bytes)
+FEATURE_CACHE_MAX_BYTES = 2 * 1024 ** 3
+
+def feature_spec_hash(spec):
+    """Hash estable de una especificación de características"""
+    return hashlib.sha1(json.dumps(list(spec)).encode('utf-8')).hexdigest()[:16]
+
+def compute_features(df, spec, time_col, value_col=None, location_col=None, series_col=None,
+                     lag_mode='rows', lag_tolerance=LAG_TOLERANCE_S):
+    """
+    Calcular las características declaradas en spec
+    
+    Elementos admitidos en spec:
+        - calendario, cíclicas, hora local y feriados (ver
+          calendar_features): year, month, ..., hour_sin, local_hour,
+          is_holiday
+        - sobre value_col: lag_k, diff_k, ma_k / media_movil_k, std_k,
+          max_k, min_k (ver series_features); con series_col se calculan
+          por serie en orden temporal, si no en el orden de las filas. Con
+          lag_mode='hours', lag_k y diff_k usan el valor en t - k horas
+        - location_code: código entero de la ubicación (categorías ordenadas)
+        - onehot:<prefijo>: una columna <prefijo>_<ubicación> por ubicación
+        
+    Args:
+        df (pd.DataFrame): Datos (una fila por observación)
+        spec (list): Características en el orden de salida
+        time_col (str): Columna temporal
+        value_col (str): Columna de valores (para rezagos y ventanas)
+        location_col (str): Columna de ubicación
+        series_col (str): Columna que separa las series para rezagos y ventanas
+        lag_mode (str): 'rows' (k filas atrás) o 'hours' (t - k horas)
+        lag_tolerance (int): Tolerancia en segundos de los rezagos en horas
+        
+    Returns:
+        tuple: (matriz float32 C-contigua, nombres de columnas)
+    """
+    times = pd.DatetimeIndex(df[time_col])
+    columns, names = [], []
+    
+    # Todo el calendario sale de un único gather sobre la tabla por hora
+    calendar_names = [item for item in spec if is_calendar_feature(item)]
+    if calendar_names:
+        calendar_columns = dict(zip(calendar_names, calendar_features(times, calendar_names).T))
+    
+    # Todos los rezagos y ventanas en una sola pasada del núcleo por serie
+    window_names = [item for item in spec if is_window_feature(item)]
+    if window_names:
+        values = df[value_col].to_numpy(dtype=np.float64)
+        series = pd.factorize(df[series_col])[0] if series_col is not None else None
+        order_times = times.asi8 if series_col is not None else None
+        
+        # En modo horas los rezagos y diferencias se buscan por marca de tiempo
+        timed = [item for item in window_names
+                 if lag_mode == 'hours' and WINDOW_PATTERN.match(item).group(1) in ('lag', 'diff')]
+        by_rows = [item for item in window_names if item not in timed]
+        window_columns = dict(zip(by_rows, window_features(values, by_rows, series, order_times).T))
+        if timed:
+            seconds = times.values.astype('datetime64[s]').view(np.int64)
+            hours = [int(WINDOW_PATTERN.match(item).group(2)) for item in timed]
+            lagged = time_lags(values, seconds, [h * 3600 for h in hours], series, lag_tolerance)
+            for item, column in zip(timed, lagged.T):
+                window_columns[item] = values - column if item.startswith('diff_') else column
+    
+    for item in spec:
+        if is_calendar_feature(item):
+            columns.append(calendar_columns[item])
+            names.append(item)
+        elif is_window_feature(item):
+            columns.append(window_columns[item])
+            names.append(item)
+        elif item == 'location_code':
+            columns.append(df[location_col].astype('category').cat.codes.to_numpy(dtype=np.float64))
+            names.append(item)
+        elif item.startswith('onehot:'):
+            prefix = item.split(':', 1)[1]
+            codes, uniques = pd.factorize(df[location_col], sort=True)
+            for i, name in enumerate(uniques):
+                columns.append((codes == i).astype(np.float64))
+                names.append(f'{prefix}_{name}')
+        else:
+            raise ValueError(f"Característica no reconocida: {item}")
+    
+    matrix = np.empty((len(df), len(columns)), dtype=np.float32)
+    for j, column in enumerate(columns):
+        matrix[:, j] = column
+    return matrix, names
+
+class FeatureStore:
+    """
+    Caché en disco (y en memoria) de matrices de características
+    """
+    
+    def __init__(self, directory=FEATURE_CACHE_DIR, memory_items=FEATURE_MEMORY_ITEMS,
+                 max_bytes=FEATURE_CACHE_MAX_BYTES):
+        """
+        Args:
+            directory (str): Directorio de las matrices .npy
+            memory_items (int): Matrices abiertas que se conservan en memoria
+            max_bytes (int): Tamaño máximo de la caché en disco (None = sin límite)
+        """
+        self.directory = directory
+        self.memory_items = memory_items
+        self.max_bytes = max_bytes
+        self._memory = OrderedDict()
+    
+    def key(self, df, spec, time_col, value_col=None, location_col=None, series_col=None,
+            lag_mode='rows', lag_tolerance=LAG_TOLERANCE_S):
+        """Clave de la matriz: hash de las columnas usadas + hash de la especificación y del código"""
+        used = [c for c in (time_col, value_col, location_col, series_col) if c is not None]
+        # La clave persiste entre corridas: la huella hashea todas las filas para
+        # que un dato corregido no sirva características viejas
+        fingerprint = dataset_fingerprint(df, used)
+        spec_hash = feature_spec_hash([*spec, '|', time_col, value_col, location_col, series_col,
+                                       lag_mode, int(lag_tolerance), FEATURE_STORE_VERSION,
+                                       holiday_table_hash()])
+        return f'{fingerprint[:20]}_{spec_hash}'
+    
+    def _paths(self, key):
+        """Rutas de la matriz y de sus metadatos"""
+        return os.path.join(self.directory, f'{key}.npy'), os.path.join(self.directory, f'{key}.json')
+    
+    def get(self, df, spec, time_col, value_col=None, location_col=None, series_col=None,
+            lag_mode='rows', lag_tolerance=LAG_TOLERANCE_S):
+        """
+        Características de df según spec, desde la caché si ya se calcularon
+        
+        Args:
+            df (pd.DataFrame): Datos ya filtrados (parámetro, ubicación, rango)
+            spec (list): Características (ver compute_features)
+            time_col, value_col, location_col, series_col (str): Columnas usadas
+            lag_mode (str): 'rows' o 'hours' (ver compute_features)
+            lag_tolerance (int): Tolerancia en segundos de los rezagos en horas
+            
+        Returns:
+            pd.DataFrame: Matriz float32 con el índice de df (respaldada por
+                un mapa de memoria cuando viene del disco)
+        """
+        options = {'series_col': series_col, 'lag_mode': lag_mode, 'lag_tolerance': lag_tolerance}
+        key = self.key(df, spec, time_col, value_col, location_col, **options)
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            matrix, names = self._memory[key]
+        else:
+            matrix_path, meta_path = self._paths(key)
+            if os.path.exists(matrix_path) and os.path.exists(meta_path):
+                with open(meta_path, encoding='utf-8') as f:
+                    names = json.load(f)['columns']
+                matrix = np.load(matrix_path, mmap_mode='r')
+                self._touch(matrix_path)
+            else:
+                matrix, names = compute_features(df, spec, time_col, value_col, location_col, **options)
+                self._save(key, matrix, names)
+            self._memory[key] = (matrix, names)
+            while len(self._memory) > self.memory_items:
+                self._memory.popitem(last=False)
+        
+        return pd.DataFrame(matrix, index=df.index, columns=names, copy=False)
+    
+    def _save(self, key, matrix, names):
+        """Guardar la matriz y sus columnas (un fallo solo desactiva la caché en disco)"""
+        matrix_path, meta_path = self._paths(key)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            atomic_write(matrix_path, lambda f: np.save(f, matrix))
+            atomic_write(meta_path, lambda f: json.dump({'columns': names}, f, ensure_ascii=False),
+                         mode='w')
+        except OSError as e:
+            print(f"⚠ No se pudo guardar la caché de características: {e}")
+            return
+        self._prune()
+    
+    def _touch(self, path):
+        """Marcar una matriz como usada recientemente (orden de eliminación)"""
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+    
+    def _prune(self):
+        """Eliminar las matrices usadas hace más tiempo hasta caber en max_bytes"""
+        if self.max_bytes is None:
+            return
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.npy'):
+                path = os.path.join(self.directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            for stale in (path, path[:-len('.npy')] + '.json'):
+                try:
+                    os.remove(stale)
+                except OSError:
+                    pass
+            total -= size
+    
+    def clear(self):
+        """Vaciar la caché en memoria y en disco"""
+        self._memory.clear()
+        if os.path.isdir(self.directory):
+            for name in os.listdir(self.directory):
+                if name.endswith(('.npy', '.json')):
+                    os.remove(os.path.join(self.directory, name))
+
+# Almacén compartido por todos los modelos del proceso
+_DEFAULT_STORES = {}
+
+def get_feature_store(directory=FEATURE_CACHE_DIR):
+    """Almacén compartido para un directorio de caché"""
+    if directory not in _DEFAULT_STORES:
+        _DEFAULT_STORES[directory] = FeatureStore(directory)
+    return _DEFAULT_STORES[directory]
+
+def build_features(df, spec, time_col, value_col=None, location_col=None, series_col=None,
+                   lag_mode='rows', lag_tolerance=LAG_TOLERANCE_S, directory=FEATURE_CACHE_DIR):
+    """
+    Características de df desde el almacén compartido
+    
+    Args:
+        df (pd.DataFrame): Datos ya filtrados
+        spec (list): Características (ver compute_features)
+        time_col, value_col, location_col, series_col (str): Columnas usadas
+        lag_mode (str): 'rows' o 'hours' (ver compute_features)
+        lag_tolerance (int): Tolerancia en segundos de los rezagos en horas
+        directory (str): Directorio de la caché
+        
+    Returns:
+        pd.DataFrame: Matriz float32 con el índice de df
+    """
+    return get_feature_store(directory).get(df, spec, time_col, value_col, location_col, series_col,
+                                            lag_mode, lag_tolerance)
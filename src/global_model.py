@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+"""
+Modelo global sobre todas las series apiladas
+
+En lugar de un modelo por parámetro o por (parámetro, ubicación), un solo
+estimador aprende de todas las series (ubicación, parámetro) a la vez. Cada
+fila lleva, además del calendario y de los rezagos de su propia serie, el
+identificador de la serie, el código de la estación, sus metadatos (p. ej.
+coordenadas) y el parámetro. El objetivo se estandariza por serie con la
+media y la desviación del entrenamiento, de modo que series de distinta
+escala comparten los mismos árboles; los rezagos y ventanas se calculan
+sobre ese valor estandarizado y la predicción se devuelve en la unidad
+original. El costo de entrenar y servir crece con el total de filas y no
+con el número de series: un solo ajuste, un solo archivo y un solo predict
+para todas las estaciones.
+"""
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import HistGradientBoostingRegressor
+
+from feature_store import FEATURE_CACHE_DIR, build_features
+from series_features import WINDOW_PATTERN
+
+# Calendario y rezagos de la propia serie (ver feature_store.compute_features).
+# Las ventanas (ma_k, std_k, ...) se calculan sobre lag_1, de modo que
+# terminan en t - 1 y no incluyen el valor que se predice
+GLOBAL_CALENDAR_SPEC = ['hour_sin', 'hour_cos', 'day_of_week', 'month_sin', 'month_cos',
+                        'local_hour', 'is_holiday']
+GLOBAL_WINDOW_SPEC = ['lag_1', 'lag_2', 'lag_3', 'lag_24', 'ma_24', 'std_24']
+
+# Columnas de identidad de la serie que se agregan a la matriz
+GLOBAL_ID_COLUMNS = ['series_id', 'location_code', 'parameter_code', 'series_mean', 'series_std']
+
+# Ruta por defecto del modelo global
+GLOBAL_MODEL_PATH = 'models/modelo_global.pkl'
+
+def default_global_estimator():
+    """Estimador por defecto: boosting por histogramas (escala a millones de filas, admite NaN)"""
+    return HistGradientBoostingRegressor(max_iter=300, learning_rate=0.1, random_state=42)
+
+class GlobalSeriesModel:
+    """
+    Un solo modelo para todas las series (ubicación, parámetro)
+    
+    Atributos (después de fit):
+        series (pd.MultiIndex): Series vistas en el entrenamiento (el código es la posición)
+        stations (pd.DataFrame): Metadatos por estación (mediana de metadata_cols)
+        parameters (pd.Index): Parámetros vistos en el entrenamiento
+        feature_names (list): Columnas de la matriz
+    """
+    
+    def __init__(self, estimator=None, calendar_spec=GLOBAL_CALENDAR_SPEC, window_spec=GLOBAL_WINDOW_SPEC,
+                 metadata_cols=(), time_col='date_from_utc', value_col='value',
+                 location_col='location_name', parameter_col='parameter_name',
+                 feature_cache_dir=FEATURE_CACHE_DIR):
+        """
+        Args:
+            estimator: Estimador de scikit-learn (por defecto default_global_estimator)
+            calendar_spec (list): Características de calendario
+            window_spec (list): Rezagos (en horas) y ventanas que terminan en t - 1
+            metadata_cols (list): Columnas de metadatos de la estación (p. ej.
+                coordenadas); se ignoran las que no existan
+            time_col, value_col, location_col, parameter_col (str): Columnas
+            feature_cache_dir (str): Directorio del almacén de características
+        """
+        self.estimator = estimator if estimator is not None else default_global_estimator()
+        self.calendar_spec = list(calendar_spec)
+        self.window_spec = list(window_spec)
+        self.metadata_cols = list(metadata_cols)
+        self.time_col = time_col
+        self.value_col = value_col
+        self.location_col = location_col
+        self.parameter_col = parameter_col
+        self.feature_cache_dir = feature_cache_dir
+        self.feature_names = None
+    
+    def _series_codes(self, df):
+        """Código de serie de cada fila según las series del entrenamiento (-1 si es nueva)"""
+        keys = pd.MultiIndex.from_arrays([df[self.location_col], df[self.parameter_col]])
+        return self.series.get_indexer(keys)
+    
+    def _fit_identity(self, df):
+        """Series, estaciones, parámetros y estadísticas de escala del entrenamiento"""
+        codes, self.series = pd.MultiIndex.from_arrays(
+            [df[self.location_col], df[self.parameter_col]]
+        ).factorize()
+        values = df[self.value_col].to_numpy(dtype=np.float64)
+        valid = (codes >= 0) & ~np.isnan(values)
+        
+        # Media y desviación por serie en una pasada de bincount
+        n_series = len(self.series)
+        counts = np.bincount(codes[valid], minlength=n_series)
+        sums = np.bincount(codes[valid], weights=values[valid], minlength=n_series)
+        squares = np.bincount(codes[valid], weights=values[valid] ** 2, minlength=n_series)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            self.series_mean = sums / counts
+            variance = (squares - counts * self.series_mean ** 2) / np.maximum(counts - 1, 1)
+        self.series_std = np.sqrt(np.clip(variance, 0, None))
+        self.series_std[~(self.series_std > 0)] = 1.0
+        
+        # Escala por parámetro para series nuevas
+        params = df[self.parameter_col].to_numpy()[valid]
+        by_param = pd.Series(values[valid]).groupby(params)
+        self.parameter_scale = pd.DataFrame({'mean': by_param.mean(), 'std': by_param.std().fillna(1.0)})
+        self.parameter_scale.loc[~(self.parameter_scale['std'] > 0), 'std'] = 1.0
+        self.parameters = pd.Index(self.parameter_scale.index)
+        
+        # Metadatos por estación
+        self.metadata_cols = [col for col in self.metadata_cols if col in df.columns]
+        locations = pd.Index(self.series.get_level_values(0).unique()).sort_values()
+        if self.metadata_cols:
+            self.stations = df.groupby(self.location_col)[self.metadata_cols].median().reindex(locations)
+        else:
+            self.stations = pd.DataFrame(index=locations)
+    
+    def _scale(self, df, codes):
+        """Media y desviación de la serie de cada fila (las del parámetro si la serie es nueva)"""
+        known = codes >= 0
+        mean = np.where(known, self.series_mean[np.maximum(codes, 0)], np.nan)
+        std = np.where(known, self.series_std[np.maximum(codes, 0)], np.nan)
+        if not known.all():
+            scale = self.parameter_scale.reindex(df[self.parameter_col].to_numpy()[~known])
+            mean[~known] = scale['mean'].to_numpy()
+            std[~known] = scale['std'].fillna(1.0).to_numpy()
+        return mean, std
+    
+    def features(self, df):
+        """
+        Matriz de características de todas las filas
+        
+        Args:
+            df (pd.DataFrame): Mediciones en formato largo (varias series)
+            
+        Returns:
+            tuple: (matriz float32 (filas, características), códigos de serie)
+        """
+        codes = self._series_codes(df)
+        
+        # Rezagos y ventanas sobre el valor estandarizado de cada serie, separados
+        # por las series presentes en df (incluidas las nuevas)
+        mean, std = self._scale(df, codes)
+        window_series = pd.MultiIndex.from_arrays([df[self.location_col], df[self.parameter_col]]).factorize()[0]
+        data = pd.DataFrame({
+            'time': df[self.time_col].to_numpy(),
+            'scaled': (df[self.value_col].to_numpy(dtype=np.float64) - mean) / std,
+            'series_key': window_series,
+        })
+        
+        # Calendario y rezagos en t - k horas desde el almacén compartido
+        lags = [item for item in self.window_spec if WINDOW_PATTERN.match(item).group(1) == 'lag']
+        windows = [item for item in self.window_spec if item not in lags]
+        base_spec = self.calendar_spec + list(dict.fromkeys(lags + (['lag_1'] if windows else [])))
+        temporal = build_features(data, base_spec, 'time', 'scaled', series_col='series_key',
+                                  lag_mode='hours', directory=self.feature_cache_dir)
+        
+        # Ventanas sobre lag_1: terminan en t - 1 y no ven el valor objetivo
+        if windows:
+            previous = data[['time', 'series_key']].assign(previous=temporal['lag_1'].to_numpy(dtype=np.float64))
+            temporal = pd.concat([temporal, build_features(previous, windows, 'time', 'previous',
+                                                           series_col='series_key',
+                                                           directory=self.feature_cache_dir)], axis=1)
+        spec = self.calendar_spec + self.window_spec
+        
+        # Identidad de la serie, estación, parámetro y metadatos de la estación
+        location_codes = self.stations.index.get_indexer(df[self.location_col])
+        columns = [codes, location_codes, self.parameters.get_indexer(df[self.parameter_col]), mean, std]
+        metadata = self.stations.to_numpy(dtype=np.float64)
+        for j in range(len(self.metadata_cols)):
+            columns.append(np.where(location_codes >= 0, metadata[np.maximum(location_codes, 0), j], np.nan))
+        
+        self.feature_names = spec + GLOBAL_ID_COLUMNS + self.metadata_cols
+        matrix = np.empty((len(df), len(self.feature_names)), dtype=np.float32)
+        matrix[:, :len(spec)] = temporal[spec].to_numpy()
+        for j, column in enumerate(columns):
+            matrix[:, len(spec) + j] = column
+        return matrix, codes
+    
+    def fit(self, df):
+        """
+        Entrenar el modelo global con todas las series de df
+        
+        Args:
+            df (pd.DataFrame): Mediciones en formato largo
+            
+        Returns:
+            GlobalSeriesModel: self
+        """
+        self._fit_identity(df)
+        X, codes = self.features(df)
+        mean, std = self._scale(df, codes)
+        y = (df[self.value_col].to_numpy(dtype=np.float64) - mean) / std
+        valid = ~np.isnan(y)
+        self.estimator.fit(X[valid], y[valid])
+        print(f"✓ Modelo global entrenado: {int(valid.sum()):,} filas, {len(self.series)} series, "
+              f"{len(self.stations)} estaciones, {len(self.parameters)} parámetros")
+        return self
+    
+    def predict(self, df):
+        """
+        Predecir todas las filas de df en la unidad original
+        
+        Args:
+            df (pd.DataFrame): Mediciones en formato largo (con historia
+                suficiente para los rezagos)
+                
+        Returns:
+            np.ndarray: Predicción por fila
+        """
+        X, codes = self.features(df)
+        mean, std = self._scale(df, codes)
+        return self.estimator.predict(X) * std + mean
+    
+    def evaluate(self, df, mask=None):
+        """
+        Métricas por parámetro sobre las filas seleccionadas
+        
+        Las características se calculan sobre todo df para que los rezagos de
+        las filas evaluadas usen la historia previa.
+        
+        Args:
+            df (pd.DataFrame): Mediciones en formato largo
+            mask (array-like): Filas a evaluar (por defecto todas)
+            
+        Returns:
+            pd.DataFrame: rmse, mae, r2 y filas por parámetro
+        """
+        predictions = self.predict(df)
+        actual = df[self.value_col].to_numpy(dtype=np.float64)
+        selected = ~np.isnan(actual)
+        if mask is not None:
+            selected &= np.asarray(mask, dtype=bool)
+        
+        rows = []
+        params = df[self.parameter_col].to_numpy()
+        for param in pd.unique(params[selected]):
+            rows_param = selected & (params == param)
+            errors = actual[rows_param] - predictions[rows_param]
+            ss_tot = ((actual[rows_param] - actual[rows_param].mean()) ** 2).sum()
+            rows.append({
+                'parameter': param,
+                'rmse': float(np.sqrt(np.mean(errors ** 2))),
+                'mae': float(np.mean(np.abs(errors))),
+                'r2': 1 - float((errors ** 2).sum() / ss_tot) if ss_tot > 0 else np.nan,
+                'rows': int(rows_param.sum()),
+            })
+            print(f"  ✓ {param}: R²={rows[-1]['r2']:.3f}, RMSE={rows[-1]['rmse']:.3f}, "
+                  f"MAE={rows[-1]['mae']:.3f}")
+        return pd.DataFrame(rows)
+    
+    def save(self, filepath=GLOBAL_MODEL_PATH):
+        """Guardar el modelo global en un solo archivo"""
+        try:
+            joblib.dump(self, filepath)
+            print(f"✓ Modelo global guardado en: {filepath}")
+        except Exception as e:
+            print(f"✗ Error al guardar modelo global: {e}")
+    
+    @staticmethod
+    def load(filepath=GLOBAL_MODEL_PATH):
+        """Cargar un modelo global guardado (None si falla)"""
+        try:
+            model = joblib.load(filepath)
+            print(f"✓ Modelo global cargado desde: {filepath}")
+            return model
+        except Exception as e:
+            print(f"✗ Error al cargar modelo global: {e}")
+            return None
@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+Búsqueda de hiperparámetros por successive halving con presupuesto
+
+En lugar de validar cada punto de la grilla con todos los datos, se toma
+una muestra de configuraciones (más las mejores de corridas anteriores) y
+se evalúan por rondas: en cada ronda todas las sobrevivientes se validan
+con una fracción creciente de las filas más recientes y solo el mejor
+1/factor pasa a la siguiente, hasta que la última ronda usa todas las
+filas. La validación cruzada es temporal (TimeSeriesSplit sobre las filas
+ordenadas por tiempo): cada fold valida con datos posteriores a los de su
+entrenamiento, sin mezclar el futuro en el ajuste. El número de
+configuraciones se elige para que el total de ajustes quepa en max_fits y
+la búsqueda se corta al agotar max_seconds. Los mejores parámetros se
+guardan en un archivo JSON de priors que la siguiente corrida evalúa
+primero (arranque en caliente).
+"""
+
+import itertools
+import json
+import math
+import os
+import time
+from datetime import datetime
+
+import numpy as np
+from sklearn.base import clone
+from sklearn.model_selection import TimeSeriesSplit, cross_val_score
+
+from output_writer import atomic_write
+
+# Archivo por defecto de los priors (mejores parámetros por modelo y parámetro)
+SEARCH_PRIORS_PATH = 'models/hyperparameter_priors.json'
+
+# Presupuesto por defecto: ajustes totales (folds incluidos) y segundos
+DEFAULT_MAX_FITS = 60
+DEFAULT_MAX_SECONDS = None
+
+# Fracción de configuraciones que sobrevive cada ronda (1/factor)
+HALVING_FACTOR = 3
+
+# Filas mínimas con las que se valida una configuración en la primera ronda
+MIN_RESOURCE_ROWS = 500
+
+# Entradas de historial que se conservan por clave en el archivo de priors
+PRIOR_HISTORY = 3
+
+def _plain(value):
+    """Valor de numpy a tipo nativo (para JSON y para comparar configuraciones)"""
+    return value.item() if isinstance(value, np.generic) else value
+
+def load_priors(key, path=SEARCH_PRIORS_PATH):
+    """
+    Mejores parámetros guardados para una clave, del mejor al peor
+    
+    Args:
+        key (str): Clave (p. ej. 'pm25:RandomForest')
+        path (str): Archivo de priors
+        
+    Returns:
+        list: Diccionarios de parámetros (vacía si no hay priors)
+    """
+    if not os.path.exists(path):
+        return []
+    try:
+        with open(path, encoding='utf-8') as f:
+            entries = json.load(f).get(key, [])
+    except (OSError, ValueError) as e:
+        print(f"⚠ No se pudieron leer los priors de hiperparámetros: {e}")
+        return []
+    return [entry['params'] for entry in sorted(entries, key=lambda entry: -entry['score'])]
+
+def save_prior(key, params, score, path=SEARCH_PRIORS_PATH):
+    """
+    Agregar una configuración al historial de priors de una clave
+    
+    Se conservan las PRIOR_HISTORY mejores configuraciones distintas.
+    
+    Args:
+        key (str): Clave (p. ej. 'pm25:RandomForest')
+        params (dict): Parámetros
+        score (float): Puntaje de validación
+        path (str): Archivo de priors
+    """
+    data = {}
+    if os.path.exists(path):
+        try:
+            with open(path, encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = {}
+    
+    params = {name: _plain(value) for name, value in params.items()}
+    entries = [entry for entry in data.get(key, []) if entry['params'] != params]
+    entries.append({'params': params, 'score': float(score),
+                    'updated': datetime.now().isoformat(timespec='seconds')})
+    data[key] = sorted(entries, key=lambda entry: -entry['score'])[:PRIOR_HISTORY]
+    try:
+        atomic_write(path, lambda f: json.dump(data, f, indent=2, ensure_ascii=False), mode='w')
+    except OSError as e:
+        print(f"⚠ No se pudieron guardar los priors de hiperparámetros: {e}")
+
+def sample_candidates(space, n_candidates, priors=(), random_state=42):
+    """
+    Configuraciones a evaluar: primero los priors válidos, luego puntos al
+    azar de la grilla sin repetir
+    
+    Args:
+        space (dict): {parámetro: lista de valores}
+        n_candidates (int): Configuraciones en total
+        priors (list): Configuraciones de corridas anteriores
+        random_state (int): Semilla del muestreo
+        
+    Returns:
+        list: Diccionarios de parámetros
+    """
+    names = list(space)
+    grid = [dict(zip(names, values)) for values in itertools.product(*(space[name] for name in names))]
+    candidates = []
+    for prior in priors:
+        # Un prior solo se usa si sus valores caben en el espacio actual
+        params = {name: prior[name] for name in names if name in prior}
+        if len(params) == len(names) and all(params[name] in space[name] for name in names) \
+                and params not in candidates:
+            candidates.append(params)
+    
+    rng = np.random.default_rng(random_state)
+    for i in rng.permutation(len(grid)):
+        if len(candidates) >= n_candidates:
+            break
+        if grid[i] not in candidates:
+            candidates.append(grid[i])
+    return candidates[:max(n_candidates, 1)]
+
+def halving_schedule(n_candidates, n_rows, cv, factor=HALVING_FACTOR, min_rows=MIN_RESOURCE_ROWS):
+    """
+    Rondas (configuraciones, filas) de successive halving
+    
+    Returns:
+        list: Tuplas (configuraciones evaluadas, filas usadas) por ronda; la
+            última ronda usa todas las filas
+    """
+    rounds = max(math.ceil(math.log(max(n_candidates, 1), factor)), 0) + 1
+    schedule = []
+    for r in range(rounds):
+        candidates = max(math.ceil(n_candidates / factor ** r), 1)
+        rows = n_rows if r == rounds - 1 else max(n_rows // factor ** (rounds - 1 - r), min(min_rows, n_rows))
+        schedule.append((candidates, min(max(rows, cv * 2), n_rows)))
+        if candidates == 1:
+            break
+    schedule[-1] = (schedule[-1][0], n_rows)
+    return schedule
+
+def _budget_candidates(space_size, n_rows, cv, max_fits, factor, min_rows):
+    """Mayor número de configuraciones cuyo calendario cabe en max_fits"""
+    best = 1
+    for n in range(1, space_size + 1):
+        fits = cv * sum(candidates for candidates, _ in halving_schedule(n, n_rows, cv, factor, min_rows))
+        if fits > max_fits:
+            break
+        best = n
+    return best
+
+class SuccessiveHalvingSearch:
+    """
+    Búsqueda de hiperparámetros por successive halving con presupuesto de
+    ajustes y de tiempo
+    
+    Atributos (después de fit):
+        best_params_ (dict): Mejor configuración
+        best_score_ (float): Su puntaje de validación cruzada
+        best_estimator_: Estimador reentrenado con todas las filas
+        history_ (list): Rondas evaluadas (filas, configuraciones, puntajes)
+        n_fits_ (int): Ajustes realizados (folds incluidos)
+    """
+    
+    def __init__(self, estimator, space, max_fits=DEFAULT_MAX_FITS, max_seconds=DEFAULT_MAX_SECONDS,
+                 factor=HALVING_FACTOR, cv=3, scoring='r2', priors=(), min_rows=MIN_RESOURCE_ROWS,
+                 random_state=42, n_jobs=-1):
+        """
+        Args:
+            estimator: Estimador base de scikit-learn
+            space (dict): {parámetro: lista de valores}
+            max_fits (int): Ajustes máximos en total (folds incluidos)
+            max_seconds (float): Tiempo máximo de la búsqueda (None = sin límite)
+            factor (int): Se conserva el mejor 1/factor en cada ronda
+            cv (int): Folds de la validación cruzada
+            scoring (str): Métrica de scikit-learn (mayor es mejor)
+            priors (list): Configuraciones de corridas anteriores (se evalúan primero)
+            min_rows (int): Filas mínimas de la primera ronda
+            random_state (int): Semilla del muestreo de configuraciones
+            n_jobs (int): Procesos de cross_val_score
+        """
+        self.estimator = estimator
+        self.space = space
+        self.max_fits = max_fits
+        self.max_seconds = max_seconds
+        self.factor = factor
+        self.cv = cv
+        self.scoring = scoring
+        self.priors = list(priors)
+        self.min_rows = min_rows
+        self.random_state = random_state
+        self.n_jobs = n_jobs
+    
+    def _score(self, params, X, y, rows):
+        """Puntaje medio de validación cruzada temporal sobre rows (en orden temporal)"""
+        model = clone(self.estimator).set_params(**params)
+        folds = TimeSeriesSplit(n_splits=self.cv)
+        scores = cross_val_score(model, X[rows], y[rows], cv=folds, scoring=self.scoring, n_jobs=self.n_jobs)
+        self.n_fits_ += self.cv
+        return float(np.mean(scores))
+    
+    def fit(self, X, y, times=None):
+        """
+        Buscar la mejor configuración y reentrenarla con todas las filas
+        
+        Args:
+            X (np.ndarray o sparse): Características
+            y (np.ndarray): Variable objetivo
+            times (np.ndarray): Marca de tiempo numérica por fila (None = las
+                filas ya están en orden temporal)
+            
+        Returns:
+            SuccessiveHalvingSearch: self
+        """
+        start = time.perf_counter()
+        n_rows = X.shape[0]
+        space_size = math.prod(len(values) for values in self.space.values())
+        n_candidates = _budget_candidates(space_size, n_rows, self.cv, self.max_fits, self.factor,
+                                          self.min_rows)
+        candidates = sample_candidates(self.space, n_candidates, self.priors, self.random_state)
+        schedule = halving_schedule(len(candidates), n_rows, self.cv, self.factor, self.min_rows)
+        order = np.arange(n_rows) if times is None else np.argsort(np.asarray(times), kind='stable')
+        
+        self.history_ = []
+        self.n_fits_ = 0
+        best_params, best_score = candidates[0], -np.inf
+        for keep, rows in schedule:
+            candidates = candidates[:keep]
+            # Las filas más recientes, en orden temporal
+            subset = order[n_rows - rows:]
+            scores = []
+            for params in candidates:
+                if self.max_seconds is not None and time.perf_counter() - start > self.max_seconds:
+                    break
+                scores.append(self._score(params, X, y, subset))
+            if len(scores) < keep:
+                print(f"⚠ Presupuesto de tiempo agotado ({self.max_seconds} s)")
+            if not scores:
+                break
+            
+            # Las configuraciones evaluadas pasan ordenadas de mejor a peor
+            ranking = np.argsort(scores)[::-1]
+            candidates = [candidates[i] for i in ranking]
+            best_params, best_score = candidates[0], scores[ranking[0]]
+            self.history_.append({'rows': rows, 'candidates': len(scores),
+                                  'best_score': best_score, 'scores': sorted(scores, reverse=True)})
+            print(f"  Ronda {len(self.history_)}: {len(scores)} configuraciones con {rows:,} filas, "
+                  f"mejor score {best_score:.3f}")
+            if len(scores) < keep:
+                break
+        
+        self.best_params_ = {name: _plain(value) for name, value in best_params.items()}
+        self.best_score_ = best_score
+        self.best_estimator_ = clone(self.estimator).set_params(**self.best_params_).fit(X, y)
+        self.n_fits_ += 1
+        self.elapsed_ = time.perf_counter() - start
+        print(f"✓ Búsqueda completada: {self.n_fits_} ajustes en {self.elapsed_:.1f} s")
+        return self
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Reentrenamiento incremental de ensambles de árboles con warm start
+
+En lugar de reentrenar todo el ensamble con la historia completa cuando
+llegan datos nuevos, se agregan árboles entrenados solo con las filas
+recientes (warm_start de scikit-learn):
+
+    - Random Forest: los árboles son independientes, así que después de
+      agregar los nuevos se retiran los más antiguos y el ensamble conserva
+      su tamaño, desplazándose hacia las condiciones recientes.
+    - Gradient Boosting: cada etapa corrige los residuos de las anteriores
+      y no se puede retirar la primera sin invalidar el resto. Las etapas
+      nuevas se ajustan a los residuos sobre los datos recientes y, cuando
+      el ensamble supera max_stages, se pide un reentrenamiento completo.
+"""
+
+import numbers
+
+from sklearn.ensemble import ExtraTreesRegressor, GradientBoostingRegressor, RandomForestRegressor
+
+# Bosques de árboles independientes (se pueden retirar árboles)
+FOREST_TYPES = (RandomForestRegressor, ExtraTreesRegressor)
+
+# Fracción del ensamble que se renueva en cada reentrenamiento incremental
+REFIT_FRACTION = 0.2
+
+# Etapas de Gradient Boosting (relativas al tamaño original) antes de pedir
+# un reentrenamiento completo
+MAX_BOOSTING_GROWTH = 2.0
+
+def _new_estimators(model, fraction, n_new):
+    """Árboles o etapas que se agregan en un reentrenamiento"""
+    if n_new is not None:
+        return max(int(n_new), 1)
+    return max(int(round(model.n_estimators * fraction)), 1)
+
+def _reseed(model):
+    """
+    Semilla distinta para cada reentrenamiento
+    
+    Con random_state entero, warm start descarta tantas semillas como árboles
+    tenga el ensamble; como el bosque conserva su tamaño al retirar árboles,
+    cada reentrenamiento repetiría las mismas semillas (mismos bootstrap y
+    sorteos de características). Se usa random_state + n_refits.
+    
+    Returns:
+        Semilla original, para restaurarla después del ajuste
+    """
+    base = getattr(model, 'base_random_state_', model.random_state)
+    model.base_random_state_ = base
+    model.n_refits_ = getattr(model, 'n_refits_', 0) + 1
+    if isinstance(base, numbers.Integral):
+        model.set_params(random_state=int(base) + model.n_refits_)
+    return base
+
+def refit_forest(model, X_recent, y_recent, fraction=REFIT_FRACTION, n_new=None, retire=True):
+    """
+    Agregar árboles entrenados con datos recientes y retirar los más antiguos
+    
+    Args:
+        model (RandomForestRegressor): Bosque ya entrenado
+        X_recent, y_recent: Filas recientes (mismas columnas del entrenamiento)
+        fraction (float): Fracción de árboles que se renueva
+        n_new (int): Árboles nuevos (tiene prioridad sobre fraction)
+        retire (bool): Retirar tantos árboles antiguos como se agregaron
+        
+    Returns:
+        RandomForestRegressor: El mismo modelo actualizado
+    """
+    n_trees = len(model.estimators_)
+    n_new = _new_estimators(model, fraction, n_new)
+    warm_start = model.warm_start
+    
+    base = _reseed(model)
+    model.set_params(warm_start=True, n_estimators=n_trees + n_new)
+    model.fit(X_recent, y_recent)
+    if retire:
+        # estimators_ está en orden de creación: los primeros son los más antiguos
+        model.estimators_ = model.estimators_[n_new:]
+    model.set_params(warm_start=warm_start, n_estimators=len(model.estimators_), random_state=base)
+    return model
+
+def refit_boosting(model, X_recent, y_recent, fraction=REFIT_FRACTION, n_new=None, max_stages=None):
+    """
+    Agregar etapas de boosting ajustadas a los residuos sobre datos recientes
+    
+    Args:
+        model (GradientBoostingRegressor): Modelo ya entrenado
+        X_recent, y_recent: Filas recientes
+        fraction (float): Etapas nuevas como fracción del tamaño actual
+        n_new (int): Etapas nuevas (tiene prioridad sobre fraction)
+        max_stages (int): Etapas máximas; si se superarían no se modifica el
+            modelo
+            
+    Returns:
+        bool: True si se actualizó, False si corresponde reentrenar completo
+    """
+    n_stages = model.n_estimators_
+    n_new = _new_estimators(model, fraction, n_new)
+    if max_stages is not None and n_stages + n_new > max_stages:
+        return False
+    
+    warm_start = model.warm_start
+    base = _reseed(model)
+    model.set_params(warm_start=True, n_estimators=n_stages + n_new)
+    model.fit(X_recent, y_recent)
+    model.set_params(warm_start=warm_start, random_state=base)
+    return True
+
+def incremental_refit(model, X_recent, y_recent, fraction=REFIT_FRACTION, max_stages=None):
+    """
+    Reentrenar incrementalmente un Random Forest o un Gradient Boosting
+    
+    Args:
+        model: Modelo ya entrenado
+        X_recent, y_recent: Filas recientes
+        fraction (float): Fracción del ensamble que se renueva
+        max_stages (int): Etapas máximas de Gradient Boosting (por defecto
+            MAX_BOOSTING_GROWTH veces el tamaño con que se entrenó)
+            
+    Returns:
+        bool: True si se actualizó, False si el modelo no admite
+            reentrenamiento incremental o requiere uno completo
+    """
+    if isinstance(model, FOREST_TYPES):
+        refit_forest(model, X_recent, y_recent, fraction)
+        return True
+    if isinstance(model, GradientBoostingRegressor):
+        # Las etapas nuevas y el límite se miden contra el tamaño original
+        original = getattr(model, 'original_stages_', model.n_estimators_)
+        model.original_stages_ = original
+        if max_stages is None:
+            max_stages = int(original * MAX_BOOSTING_GROWTH)
+        n_new = max(int(round(original * fraction)), 1)
+        return refit_boosting(model, X_recent, y_recent, n_new=n_new, max_stages=max_stages)
+    return False
+
+def supports_incremental_refit(model):
+    """Indicar si el modelo admite reentrenamiento incremental"""
+    return isinstance(model, FOREST_TYPES + (GradientBoostingRegressor,))
@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+"""
+Almacén SQLite indexado de mediciones
+
+Guarda las mediciones en formato largo en un archivo SQLite local con un
+índice compuesto (parámetro, ubicación, tiempo), de modo que consultas
+agregadas como "máximo de PM10 por estación y mes desde 2020" se resuelven
+en SQL sin cargar el histórico completo en un DataFrame. La ingesta es
+idempotente: reingestar una medición del mismo sensor la reemplaza, y los
+sensores que comparten estación conservan cada uno su lectura.
+"""
+
+import os
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+# Columnas de cada esquema de mediciones: santiago (inglés), localidades
+# (español) y el propio almacén
+MEASUREMENT_SCHEMAS = {
+    'santiago': {
+        'parameter': 'parameter_name', 'location': 'location_name',
+        'time': 'date_from_utc', 'value': 'value'
+    },
+    'localidades': {
+        'parameter': 'parametro_nombre', 'location': 'localidad_nombre',
+        'time': 'fecha_desde_utc', 'value': 'valor'
+    },
+    'store': {
+        'parameter': 'parameter', 'location': 'location',
+        'time': 'time', 'value': 'value'
+    },
+}
+
+# Columnas opcionales que se copian al almacén si existen en la fuente
+OPTIONAL_COLUMNS = {
+    'santiago': {'value_normalized': 'value_normalized', 'unit': 'unit', 'sensor': 'sensor_id'},
+    'localidades': {'value_normalized': 'valor_normalizado', 'unit': 'unidad', 'sensor': 'sensor_id'},
+}
+
+# Extensiones reconocidas como almacén SQLite
+STORE_EXTENSIONS = ('.sqlite', '.sqlite3', '.db')
+
+# Ruta por defecto del almacén
+DEFAULT_STORE_PATH = 'data/mediciones.sqlite'
+
+# Funciones de agregación y formatos de período admitidos por aggregate()
+AGGREGATES = {'max': 'MAX', 'min': 'MIN', 'mean': 'AVG', 'avg': 'AVG', 'sum': 'SUM', 'count': 'COUNT'}
+PERIOD_FORMATS = {'hour': '%Y-%m-%d %H:00', 'day': '%Y-%m-%d', 'month': '%Y-%m', 'year': '%Y'}
+
+_CREATE_TABLE = """
+CREATE TABLE IF NOT EXISTS measurements (
+    parameter TEXT NOT NULL,
+    location TEXT NOT NULL,
+    time INTEGER NOT NULL,
+    value REAL,
+    value_normalized REAL,
+    unit TEXT,
+    sensor TEXT NOT NULL DEFAULT ''
+)
+"""
+
+# Una medición por (parámetro, ubicación, tiempo, sensor): los sensores de una
+# misma estación no se pisan. El prefijo sigue sirviendo a los filtros por
+# parámetro, ubicación y tiempo. El sensor desconocido es '' (no NULL) para
+# que la reingesta siga reemplazando.
+_CREATE_INDEX = """
+CREATE UNIQUE INDEX IF NOT EXISTS idx_measurements_parameter_location_time_sensor
+ON measurements (parameter, location, time, sensor)
+"""
+
+# Índice de versiones anteriores (sin sensor), que se reemplaza al abrir
+_LEGACY_INDEX = 'idx_measurements_parameter_location_time'
+
+def detect_schema(columns):
+    """
+    Elegir el esquema cuyas columnas están presentes
+    
+    Args:
+        columns (list): Columnas disponibles
+        
+    Returns:
+        str: Clave de MEASUREMENT_SCHEMAS
+    """
+    for name, schema in MEASUREMENT_SCHEMAS.items():
+        if all(col in columns for col in schema.values()):
+            return name
+    raise ValueError(f"Columnas no reconocidas como mediciones: {list(columns)[:8]}")
+
+def is_store_path(path):
+    """Indicar si la ruta corresponde a un almacén SQLite"""
+    return str(path).lower().endswith(STORE_EXTENSIONS)
+
+def _sensor_keys(values):
+    """Sensor como texto ('' si falta; los ids numéricos sin decimales)"""
+    values = pd.Series(values)
+    if pd.api.types.is_numeric_dtype(values):
+        keys = values.round().astype('Int64').astype(str)
+    else:
+        keys = values.astype(str)
+    return keys.where(values.notna(), '').tolist()
+
+def _epoch_seconds(values):
+    """Convertir fechas (texto o datetime) a segundos UTC desde epoch"""
+    times = pd.to_datetime(values, utc=True)
+    return times.values.astype('datetime64[s]').view(np.int64)
+
+class MeasurementStore:
+    """
+    Almacén SQLite de mediciones con índice (parámetro, ubicación, tiempo, sensor)
+    """
+    
+    def __init__(self, path=DEFAULT_STORE_PATH):
+        """
+        Abrir (o crear) el almacén
+        
+        Args:
+            path (str): Archivo SQLite
+        """
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(_CREATE_TABLE)
+        if 'sensor' not in self.columns():
+            # Almacén de una versión anterior: agregar el sensor y soltar el índice único viejo
+            self.connection.execute("ALTER TABLE measurements ADD COLUMN sensor TEXT NOT NULL DEFAULT ''")
+        self.connection.execute(f"DROP INDEX IF EXISTS {_LEGACY_INDEX}")
+        self.connection.execute(_CREATE_INDEX)
+        self.connection.commit()
+    
+    def ingest(self, df, schema=None):
+        """
+        Insertar o reemplazar mediciones desde un DataFrame en formato largo
+        
+        Args:
+            df (pd.DataFrame): Mediciones (esquema santiago o localidades)
+            schema (str): Clave de MEASUREMENT_SCHEMAS; se detecta si es None
+            
+        Returns:
+            int: Filas escritas
+        """
+        schema = schema or detect_schema(df.columns)
+        cols = MEASUREMENT_SCHEMAS[schema]
+        optional = OPTIONAL_COLUMNS.get(schema, {})
+        
+        valid = df[cols['parameter']].notna() & df[cols['location']].notna() & df[cols['time']].notna()
+        data = df[valid]
+        n = len(data)
+        
+        def _optional(key):
+            col = optional.get(key)
+            if col not in data.columns:
+                return [None] * n
+            values = data[col].astype(object)
+            return values.where(values.notna(), None).tolist()
+        
+        rows = zip(
+            data[cols['parameter']].astype(str).str.lower().tolist(),
+            data[cols['location']].astype(str).tolist(),
+            _epoch_seconds(data[cols['time']]).tolist(),
+            data[cols['value']].astype(float).tolist(),
+            _optional('value_normalized'),
+            _optional('unit'),
+            _sensor_keys(data[optional['sensor']]) if optional.get('sensor') in data.columns else [''] * n,
+        )
+        
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO measurements "
+                "(parameter, location, time, value, value_normalized, unit, sensor) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+        print(f"✓ Almacén actualizado: {n:,} mediciones en {self.path}")
+        return n
+    
+    def sql(self, statement, params=()):
+        """
+        Ejecutar una consulta SQL arbitraria
+        
+        Args:
+            statement (str): Consulta SQL sobre la tabla measurements
+            params (tuple): Parámetros de la consulta
+            
+        Returns:
+            pd.DataFrame: Resultado
+        """
+        return pd.read_sql_query(statement, self.connection, params=params)
+    
+    def select(self, parameters=None, locations=None, start=None, end=None, columns=None):
+        """
+        Leer mediciones filtradas usando el índice compuesto
+        
+        Args:
+            parameters (list): Parámetros a incluir
+            locations (list): Ubicaciones a incluir
+            start, end: Rango temporal [start, end)
+            columns (list): Columnas a devolver (por defecto todas)
+            
+        Returns:
+            pd.DataFrame: Mediciones con la columna time como datetime UTC
+        """
+        where, params = [], []
+        if parameters is not None:
+            where.append(f"parameter IN ({', '.join('?' * len(parameters))})")
+            params += [str(p).lower() for p in parameters]
+        if locations is not None:
+            where.append(f"location IN ({', '.join('?' * len(locations))})")
+            params += list(locations)
+        if start is not None:
+            where.append("time >= ?")
+            params.append(int(_epoch_seconds([start])[0]))
+        if end is not None:
+            where.append("time < ?")
+            params.append(int(_epoch_seconds([end])[0]))
+        
+        select_cols = ', '.join(columns) if columns else '*'
+        statement = f"SELECT {select_cols} FROM measurements"
+        if where:
+            statement += " WHERE " + " AND ".join(where)
+        statement += " ORDER BY parameter, location, time"
+        
+        df = self.sql(statement, params)
+        if 'time' in df.columns:
+            df['time'] = pd.to_datetime(df['time'], unit='s', utc=True)
+        return df
+    
+    def aggregate(self, parameter, agg='max', period='month', since=None, locations=None):
+        """
+        Agregar un parámetro por ubicación y período directamente en SQL
+        
+        Ejemplo: aggregate('pm10', 'max', 'month', since='2020-01-01')
+        
+        Args:
+            parameter (str): Parámetro
+            agg (str): max, min, mean, sum o count
+            period (str): hour, day, month o year
+            since: Fecha mínima (opcional)
+            locations (list): Ubicaciones a incluir (opcional)
+            
+        Returns:
+            pd.DataFrame: location, period, value y n (mediciones agregadas)
+        """
+        if agg not in AGGREGATES or period not in PERIOD_FORMATS:
+            raise ValueError(f"Agregación '{agg}' o período '{period}' no soportado")
+        
+        where, params = ["parameter = ?"], [str(parameter).lower()]
+        if locations is not None:
+            where.append(f"location IN ({', '.join('?' * len(locations))})")
+            params += list(locations)
+        if since is not None:
+            where.append("time >= ?")
+            params.append(int(_epoch_seconds([since])[0]))
+        
+        statement = (
+            f"SELECT location, strftime('{PERIOD_FORMATS[period]}', time, 'unixepoch') AS period, "
+            f"{AGGREGATES[agg]}(value) AS value, COUNT(*) AS n "
+            f"FROM measurements WHERE {' AND '.join(where)} "
+            "GROUP BY location, period ORDER BY location, period"
+        )
+        return self.sql(statement, params)
+    
+    def columns(self):
+        """Columnas de la tabla de mediciones"""
+        return [row[1] for row in self.connection.execute("PRAGMA table_info(measurements)")]
+    
+    def close(self):
+        """Cerrar la conexión"""
+        self.connection.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+def sync_store(df, path=DEFAULT_STORE_PATH, schema=None):
+    """
+    Mantener el almacén sincronizado con un lote recién ingerido
+    
+    Args:
+        df (pd.DataFrame): Mediciones nuevas
+        path (str): Archivo SQLite
+        schema (str): Clave de MEASUREMENT_SCHEMAS; se detecta si es None
+        
+    Returns:
+        int: Filas escritas (0 si falla)
+    """
+    try:
+        with MeasurementStore(path) as store:
+            return store.ingest(df, schema)
+    except Exception as e:
+        print(f"✗ Error al sincronizar el almacén: {e}")
+        return 0
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Matrices compactas de entrenamiento compartidas entre modelos
+
+Las características numéricas se guardan una sola vez como float32
+C-contiguo con la ubicación como código entero en la última columna. Esa
+matriz es directamente la variante de los modelos de árboles (float32 es
+el tipo interno de los árboles de scikit-learn, así que no se copia); los
+lineales reciben una matriz CSR con la ubicación en one-hot disperso en
+lugar de columnas float64 densas. Todo se comparte en modo solo lectura.
+"""
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+# Familias de modelos y la variante de matriz que usan
+TREE_FAMILY = 'tree'
+LINEAR_FAMILY = 'linear'
+
+class FeatureLayout:
+    """
+    Columnas y ubicaciones de una matriz, para codificar filas nuevas igual
+    que en el entrenamiento
+    
+    Atributos:
+        names (list): Características numéricas en orden
+        locations (list): Ubicaciones (el código es la posición)
+        location_prefix (str): Prefijo de las columnas one-hot
+    """
+    
+    def __init__(self, names, locations, location_prefix='location'):
+        self.names = list(names)
+        self.locations = list(locations)
+        self.location_prefix = location_prefix
+    
+    @property
+    def tree_names(self):
+        """Columnas de la variante para árboles"""
+        return self.names + ['location_code']
+    
+    @property
+    def linear_names(self):
+        """Columnas de la variante lineal"""
+        return self.names + [f'{self.location_prefix}_{loc}' for loc in self.locations]
+    
+    def location_codes(self, locations):
+        """Código de cada ubicación (-1 si no se vio en el entrenamiento)"""
+        index = pd.Index(self.locations)
+        return index.get_indexer(pd.Index(locations)).astype(np.int32)
+    
+    def encode(self, dense, locations, family=TREE_FAMILY):
+        """
+        Codificar filas nuevas en la variante de una familia de modelos
+        
+        Args:
+            dense (np.ndarray): Características numéricas (filas, len(names))
+            locations (array-like o str): Ubicación de cada fila (o una para todas)
+            family (str): TREE_FAMILY o LINEAR_FAMILY
+            
+        Returns:
+            np.ndarray o sparse.csr_matrix: Matriz lista para predict
+        """
+        dense = np.ascontiguousarray(dense, dtype=np.float32)
+        if isinstance(locations, str):
+            locations = [locations] * len(dense)
+        codes = self.location_codes(locations)
+        if family == TREE_FAMILY:
+            return _tree_matrix(dense, codes)
+        return _linear_matrix(dense, codes, len(self.locations))
+
+def _tree_matrix(dense, codes):
+    """Densa float32 con el código de ubicación como última columna"""
+    matrix = np.empty((dense.shape[0], dense.shape[1] + 1), dtype=np.float32)
+    matrix[:, :-1] = dense
+    matrix[:, -1] = codes
+    return matrix
+
+def _linear_matrix(dense, codes, n_locations):
+    """CSR float32: características numéricas más la ubicación en one-hot disperso"""
+    known = codes >= 0
+    onehot = sparse.csr_matrix(
+        (np.ones(int(known.sum()), dtype=np.float32), (np.flatnonzero(known), codes[known])),
+        shape=(len(codes), n_locations)
+    )
+    return sparse.hstack([sparse.csr_matrix(dense), onehot], format='csr', dtype=np.float32)
+
+def _read_only(matrix):
+    """Marcar una matriz (densa o CSR) como solo lectura"""
+    arrays = [matrix] if isinstance(matrix, np.ndarray) else [matrix.data, matrix.indices, matrix.indptr]
+    for array in arrays:
+        array.setflags(write=False)
+    return matrix
+
+class ModelMatrix:
+    """
+    Características de entrenamiento con variantes para árboles y lineales
+    
+    Atributos:
+        tree (np.ndarray): Variante para árboles, float32 C-contigua de solo
+            lectura (características numéricas + código de ubicación)
+        location_codes (np.ndarray): Código int32 de ubicación por fila
+        layout (FeatureLayout): Columnas y ubicaciones
+    """
+    
+    def __init__(self, dense, location_codes, layout):
+        self.location_codes = np.asarray(location_codes, dtype=np.int32)
+        self.tree = _read_only(_tree_matrix(dense, self.location_codes))
+        self.layout = layout
+        self._linear = None
+    
+    @property
+    def dense(self):
+        """Características numéricas (vista sin copia de la variante para árboles)"""
+        return self.tree[:, :-1]
+    
+    @classmethod
+    def from_features(cls, features, locations, location_prefix='location'):
+        """
+        Armar la matriz desde un DataFrame de características y las ubicaciones
+        
+        Args:
+            features (pd.DataFrame): Características numéricas (sin one-hot)
+            locations (pd.Series): Ubicación de cada fila
+            location_prefix (str): Prefijo de las columnas one-hot
+            
+        Returns:
+            ModelMatrix: Matriz compacta
+        """
+        codes, uniques = pd.factorize(locations, sort=True)
+        layout = FeatureLayout(features.columns, uniques, location_prefix)
+        return cls(features.to_numpy(dtype=np.float32), codes, layout)
+    
+    @property
+    def shape(self):
+        """Forma de la variante para árboles"""
+        return self.tree.shape
+    
+    @property
+    def columns(self):
+        """Columnas de la variante para árboles (p. ej. para importancias)"""
+        return self.layout.tree_names
+    
+    def __len__(self):
+        return len(self.tree)
+    
+    def matrix(self, family=TREE_FAMILY, rows=None):
+        """
+        Variante de la matriz para una familia de modelos
+        
+        La variante completa se comparte en solo lectura (la lineal se arma
+        la primera vez que se pide); con rows se devuelve el subconjunto de
+        filas, una copia por llamada pensada para hacerse una vez por
+        partición y familia.
+        
+        Args:
+            family (str): TREE_FAMILY o LINEAR_FAMILY
+            rows (np.ndarray): Posiciones de filas (opcional)
+            
+        Returns:
+            np.ndarray o sparse.csr_matrix: Matriz lista para fit/predict
+        """
+        if family == TREE_FAMILY:
+            return self.tree if rows is None else _read_only(self.tree[rows])
+        n_locations = len(self.layout.locations)
+        if rows is not None:
+            return _read_only(_linear_matrix(self.dense[rows], self.location_codes[rows], n_locations))
+        if self._linear is None:
+            self._linear = _read_only(_linear_matrix(self.dense, self.location_codes, n_locations))
+        return self._linear
+    
+    def nbytes(self):
+        """Bytes de la matriz base y de la variante lineal si ya se armó"""
+        total = self.tree.nbytes + self.location_codes.nbytes
+        if self._linear is not None:
+            total += self._linear.data.nbytes + self._linear.indices.nbytes + self._linear.indptr.nbytes
+        return total
@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+"""
+Estado de características en línea por serie para pronóstico en vivo
+
+Cada serie (ubicación, parámetro) mantiene un buffer circular con sus
+últimas lecturas y sumas acumuladas (valor, cuadrado y faltantes) por
+ventana, de modo que al llegar una medición los rezagos, medias, varianzas
+y diferencias se actualizan en O(1) sin reconstruir el historial. El
+vector se emite en el orden exacto de columnas del modelo entrenado y, con
+lecturas a paso regular, coincide con la fila de feature_store.compute_features
+(lag_mode='hours').
+"""
+
+import numpy as np
+import pandas as pd
+
+from calendar_features import CALENDAR_TIMEZONE, calendar_row, is_calendar_feature
+from series_features import WINDOW_PATTERN
+
+# Actualizaciones entre recálculos exactos de las sumas (acota el error de redondeo)
+ONLINE_RESYNC_UPDATES = 4096
+
+def _to_seconds(timestamp):
+    """Marca de tiempo (Timestamp, datetime, datetime64 o segundos) a segundos UTC"""
+    if isinstance(timestamp, (int, np.integer)):
+        return int(timestamp)
+    ts = pd.Timestamp(timestamp)
+    ts = ts.tz_localize('UTC') if ts.tzinfo is None else ts.tz_convert('UTC')
+    return int(ts.value // 10 ** 9)
+
+class OnlineFeatureState:
+    """
+    Rezagos, ventanas y calendario de una serie actualizados en O(1)
+    
+    Atributos:
+        names (list): Características en el orden de la especificación
+        columns (list): Orden de salida (el del modelo)
+        last_time (int): Segundos UTC de la última lectura
+    """
+    
+    def __init__(self, spec, columns=None, location=None, locations=(), step_seconds=3600,
+                 timezone=CALENDAR_TIMEZONE):
+        """
+        Args:
+            spec (list): Especificación como en feature_store.compute_features
+            columns (list): Orden de columnas del modelo (por defecto el de spec)
+            location (str): Ubicación de la serie
+            locations (list): Ubicaciones vistas en el entrenamiento (para
+                location_code y one-hot)
+            step_seconds (int): Paso de la serie; los huecos se rellenan con
+                NaN para que los rezagos cuenten pasos de tiempo
+            timezone (str): Zona horaria de las características locales
+        """
+        categories = sorted(str(loc) for loc in locations)
+        self.names, self._ops = [], []
+        self._calendar = tuple(item for item in spec if is_calendar_feature(item))
+        for item in spec:
+            match = WINDOW_PATTERN.match(item)
+            if is_calendar_feature(item):
+                self._ops.append(('calendar', self._calendar.index(item)))
+                self.names.append(item)
+            elif match:
+                kind, k = match.group(1), int(match.group(2))
+                self._ops.append(('ma' if kind == 'media_movil' else kind, k))
+                self.names.append(item)
+            elif item == 'location_code':
+                code = categories.index(str(location)) if str(location) in categories else -1
+                self._ops.append(('constant', float(code)))
+                self.names.append(item)
+            elif item.startswith('onehot:'):
+                prefix = item.split(':', 1)[1]
+                for name in categories:
+                    self._ops.append(('constant', 1.0 if name == str(location) else 0.0))
+                    self.names.append(f'{prefix}_{name}')
+            else:
+                raise ValueError(f"Característica no reconocida: {item}")
+        
+        self.columns = list(columns) if columns is not None else list(self.names)
+        missing = [col for col in self.columns if col not in self.names]
+        if missing:
+            raise ValueError(f"Columnas del modelo sin definición en línea: {missing}")
+        self._positions = np.array([self.names.index(col) for col in self.columns], dtype=np.intp)
+        
+        # Buffer: lo justo para el rezago y la ventana más largos
+        lags = [k for kind, k in self._ops if kind in ('lag', 'diff')]
+        self._windows = sorted({k for kind, k in self._ops if kind in ('ma', 'std', 'max', 'min')})
+        self._size = max(lags + [k - 1 for k in self._windows] + [0]) + 1
+        self._buffer = np.full(self._size, np.nan)
+        self._head = -1
+        self._count = 0
+        self._sum = {w: 0.0 for w in self._windows}
+        self._sumsq = {w: 0.0 for w in self._windows}
+        self._nans = {w: 0 for w in self._windows}
+        self._updates = 0
+        self.step_seconds = step_seconds
+        self.timezone = timezone
+        self.last_time = None
+    
+    def _back(self, j):
+        """Valor j pasos antes de la última lectura (NaN si no existe)"""
+        if j >= self._count or j >= self._size:
+            return np.nan
+        return self._buffer[(self._head - j) % self._size]
+    
+    def _push(self, value):
+        """Agregar una lectura actualizando las sumas de cada ventana"""
+        for w in self._windows:
+            if self._count >= w:
+                leaving = self._back(w - 1)
+                if np.isnan(leaving):
+                    self._nans[w] -= 1
+                else:
+                    self._sum[w] -= leaving
+                    self._sumsq[w] -= leaving * leaving
+            if np.isnan(value):
+                self._nans[w] += 1
+            else:
+                self._sum[w] += value
+                self._sumsq[w] += value * value
+        self._head = (self._head + 1) % self._size
+        self._buffer[self._head] = value
+        self._count += 1
+    
+    def _resync(self):
+        """Recalcular las sumas exactas desde el buffer"""
+        for w in self._windows:
+            window = np.array([self._back(j) for j in range(min(w, self._count))])
+            valid = window[~np.isnan(window)]
+            self._sum[w] = float(valid.sum())
+            self._sumsq[w] = float((valid * valid).sum())
+            self._nans[w] = int(np.isnan(window).sum())
+    
+    def update(self, timestamp, value):
+        """
+        Incorporar una medición y devolver su vector de características
+        
+        Args:
+            timestamp: Marca de tiempo de la medición
+            value (float): Valor medido (NaN si falta)
+            
+        Returns:
+            np.ndarray: Vector float32 en el orden de columns (igual a la
+                fila que compute_features calcularía para esta medición)
+        """
+        seconds = _to_seconds(timestamp)
+        if self.last_time is not None:
+            if seconds <= self.last_time:
+                raise ValueError(f"Medición fuera de orden: {timestamp}")
+            if self.step_seconds:
+                gap = int(round((seconds - self.last_time) / self.step_seconds)) - 1
+                for _ in range(min(max(gap, 0), self._size)):
+                    self._push(np.nan)
+        self._push(float(value))
+        self.last_time = seconds
+        self._updates += 1
+        if self._updates % ONLINE_RESYNC_UPDATES == 0:
+            self._resync()
+        return self.vector()
+    
+    def _window(self, kind, w):
+        """Media, desviación, máximo o mínimo de las últimas w lecturas"""
+        if kind in ('ma', 'std'):
+            if self._count < w or self._nans[w]:
+                return np.nan
+            if kind == 'ma':
+                return self._sum[w] / w
+            if w < 2:
+                return np.nan
+            variance = (self._sumsq[w] - self._sum[w] * self._sum[w] / w) / (w - 1)
+            return float(np.sqrt(max(variance, 0.0)))
+        window = np.array([self._back(j) for j in range(w)])
+        if self._count < w or np.isnan(window).any():
+            return np.nan
+        reducer = {'max': np.max, 'min': np.min}[kind]
+        return float(reducer(window))
+    
+    def _row(self, hour, steps_ahead):
+        """
+        Vector con los rezagos desplazados steps_ahead pasos desde la última
+        lectura; las ventanas y diferencias terminan siempre en la última
+        """
+        calendar = calendar_row(hour, self._calendar, self.timezone) if self._calendar else ()
+        row = np.empty(len(self.names), dtype=np.float64)
+        for i, (kind, arg) in enumerate(self._ops):
+            if kind == 'calendar':
+                row[i] = calendar[arg]
+            elif kind == 'constant':
+                row[i] = arg
+            elif kind == 'lag':
+                row[i] = self._back(arg - steps_ahead) if arg >= steps_ahead else np.nan
+            elif kind == 'diff':
+                row[i] = self._back(0) - self._back(arg)
+            else:
+                row[i] = self._window(kind, arg)
+        return row[self._positions].astype(np.float32)
+    
+    def vector(self):
+        """Vector de características de la última medición"""
+        if self.last_time is None:
+            raise ValueError("El estado no tiene mediciones")
+        return self._row(self.last_time // 3600, 0)
+    
+    def forecast(self, timestamp):
+        """
+        Vector para pronosticar una medición futura aún desconocida
+        
+        Los rezagos toman el valor exacto en t - k pasos; las ventanas y
+        diferencias, que en el entrenamiento incluyen la medición actual,
+        se evalúan sobre las últimas lecturas disponibles.
+        
+        Args:
+            timestamp: Marca de tiempo a pronosticar (posterior a la última)
+            
+        Returns:
+            np.ndarray: Vector float32 en el orden de columns
+        """
+        if self.last_time is None:
+            raise ValueError("El estado no tiene mediciones")
+        seconds = _to_seconds(timestamp)
+        step = self.step_seconds or 3600
+        steps_ahead = max(int(round((seconds - self.last_time) / step)), 1)
+        return self._row(seconds // 3600, steps_ahead)
+
+class OnlineFeatureBank:
+    """
+    Estados en línea de todas las series (ubicación, parámetro)
+    """
+    
+    def __init__(self, spec, columns=None, locations=(), step_seconds=3600,
+                 timezone=CALENDAR_TIMEZONE):
+        """
+        Args:
+            spec (list): Especificación de características
+            columns (list): Orden de columnas del modelo
+            locations (list): Ubicaciones vistas en el entrenamiento
+            step_seconds (int): Paso de las series
+            timezone (str): Zona horaria de las características locales
+        """
+        self.spec = list(spec)
+        self.columns = columns
+        self.locations = list(locations)
+        self.step_seconds = step_seconds
+        self.timezone = timezone
+        self.states = {}
+    
+    def state(self, location, parameter):
+        """Estado de una serie (se crea vacío la primera vez)"""
+        key = (location, str(parameter).lower())
+        if key not in self.states:
+            self.states[key] = OnlineFeatureState(self.spec, self.columns, location, self.locations,
+                                                  self.step_seconds, self.timezone)
+        return self.states[key]
+    
+    def warm_start(self, df, time_col, value_col, location_col, parameter_col=None, parameter=None):
+        """
+        Cargar el historial reciente de cada serie
+        
+        Solo se recorren las últimas lecturas necesarias para llenar el buffer.
+        
+        Args:
+            df (pd.DataFrame): Historial en formato largo
+            time_col, value_col, location_col (str): Columnas
+            parameter_col (str): Columna de parámetro (o usar parameter)
+            parameter (str): Parámetro fijo si df tiene uno solo
+        """
+        data = df.sort_values(time_col)
+        keys = [location_col] + ([parameter_col] if parameter_col else [])
+        for group, rows in data.groupby(keys, sort=False):
+            group = group if isinstance(group, tuple) else (group,)
+            state = self.state(group[0], group[1] if parameter_col else parameter)
+            start = rows[time_col].iloc[-1] - pd.Timedelta(seconds=state._size * (self.step_seconds or 3600))
+            recent = rows[rows[time_col] > start]
+            for timestamp, value in zip(recent[time_col], recent[value_col]):
+                if state.last_time is None or _to_seconds(timestamp) > state.last_time:
+                    state.update(timestamp, value)
+        print(f"✓ Estado en línea inicializado: {len(self.states)} series")
+    
+    def update(self, location, parameter, timestamp, value):
+        """Incorporar una medición y devolver su vector (ver OnlineFeatureState.update)"""
+        return self.state(location, parameter).update(timestamp, value)
+    
+    def forecast(self, location, parameter, timestamp):
+        """Vector para pronosticar la serie en timestamp (ver OnlineFeatureState.forecast)"""
+        return self.state(location, parameter).forecast(timestamp)
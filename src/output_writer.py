@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Escritura asíncrona y atómica de resultados procesados
+
+Las escrituras de tablas, figuras y textos se entregan a un pool de hilos
+en segundo plano para que el cálculo continúe mientras se escribe a disco.
+Cada archivo se escribe primero en un temporal del mismo directorio y luego
+se renombra de forma atómica, así una interrupción nunca deja un archivo
+truncado. El formato se deduce de la extensión (.csv, .csv.gz, .parquet).
+"""
+
+import io
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Compresión por extensión de archivo
+CSV_COMPRESSION = {'.csv': None, '.csv.gz': 'gzip', '.csv.bz2': 'bz2', '.csv.zst': 'zstd'}
+PARQUET_EXTENSIONS = ('.parquet', '.pq')
+PARQUET_COMPRESSION = 'zstd'
+
+# Máscara de permisos del proceso, leída una vez al importar (os.umask no se
+# puede consultar sin modificarla y las escrituras corren en varios hilos)
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+def _extension(filepath):
+    """Extensión de la ruta, incluyendo la doble extensión de CSV comprimido"""
+    name = os.path.basename(filepath).lower()
+    for ext in CSV_COMPRESSION:
+        if name.endswith(ext):
+            return ext
+    return os.path.splitext(name)[1]
+
+def atomic_write(filepath, write_func, mode='wb'):
+    """
+    Escribir un archivo mediante un temporal y un renombrado atómico
+    
+    Args:
+        filepath (str): Ruta final del archivo
+        write_func (callable): Función que recibe el archivo temporal abierto
+        mode (str): Modo de apertura del temporal ('wb' o 'w')
+    """
+    directory = os.path.dirname(os.path.abspath(filepath))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp_', suffix=_extension(filepath))
+    
+    try:
+        encoding = 'utf-8' if 'b' not in mode else None
+        with os.fdopen(fd, mode, encoding=encoding, newline='' if encoding else None) as f:
+            write_func(f)
+            f.flush()
+            os.fsync(f.fileno())
+        # mkstemp crea el temporal con 0600: el archivo final sigue la umask
+        os.chmod(tmp_path, 0o666 & ~_UMASK)
+        os.replace(tmp_path, filepath)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def write_frame(df, filepath, index=False, **options):
+    """
+    Escribir un DataFrame de forma atómica en el formato de su extensión
+    
+    Args:
+        df (pd.DataFrame): Datos a escribir
+        filepath (str): Ruta destino (.csv, .csv.gz, .csv.bz2, .csv.zst,
+            .parquet)
+        index (bool): Si se escribe el índice
+        **options: Argumentos adicionales para to_parquet / to_csv
+            (p. ej. row_group_size)
+    """
+    ext = _extension(filepath)
+    
+    if ext in PARQUET_EXTENSIONS:
+        options.setdefault('compression', PARQUET_COMPRESSION)
+        atomic_write(filepath, lambda f: df.to_parquet(f, index=index, **options))
+    elif ext in CSV_COMPRESSION and CSV_COMPRESSION[ext] is not None:
+        compression = CSV_COMPRESSION[ext]
+        atomic_write(filepath, lambda f: df.to_csv(f, index=index, encoding='utf-8',
+                                                   compression=compression, **options))
+    else:
+        atomic_write(filepath, lambda f: df.to_csv(f, index=index, **options), mode='w')
+
+class OutputWriter:
+    """
+    Escritor de resultados con pool de hilos en segundo plano
+    
+    Las escrituras se encolan y devuelven un Future; flush() actúa como
+    barrera al final del pipeline y reporta los errores acumulados.
+    """
+    
+    def __init__(self, max_workers=2):
+        """
+        Inicializar el escritor
+        
+        Args:
+            max_workers (int): Hilos de escritura en paralelo
+        """
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='output_writer')
+        self.pending = []
+        self._lock = threading.Lock()
+    
+    def _submit(self, filepath, func, *args, description=""):
+        """Encolar una escritura y recordarla hasta el próximo flush"""
+        future = self.executor.submit(func, *args)
+        with self._lock:
+            self.pending.append((future, filepath, description))
+        return future
+    
+    def write_frame(self, df, filepath, index=False, description=""):
+        """
+        Encolar la escritura de un DataFrame
+        
+        Se encola una copia profunda: el llamador puede seguir modificando
+        su DataFrame en el lugar sin afectar lo que se escribe (una copia
+        superficial solo es segura con el copy-on-write de pandas 3).
+        
+        Args:
+            df (pd.DataFrame): Datos a escribir
+            filepath (str): Ruta destino; el formato sale de la extensión
+            index (bool): Si se escribe el índice
+            description (str): Descripción que se informa al escribir
+            
+        Returns:
+            concurrent.futures.Future: Escritura pendiente
+        """
+        return self._submit(filepath, write_frame, df.copy(deep=True), filepath, index,
+                            description=description)
+    
+    def save_figure(self, fig, filepath, **savefig_kwargs):
+        """
+        Encolar la escritura de una figura de matplotlib
+        
+        La figura se rasteriza en el hilo que llama (matplotlib no es seguro
+        entre hilos); solo la escritura de los bytes va en segundo plano.
+        
+        Args:
+            fig (matplotlib.figure.Figure): Figura a guardar
+            filepath (str): Ruta destino
+            **savefig_kwargs: Argumentos para fig.savefig (dpi, bbox_inches...)
+            
+        Returns:
+            concurrent.futures.Future: Escritura pendiente
+        """
+        buffer = io.BytesIO()
+        fmt = savefig_kwargs.pop('format', None) or os.path.splitext(filepath)[1].lstrip('.') or 'png'
+        fig.savefig(buffer, format=fmt, **savefig_kwargs)
+        payload = buffer.getvalue()
+        return self._submit(filepath, atomic_write, filepath, lambda f: f.write(payload))
+    
+    def write_text(self, text, filepath, description=""):
+        """
+        Encolar la escritura de un archivo de texto UTF-8
+        
+        Args:
+            text (str): Contenido
+            filepath (str): Ruta destino
+            description (str): Descripción que se informa al escribir
+            
+        Returns:
+            concurrent.futures.Future: Escritura pendiente
+        """
+        return self._submit(filepath, atomic_write, filepath, lambda f: f.write(text), 'w',
+                            description=description)
+    
+    def flush(self, verbose=True):
+        """
+        Esperar a que terminen todas las escrituras encoladas
+        
+        Args:
+            verbose (bool): Informar archivos escritos y errores
+            
+        Returns:
+            bool: True si todas las escrituras fueron exitosas
+        """
+        with self._lock:
+            pending, self.pending = self.pending, []
+        
+        n_errors = 0
+        for future, filepath, description in pending:
+            error = future.exception()
+            n_errors += error is not None
+            if not verbose:
+                continue
+            if error is not None:
+                print(f"✗ Error al guardar {filepath}: {error}")
+            else:
+                print(f"✓ Datos guardados en: {filepath}")
+                if description:
+                    print(f"  Descripción: {description}")
+        return n_errors == 0
+    
+    def close(self):
+        """Vaciar la cola y liberar los hilos de escritura"""
+        ok = self.flush()
+        self.executor.shutdown(wait=True)
+        return ok
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
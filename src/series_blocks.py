@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+"""
+Almacenamiento por serie en bloques de tiempo con mapas de zonas
+
+Cada serie (ubicación, parámetro) se corta en bloques de duración fija.
+Cada bloque guarda un encabezado con su rango temporal, conteo, suma,
+mínimo y máximo, y su contenido codificado con timeseries_codec. Las
+consultas por rango o umbral descartan bloques completos mirando solo los
+encabezados, y los agregados simples se responden sin decodificar los
+bloques que caen enteros dentro del rango.
+"""
+
+import json
+import struct
+
+import numpy as np
+import pandas as pd
+
+from output_writer import atomic_write
+from measurement_store import MEASUREMENT_SCHEMAS, detect_schema
+from timeseries_codec import decode_columns, encode_columns
+
+# Identificador del formato de archivo
+BLOCKS_MAGIC = b'SBK1'
+
+# Extensión de los archivos de bloques
+BLOCKS_EXTENSION = '.sbk'
+
+# Duración por defecto de cada bloque (segundos): 7 días
+DEFAULT_BLOCK_SECONDS = 7 * 24 * 3600
+
+# Estructura del encabezado (mapa de zonas) de cada bloque
+ZONE_MAP_DTYPE = np.dtype([
+    ('series', '<i4'), ('t_start', '<i8'), ('t_end', '<i8'),
+    ('n_rows', '<i4'), ('count', '<i4'),
+    ('sum', '<f8'), ('min', '<f8'), ('max', '<f8'),
+    ('offset', '<i8'), ('length', '<i8'),
+])
+
+def _to_seconds(timestamp):
+    """Límite temporal a segundos UTC (los ingenuos se asumen UTC)"""
+    ts = pd.Timestamp(timestamp)
+    ts = ts.tz_localize('UTC') if ts.tzinfo is None else ts.tz_convert('UTC')
+    return int(ts.value // 10 ** 9)
+
+def is_blocks_path(path):
+    """Indicar si la ruta corresponde a un archivo de bloques"""
+    return str(path).lower().endswith(BLOCKS_EXTENSION)
+
+class SeriesBlockStore:
+    """
+    Series en bloques de tiempo con encabezados min/max/conteo/suma
+    
+    Atributos:
+        series (pd.DataFrame): location y parameter de cada serie (índice = id)
+        zone_map (np.ndarray): Encabezado de cada bloque (ZONE_MAP_DTYPE)
+        block_seconds (int): Duración de los bloques
+        last_scan (dict): Bloques considerados y decodificados en la última consulta
+    """
+    
+    def __init__(self, series, zone_map, block_seconds, payload):
+        self.series = series
+        self.zone_map = zone_map
+        self.block_seconds = block_seconds
+        self._payload = payload
+        self.last_scan = {}
+    
+    @classmethod
+    def from_frame(cls, df, schema=None, value_col=None, block_seconds=DEFAULT_BLOCK_SECONDS):
+        """
+        Construir el almacén desde mediciones en formato largo
+        
+        Args:
+            df (pd.DataFrame): Mediciones
+            schema (str): Clave de MEASUREMENT_SCHEMAS; se detecta si es None
+            value_col (str): Columna de valores (por defecto la del esquema;
+                usar la normalizada para umbrales en unidad canónica)
+            block_seconds (int): Duración de cada bloque
+            
+        Returns:
+            SeriesBlockStore: Almacén en memoria
+        """
+        cols = MEASUREMENT_SCHEMAS[schema or detect_schema(df.columns)]
+        value_col = value_col or cols['value']
+        
+        series_frame = pd.DataFrame({
+            'location': df[cols['location']].astype(str).to_numpy(),
+            'parameter': df[cols['parameter']].astype(str).str.lower().to_numpy(),
+        })
+        series_codes = series_frame.groupby(['location', 'parameter'], sort=True).ngroup().to_numpy()
+        series = series_frame.drop_duplicates().sort_values(['location', 'parameter']).reset_index(drop=True)
+        series.index.name = 'id'
+        
+        times = pd.to_datetime(df[cols['time']], utc=True).values.astype('datetime64[s]').view(np.int64)
+        values = df[value_col].to_numpy(dtype=np.float64)
+        
+        # Un orden por (serie, tiempo) y cortes donde cambia la serie o el bloque
+        order = np.lexsort((times, series_codes))
+        s, t, v = series_codes[order], times[order], values[order]
+        block_key = np.floor_divide(t, block_seconds)
+        starts = np.flatnonzero(np.concatenate([[True], (s[1:] != s[:-1]) | (block_key[1:] != block_key[:-1])]))
+        ends = np.append(starts[1:], len(t))
+        
+        valid = ~np.isnan(v)
+        zone_map = np.zeros(len(starts), dtype=ZONE_MAP_DTYPE)
+        if len(starts):
+            zone_map['series'] = s[starts]
+            zone_map['t_start'] = t[starts]
+            zone_map['t_end'] = t[ends - 1]
+            zone_map['n_rows'] = ends - starts
+            zone_map['count'] = np.add.reduceat(valid.astype(np.int64), starts)
+            zone_map['sum'] = np.add.reduceat(np.where(valid, v, 0.0), starts)
+            with np.errstate(invalid='ignore'):
+                zone_map['min'] = np.fmin.reduceat(v, starts)
+                zone_map['max'] = np.fmax.reduceat(v, starts)
+        
+        chunks = [encode_columns({'time': t[lo:hi], 'value': v[lo:hi]}, time_columns=('time',))
+                  for lo, hi in zip(starts, ends)]
+        lengths = np.array([len(blob) for blob in chunks], dtype=np.int64)
+        zone_map['length'] = lengths
+        zone_map['offset'] = np.cumsum(lengths) - lengths
+        
+        print(f"✓ Almacén por bloques: {len(series)} series, {len(zone_map):,} bloques")
+        return cls(series, zone_map, block_seconds, b''.join(chunks))
+    
+    def _decode_block(self, i):
+        """Decodificar un bloque a (tiempos, valores)"""
+        block = self.zone_map[i]
+        start = int(block['offset'])
+        data = decode_columns(bytes(self._payload[start: start + int(block['length'])]))
+        return data['time'], data['value']
+    
+    def _series_mask(self, locations, parameters):
+        """Series seleccionadas como máscara sobre los bloques"""
+        keep = np.ones(len(self.series), dtype=bool)
+        if locations is not None:
+            keep &= self.series['location'].isin(list(locations)).to_numpy()
+        if parameters is not None:
+            keep &= self.series['parameter'].isin([str(p).lower() for p in parameters]).to_numpy()
+        return keep[self.zone_map['series']]
+    
+    def scan(self, locations=None, parameters=None, start=None, end=None, above=None, below=None):
+        """
+        Filas que cumplen los predicados, decodificando solo los bloques necesarios
+        
+        Ejemplo: scan(parameters=['pm25'], start='2023-06-01', end='2023-09-01', above=55)
+        
+        Args:
+            locations, parameters (list): Series a incluir (None = todas)
+            start, end: Rango temporal [start, end)
+            above (float): Solo valores estrictamente mayores
+            below (float): Solo valores estrictamente menores
+            
+        Returns:
+            pd.DataFrame: location, parameter, time (UTC) y value
+        """
+        zm = self.zone_map
+        candidate = self._series_mask(locations, parameters)
+        t_lo = _to_seconds(start) if start is not None else None
+        t_hi = _to_seconds(end) if end is not None else None
+        if t_lo is not None:
+            candidate &= zm['t_end'] >= t_lo
+        if t_hi is not None:
+            candidate &= zm['t_start'] < t_hi
+        # Los bloques sin valores tienen min/max NaN y quedan fuera de cualquier umbral
+        if above is not None:
+            candidate &= zm['max'] > above
+        if below is not None:
+            candidate &= zm['min'] < below
+        
+        blocks = np.flatnonzero(candidate)
+        self.last_scan = {'bloques': len(zm), 'bloques_decodificados': len(blocks)}
+        
+        parts = []
+        for i in blocks:
+            t, v = self._decode_block(i)
+            keep = ~np.isnan(v) if (above is not None or below is not None) else np.ones(len(v), dtype=bool)
+            if t_lo is not None:
+                keep &= t >= t_lo
+            if t_hi is not None:
+                keep &= t < t_hi
+            if above is not None:
+                keep &= v > above
+            if below is not None:
+                keep &= v < below
+            if keep.any():
+                parts.append((zm['series'][i], t[keep], v[keep]))
+        
+        if not parts:
+            return pd.DataFrame({'location': [], 'parameter': [],
+                                 'time': pd.to_datetime([], utc=True), 'value': []})
+        series_ids = np.concatenate([np.full(len(t), sid) for sid, t, _ in parts])
+        return pd.DataFrame({
+            'location': self.series['location'].to_numpy()[series_ids],
+            'parameter': self.series['parameter'].to_numpy()[series_ids],
+            'time': pd.to_datetime(np.concatenate([t for _, t, _ in parts]), unit='s', utc=True),
+            'value': np.concatenate([v for _, _, v in parts]),
+        })
+    
+    def aggregate(self, how='mean', locations=None, parameters=None, start=None, end=None):
+        """
+        Agregado por serie usando los encabezados de los bloques completos
+        
+        Solo los bloques que cruzan un borde del rango se decodifican.
+        
+        Args:
+            how (str): count, sum, mean, min o max
+            locations, parameters (list): Series a incluir
+            start, end: Rango temporal [start, end)
+            
+        Returns:
+            pd.Series: Agregado indexado por (location, parameter)
+        """
+        if how not in ('count', 'sum', 'mean', 'min', 'max'):
+            raise ValueError(f"Agregación '{how}' no soportada")
+        
+        zm = self.zone_map
+        selected = self._series_mask(locations, parameters)
+        t_lo = _to_seconds(start) if start is not None else np.iinfo(np.int64).min
+        t_hi = _to_seconds(end) if end is not None else np.iinfo(np.int64).max
+        overlaps = selected & (zm['t_end'] >= t_lo) & (zm['t_start'] < t_hi)
+        inside = overlaps & (zm['t_start'] >= t_lo) & (zm['t_end'] < t_hi)
+        
+        n_series = len(self.series)
+        count = np.bincount(zm['series'][inside], weights=zm['count'][inside], minlength=n_series)
+        total = np.bincount(zm['series'][inside], weights=zm['sum'][inside], minlength=n_series)
+        low = np.full(n_series, np.nan)
+        high = np.full(n_series, np.nan)
+        np.fmin.at(low, zm['series'][inside], zm['min'][inside])
+        np.fmax.at(high, zm['series'][inside], zm['max'][inside])
+        
+        # Bloques de borde: decodificar y filtrar por tiempo
+        partial = np.flatnonzero(overlaps & ~inside)
+        for i in partial:
+            t, v = self._decode_block(i)
+            v = v[(t >= t_lo) & (t < t_hi) & ~np.isnan(v)]
+            sid = zm['series'][i]
+            if len(v):
+                count[sid] += len(v)
+                total[sid] += v.sum()
+                low[sid] = np.fmin(low[sid], v.min())
+                high[sid] = np.fmax(high[sid], v.max())
+        
+        self.last_scan = {'bloques': len(zm), 'bloques_decodificados': len(partial)}
+        with np.errstate(invalid='ignore', divide='ignore'):
+            result = {'count': count.astype(np.int64), 'sum': total, 'mean': total / count, 'min': low, 'max': high}[how]
+        
+        index = pd.MultiIndex.from_frame(self.series[['location', 'parameter']])
+        has_rows = np.bincount(zm['series'][overlaps], minlength=n_series) > 0
+        return pd.Series(result, index=index, name=how)[has_rows]
+    
+    def save(self, filepath):
+        """
+        Guardar el almacén en un archivo (escritura atómica)
+        
+        Args:
+            filepath (str): Ruta destino (.sbk)
+        """
+        header = json.dumps({
+            'block_seconds': int(self.block_seconds),
+            'series': self.series[['location', 'parameter']].values.tolist(),
+            'n_blocks': int(len(self.zone_map)),
+        }).encode('utf-8')
+        content = (BLOCKS_MAGIC + struct.pack('<I', len(header)) + header
+                   + self.zone_map.tobytes() + bytes(self._payload))
+        atomic_write(filepath, lambda f: f.write(content))
+        print(f"✓ Almacén por bloques guardado en: {filepath}")
+    
+    @classmethod
+    def load(cls, filepath):
+        """
+        Cargar un almacén guardado con save()
+        
+        Los bloques se mapean en memoria: solo se leen del disco los que
+        una consulta decodifica.
+        
+        Args:
+            filepath (str): Ruta del archivo
+            
+        Returns:
+            SeriesBlockStore: Almacén
+        """
+        with open(filepath, 'rb') as f:
+            if f.read(4) != BLOCKS_MAGIC:
+                raise ValueError("Archivo de bloques no reconocido")
+            (header_len,) = struct.unpack('<I', f.read(4))
+            header = json.loads(f.read(header_len).decode('utf-8'))
+            zone_map = np.frombuffer(f.read(header['n_blocks'] * ZONE_MAP_DTYPE.itemsize),
+                                     dtype=ZONE_MAP_DTYPE).copy()
+            payload_start = f.tell()
+        
+        payload = b''
+        if len(zone_map):
+            payload = memoryview(np.memmap(filepath, dtype=np.uint8, mode='r', offset=payload_start))
+        series = pd.DataFrame(header['series'], columns=['location', 'parameter'])
+        series.index.name = 'id'
+        return cls(series, zone_map, header['block_seconds'], payload)
+
+def build_series_blocks(df, filepath=None, schema=None, value_col=None,
+                        block_seconds=DEFAULT_BLOCK_SECONDS):
+    """
+    Construir (y opcionalmente guardar) el almacén por bloques
+    
+    Args:
+        df (pd.DataFrame): Mediciones en formato largo
+        filepath (str): Ruta .sbk destino (opcional)
+        schema (str): Clave de MEASUREMENT_SCHEMAS; se detecta si es None
+        value_col (str): Columna de valores
+        block_seconds (int): Duración de cada bloque
+        
+    Returns:
+        SeriesBlockStore: Almacén
+    """
+    store = SeriesBlockStore.from_frame(df, schema, value_col, block_seconds)
+    if filepath is not None:
+        store.save(filepath)
+    return store
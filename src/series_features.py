@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Rezagos, ventanas móviles y diferencias por serie en una sola pasada
+
+El panel se ordena una vez por (serie, tiempo) y cada característica se
+obtiene de vistas desplazadas o ventanas deslizantes sobre el arreglo
+ordenado. La posición de cada fila dentro de su serie decide qué valores
+son válidos, de modo que ningún rezago ni ventana cruza de una estación a
+otra. El resultado vuelve al orden original de las filas.
+
+Los rezagos también pueden medirse en tiempo: time_lags busca con
+np.searchsorted el valor exacto en t - k horas (con tolerancia) sobre las
+marcas ordenadas de cada serie, de modo que un dato faltante deja NaN en
+lugar de desplazar el rezago hacia atrás.
+"""
+
+import re
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# Nombre de característica -> (tipo, k); ma y media_movil son la media móvil
+WINDOW_PATTERN = re.compile(r'^(lag|diff|ma|media_movil|std|max|min)_(\d+)$')
+
+# Tolerancia por defecto de los rezagos en tiempo (segundos)
+LAG_TOLERANCE_S = 600
+
+# Modos de rezago: por filas o por horas (t - k horas)
+LAG_MODES = ('rows', 'hours')
+
+# Reducciones sobre la ventana (NaN en la ventana deja NaN, como rolling de pandas)
+_REDUCERS = {
+    'ma': lambda w: w.mean(axis=1),
+    'media_movil': lambda w: w.mean(axis=1),
+    'std': lambda w: w.std(axis=1, ddof=1),
+    'max': lambda w: w.max(axis=1),
+    'min': lambda w: w.min(axis=1),
+}
+
+def is_window_feature(name):
+    """Indicar si el nombre es un rezago, ventana o diferencia"""
+    return WINDOW_PATTERN.match(name) is not None
+
+def series_positions(series):
+    """
+    Posición de cada fila dentro de su serie en un arreglo ordenado por serie
+    
+    Args:
+        series (np.ndarray): Códigos de serie ordenados
+        
+    Returns:
+        np.ndarray: 0 en la primera fila de cada serie, 1 en la siguiente...
+    """
+    n = len(series)
+    starts = np.flatnonzero(np.concatenate([[True], series[1:] != series[:-1]])) if n else np.array([], dtype=int)
+    lengths = np.diff(np.append(starts, n))
+    return np.arange(n) - np.repeat(starts, lengths)
+
+def window_features(values, names, series=None, times=None):
+    """
+    Calcular rezagos, ventanas y diferencias respetando los límites de cada serie
+    
+    Args:
+        values (np.ndarray): Valores en el orden original de las filas
+        names (list): Características: lag_k, diff_k, ma_k / media_movil_k,
+            std_k, max_k, min_k
+        series (np.ndarray): Código de serie por fila (None = una sola serie
+            en el orden de las filas)
+        times (np.ndarray): Marca de tiempo por fila para ordenar dentro de
+            cada serie (None = orden de las filas)
+            
+    Returns:
+        np.ndarray: Matriz (filas, características) float64 en el orden original
+    """
+    v = np.asarray(values, dtype=np.float64)
+    n = len(v)
+    if series is None:
+        order = None
+        s = np.zeros(n, dtype=np.int64)
+    else:
+        s = np.asarray(series)
+        keys = (s,) if times is None else (np.asarray(times), s)
+        order = np.lexsort(keys)
+        v, s = v[order], s[order]
+    pos = series_positions(s)
+    
+    # Las ventanas del mismo tamaño comparten la vista deslizante
+    widths = {int(WINDOW_PATTERN.match(name).group(2)) for name in names
+              if WINDOW_PATTERN.match(name).group(1) in _REDUCERS}
+    views = {w: sliding_window_view(np.concatenate([np.full(w - 1, np.nan), v]), w) for w in widths}
+    
+    result = np.empty((n, len(names)), dtype=np.float64)
+    for j, name in enumerate(names):
+        kind, k = WINDOW_PATTERN.match(name).groups()
+        k = int(k)
+        if kind in ('lag', 'diff'):
+            shifted = np.concatenate([np.full(min(k, n), np.nan), v[:max(n - k, 0)]])
+            shifted[pos < k] = np.nan
+            column = shifted if kind == 'lag' else v - shifted
+        else:
+            column = _REDUCERS[kind](views[k]) if n else np.empty(0)
+            column[pos < k - 1] = np.nan
+        result[:, j] = column
+    
+    if order is not None:
+        restored = np.empty_like(result)
+        restored[order] = result
+        result = restored
+    return result
+
+def _sorted_series_keys(series, times):
+    """Orden por (serie, tiempo) y clave int64 monótona que separa las series"""
+    order = np.lexsort((times, series))
+    s, t = series[order], times[order]
+    t_min = t.min() if len(t) else 0
+    span = int(t.max() - t_min + 1) if len(t) else 1
+    if (int(s.max(initial=0)) + 1) * span >= 2 ** 62:
+        return order, s, t, None, t_min, span
+    return order, s, t, s.astype(np.int64) * span + (t - t_min), t_min, span
+
+def time_lags(values, times, offsets, series=None, tolerance=LAG_TOLERANCE_S):
+    """
+    Valor de cada serie en t - offset, buscado por marca de tiempo
+    
+    Para cada fila y desfase se toma la lectura más cercana a t - offset de
+    la misma serie; si la más cercana está a más de tolerance segundos el
+    rezago queda NaN.
+    
+    Args:
+        values (np.ndarray): Valores en el orden original de las filas
+        times (np.ndarray): Marcas de tiempo en segundos (int64)
+        offsets (list): Desfases en segundos
+        series (np.ndarray): Código de serie por fila (None = una sola serie)
+        tolerance (int): Distancia máxima en segundos a la lectura encontrada
+        
+    Returns:
+        np.ndarray: Matriz (filas, desfases) float64 en el orden original
+    """
+    v = np.asarray(values, dtype=np.float64)
+    t_all = np.asarray(times, dtype=np.int64)
+    s_all = np.zeros(len(v), dtype=np.int64) if series is None else np.asarray(series, dtype=np.int64)
+    order, s, t, keys, t_min, span = _sorted_series_keys(s_all, t_all)
+    v = v[order]
+    n = len(v)
+    
+    result = np.full((n, len(offsets)), np.nan)
+    if n == 0:
+        return result
+    if keys is None:
+        # Clave combinada fuera de rango: buscar serie por serie
+        for code in np.unique(s):
+            rows = np.flatnonzero(s == code)
+            sub = time_lags(v[rows], t[rows], offsets, None, tolerance)
+            result[rows] = sub
+    else:
+        for j, offset in enumerate(offsets):
+            target = t - int(offset)
+            target_keys = s.astype(np.int64) * span + (target - t_min)
+            right = np.clip(np.searchsorted(keys, target_keys), 0, n - 1)
+            left = np.clip(right - 1, 0, n - 1)
+            # La lectura más cercana entre los dos vecinos, solo dentro de la misma serie
+            gap_right = np.where(s[right] == s, np.abs(t[right] - target), np.iinfo(np.int64).max)
+            gap_left = np.where(s[left] == s, np.abs(t[left] - target), np.iinfo(np.int64).max)
+            nearest = np.where(gap_left < gap_right, left, right)
+            gap = np.minimum(gap_left, gap_right)
+            result[:, j] = np.where(gap <= tolerance, v[nearest], np.nan)
+    
+    restored = np.empty_like(result)
+    restored[order] = result
+    return restored
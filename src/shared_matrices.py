@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Matrices compartidas entre procesos mediante memoria compartida
+
+Las matrices de entrenamiento (densas o CSR) se copian una sola vez a
+segmentos de multiprocessing.shared_memory y a los procesos trabajadores
+solo viaja un descriptor pequeño (nombre del segmento, forma y tipo). Cada
+trabajador reconstruye la matriz como vista de solo lectura sobre el
+segmento, sin serializar ni copiar los datos por tarea.
+"""
+
+from multiprocessing import shared_memory
+
+import numpy as np
+from scipy import sparse
+
+def _attach_segment(name):
+    """Abrir un segmento existente sin que el proceso lo elimine al salir"""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13: el registro cae en el rastreador del proceso padre
+        # (compartido por los trabajadores del pool), que ya lo tiene
+        return shared_memory.SharedMemory(name=name)
+
+class SharedMatrixArena:
+    """
+    Dueño de los segmentos de memoria compartida de un grupo de matrices
+    
+    Se usa como administrador de contexto: al salir se cierran y eliminan
+    todos los segmentos creados.
+    """
+    
+    def __init__(self):
+        self.segments = []
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+    
+    def _share_array(self, array):
+        """Copiar un arreglo a un segmento nuevo y devolver su descriptor"""
+        array = np.ascontiguousarray(array)
+        segment = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        self.segments.append(segment)
+        np.ndarray(array.shape, dtype=array.dtype, buffer=segment.buf)[...] = array
+        return {'name': segment.name, 'shape': array.shape, 'dtype': array.dtype.str}
+    
+    def share(self, matrix):
+        """
+        Publicar una matriz en memoria compartida
+        
+        Args:
+            matrix (np.ndarray o sparse.csr_matrix): Matriz a compartir
+            
+        Returns:
+            dict: Descriptor serializable para attach_matrix
+        """
+        if sparse.issparse(matrix):
+            matrix = matrix.tocsr()
+            return {
+                'format': 'csr',
+                'shape': matrix.shape,
+                'data': self._share_array(matrix.data),
+                'indices': self._share_array(matrix.indices),
+                'indptr': self._share_array(matrix.indptr),
+            }
+        return {'format': 'dense', 'array': self._share_array(matrix)}
+    
+    def nbytes(self):
+        """Bytes reservados en memoria compartida"""
+        return sum(segment.size for segment in self.segments)
+    
+    def close(self):
+        """Cerrar y eliminar todos los segmentos"""
+        for segment in self.segments:
+            try:
+                segment.close()
+                segment.unlink()
+            except FileNotFoundError:
+                pass
+        self.segments = []
+
+def attach_matrix(descriptor):
+    """
+    Reconstruir en un trabajador la matriz publicada por SharedMatrixArena.share
+    
+    Args:
+        descriptor (dict): Descriptor devuelto por share
+        
+    Returns:
+        tuple: (matriz de solo lectura, segmentos abiertos). Los segmentos
+            deben mantenerse vivos mientras se use la matriz y cerrarse
+            después con close_segments.
+    """
+    segments = []
+    
+    def _attach_array(spec):
+        segment = _attach_segment(spec['name'])
+        segments.append(segment)
+        array = np.ndarray(spec['shape'], dtype=np.dtype(spec['dtype']), buffer=segment.buf)
+        array.setflags(write=False)
+        return array
+    
+    if descriptor['format'] == 'csr':
+        matrix = sparse.csr_matrix(
+            (_attach_array(descriptor['data']), _attach_array(descriptor['indices']),
+             _attach_array(descriptor['indptr'])),
+            shape=descriptor['shape'], copy=False
+        )
+    else:
+        matrix = _attach_array(descriptor['array'])
+    return matrix, segments
+
+def close_segments(segments):
+    """Cerrar los segmentos abiertos por attach_matrix (no los elimina)"""
+    for segment in segments:
+        try:
+            segment.close()
+        except BufferError:
+            # Aún hay vistas vivas: el mapeo se libera al terminar el proceso
+            pass
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Rezagos de estaciones vecinas y de otros contaminantes desde el panel horario
+
+Las estaciones vecinas salen de una tabla de distancias (haversine sobre
+las coordenadas de cada estación) calculada una sola vez. Cada
+característica cruzada es un gather vectorizado sobre el panel horario
+denso (ver data_utils.create_hourly_panel): para cada fila se resuelve la
+columna (estación, parámetro) con una tabla de códigos y la fila del panel
+restando k horas, sin pivotear ni unir tablas por cada serie.
+
+Nombres de las características:
+    - <parámetro>_lag_<k>: otro contaminante de la misma estación k horas
+      antes (p. ej. co_lag_1)
+    - vecino<r>_<parámetro>_lag_<k>: el parámetro en la r-ésima estación
+      más cercana k horas antes (p. ej. vecino1_pm25_lag_3)
+"""
+
+import re
+
+import numpy as np
+import pandas as pd
+
+from calendar_features import hour_of_epoch
+
+# Radio medio de la Tierra (km)
+EARTH_RADIUS_KM = 6371.0
+
+# Vecinos por estación que se guardan en la tabla
+DEFAULT_NEIGHBORS = 3
+
+# Nombre de característica cruzada -> (rango del vecino o None, parámetro, k)
+CROSS_PATTERN = re.compile(r'^(?:vecino(\d+)_)?(.+)_lag_(\d+)$')
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Distancia en km entre coordenadas en grados (admite arreglos)"""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(a, dtype=np.float64)) for a in (lat1, lon1, lat2, lon2))
+    a = (np.sin((lat2 - lat1) / 2) ** 2
+         + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+class StationNeighbors:
+    """
+    Tabla de distancias entre estaciones y sus vecinos más cercanos
+    
+    Atributos:
+        stations (list): Estaciones (el código es la posición)
+        distances (np.ndarray): Matriz (estaciones, estaciones) en km
+        neighbors (np.ndarray): Códigos (estaciones, k) de los vecinos
+            ordenados por distancia; -1 si no hay vecino dentro del radio
+    """
+    
+    def __init__(self, stations, distances, k=DEFAULT_NEIGHBORS, max_km=None):
+        """
+        Args:
+            stations (list): Nombres de las estaciones
+            distances (np.ndarray): Distancias en km entre estaciones
+            k (int): Vecinos por estación
+            max_km (float): Distancia máxima de un vecino (None = sin límite)
+        """
+        self.stations = list(stations)
+        self.distances = np.asarray(distances, dtype=np.float64)
+        
+        # La propia estación queda al final del orden
+        ranked = self.distances.copy()
+        np.fill_diagonal(ranked, np.inf)
+        if max_km is not None:
+            ranked[ranked > max_km] = np.inf
+        order = np.argsort(ranked, axis=1, kind='stable')[:, :k]
+        found = np.take_along_axis(ranked, order, axis=1) < np.inf
+        self.neighbors = np.full((len(self.stations), k), -1, dtype=np.int64)
+        self.neighbors[:, :order.shape[1]] = np.where(found, order, -1)
+    
+    @classmethod
+    def from_coordinates(cls, df, location_col, lat_col, lon_col, k=DEFAULT_NEIGHBORS, max_km=None):
+        """
+        Calcular la tabla desde las coordenadas de las mediciones
+        
+        Args:
+            df (pd.DataFrame): Datos con una columna de estación y sus coordenadas
+            location_col (str): Columna de estación
+            lat_col (str): Columna de latitud
+            lon_col (str): Columna de longitud
+            k (int): Vecinos por estación
+            max_km (float): Distancia máxima de un vecino
+            
+        Returns:
+            StationNeighbors: Tabla de vecinos
+        """
+        coordinates = df.groupby(location_col)[[lat_col, lon_col]].median().dropna()
+        lat = coordinates[lat_col].to_numpy()
+        lon = coordinates[lon_col].to_numpy()
+        distances = haversine_km(lat[:, None], lon[:, None], lat[None, :], lon[None, :])
+        neighbors = cls(coordinates.index, distances, k, max_km)
+        print(f"✓ Tabla de vecinos: {len(neighbors.stations)} estaciones, {k} vecinos por estación")
+        return neighbors
+    
+    def codes(self, locations):
+        """Código de cada estación (-1 si no tiene coordenadas)"""
+        return pd.Index(self.stations).get_indexer(pd.Index(locations))
+    
+    def table(self):
+        """Vecinos y distancias en forma legible"""
+        rows = {}
+        for i, station in enumerate(self.stations):
+            row = {}
+            for r, j in enumerate(self.neighbors[i], start=1):
+                row[f'vecino{r}'] = self.stations[j] if j >= 0 else None
+                row[f'distancia{r}_km'] = round(self.distances[i, j], 2) if j >= 0 else np.nan
+            rows[station] = row
+        return pd.DataFrame.from_dict(rows, orient='index')
+
+def parse_cross_feature(name):
+    """
+    Separar una característica cruzada en (rango del vecino, parámetro, k)
+    
+    Returns:
+        tuple: (rango o 0 para la misma estación, parámetro, k) o None si
+            el nombre no es una característica cruzada
+    """
+    match = CROSS_PATTERN.match(name)
+    if match is None:
+        return None
+    rank, parameter, k = match.groups()
+    return int(rank or 0), parameter, int(k)
+
+def cross_series_features(panel, times, locations, names, neighbors=None, min_coverage=None):
+    """
+    Rezagos de otros contaminantes y de estaciones vecinas por gather
+    
+    Args:
+        panel (pd.DataFrame): Panel horario con columnas (estación, parámetro)
+            (ver data_utils.create_hourly_panel)
+        times (array-like): Marca de tiempo de cada fila (se lleva a la hora)
+        locations (array-like o str): Estación de cada fila (o una para todas)
+        names (list): Características (ver el docstring del módulo)
+        neighbors (StationNeighbors): Tabla de vecinos (obligatoria para vecino<r>_*)
+        min_coverage (float): Fracción mínima de filas con valor; las columnas
+            por debajo se descartan (None = conservar todas)
+            
+    Returns:
+        pd.DataFrame: Características float32, una fila por marca de tiempo
+    """
+    times = pd.DatetimeIndex(times)
+    if isinstance(locations, str):
+        locations = [locations] * len(times)
+    parsed = [parse_cross_feature(name) for name in names]
+    unknown = [name for name, item in zip(names, parsed) if item is None]
+    if unknown:
+        raise ValueError(f"Características cruzadas no reconocidas: {unknown}")
+    if neighbors is None and any(rank for rank, _, _ in parsed):
+        raise ValueError("Las características de vecinos requieren una tabla de vecinos")
+    
+    # Códigos de estación: los de la tabla de vecinos o los del panel
+    panel_stations = panel.columns.get_level_values(0)
+    panel_parameters = panel.columns.get_level_values(1)
+    stations = neighbors.stations if neighbors is not None else list(pd.unique(panel_stations))
+    parameters = sorted({parameter for _, parameter, _ in parsed})
+    station_codes = pd.Index(stations).get_indexer(pd.Index(locations))
+    
+    # Tabla (estación, parámetro) -> columna del panel (-1 si la serie no existe)
+    column_of = np.full((len(stations), len(parameters)), -1, dtype=np.int64)
+    s_codes = pd.Index(stations).get_indexer(panel_stations)
+    p_codes = pd.Index(parameters).get_indexer(panel_parameters)
+    known = (s_codes >= 0) & (p_codes >= 0)
+    column_of[s_codes[known], p_codes[known]] = np.flatnonzero(known)
+    
+    values = panel.to_numpy(dtype=np.float64)
+    start = hour_of_epoch(panel.index[:1])[0] if len(panel) else 0
+    hours = hour_of_epoch(times)
+    result = np.full((len(times), len(names)), np.nan, dtype=np.float32)
+    if len(panel) == 0:
+        return pd.DataFrame(result, columns=names)
+    
+    for j, (rank, parameter, k) in enumerate(parsed):
+        if not rank:
+            source = station_codes
+        elif rank <= neighbors.neighbors.shape[1]:
+            source = np.where(station_codes >= 0,
+                              neighbors.neighbors[np.maximum(station_codes, 0), rank - 1], -1)
+        else:
+            source = np.full(len(times), -1)
+        column = np.where(source >= 0, column_of[np.maximum(source, 0), parameters.index(parameter)], -1)
+        row = hours - start - k
+        valid = (column >= 0) & (row >= 0) & (row < len(values))
+        result[valid, j] = values[row[valid], column[valid]]
+    
+    features = pd.DataFrame(result, columns=names, copy=False)
+    if min_coverage is not None and len(features):
+        coverage = features.notna().mean()
+        dropped = coverage.index[coverage < min_coverage].tolist()
+        if dropped:
+            print(f"⚠ Características cruzadas descartadas por cobertura < {min_coverage:.0%}: {dropped}")
+            features = features.drop(columns=dropped)
+    return features
@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+"""
+Esquema en estrella para mediciones y metadatos de ubicaciones y sensores
+
+Separa el CSV ancho en una tabla de hechos angosta (ids enteros, tiempo,
+valor y banderas) y tablas de dimensión de ubicaciones, parámetros y
+sensores, de modo que los nombres, coordenadas y unidades dejan de
+repetirse en cada fila. widen() reconstruye el formato ancho con gathers
+por id en lugar de merges.
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from output_writer import atomic_write, write_frame
+from timeseries_codec import decode_columns, encode_columns
+
+# Columnas de cada esquema: clave y atributos de cada dimensión, tiempo,
+# valor y columnas numéricas que quedan en la tabla de hechos
+STAR_LAYOUTS = {
+    'santiago': {
+        'location_key': 'location_name',
+        'location_cols': ['location_id', 'location_name', 'city_name', 'country_code'],
+        'parameter_key': 'parameter_name',
+        'parameter_cols': ['parameter_name', 'parameter_id', 'unit', 'unit_code'],
+        'sensor_key': 'sensor_id',
+        'time': 'date_from_utc',
+        'time_to': 'date_to_utc',
+        'local_times': {'date_from_local': 'date_from_utc', 'date_to_local': 'date_to_utc'},
+        'value': 'value',
+        'fact_cols': ['value_normalized', 'coverage_percent', 'quality_flags'],
+    },
+    'localidades': {
+        'location_key': 'localidad_nombre',
+        'location_cols': ['localidad_id', 'localidad_nombre', 'localidad_buscada', 'ciudad',
+                          'coordenadas_lat', 'coordenadas_lon'],
+        'parameter_key': 'parametro_nombre',
+        'parameter_cols': ['parametro_nombre', 'parametro_id', 'unidad', 'unidad_codigo'],
+        'sensor_key': 'sensor_id',
+        'time': 'fecha_desde_utc',
+        'time_to': 'fecha_hasta_utc',
+        'local_times': {'fecha_desde_local': 'fecha_desde_utc', 'fecha_hasta_local': 'fecha_hasta_utc'},
+        'value': 'valor',
+        'fact_cols': ['valor_normalizado', 'cobertura_porcentaje', 'banderas_calidad'],
+    },
+}
+
+# Zona horaria de las estaciones (las columnas locales se derivan del UTC)
+DEFAULT_TIMEZONE = 'America/Santiago'
+
+def _smallest_int(n_values):
+    """Tipo entero con signo más chico que representa ids 0..n_values-1 y -1"""
+    for dtype in (np.int8, np.int16, np.int32):
+        if n_values < np.iinfo(dtype).max:
+            return dtype
+    return np.int64
+
+def _detect_layout(columns):
+    """Elegir el esquema cuyas columnas de hechos están presentes"""
+    for name, layout in STAR_LAYOUTS.items():
+        if all(layout[key] in columns for key in ('location_key', 'parameter_key', 'time', 'value')):
+            return name
+    raise ValueError(f"Columnas no reconocidas para el esquema en estrella: {list(columns)[:8]}")
+
+class StarSchema:
+    """
+    Tabla de hechos angosta más dimensiones de ubicaciones, parámetros y sensores
+    
+    Atributos:
+        fact (pd.DataFrame): location_id, parameter_id, sensor_id, time
+            (segundos UTC), periodo_s, valor y columnas numéricas del esquema
+        locations, parameters, sensors (pd.DataFrame): Dimensiones indexadas
+            por su id entero
+        layout (str): Clave de STAR_LAYOUTS
+        columns (list): Orden de columnas del formato ancho original
+    """
+    
+    def __init__(self, fact, locations, parameters, sensors, layout, columns):
+        self.fact = fact
+        self.locations = locations
+        self.parameters = parameters
+        self.sensors = sensors
+        self.layout = layout
+        self.columns = columns
+    
+    @classmethod
+    def from_frame(cls, df, layout=None):
+        """
+        Separar un DataFrame ancho en hechos y dimensiones
+        
+        Args:
+            df (pd.DataFrame): Mediciones en formato ancho
+            layout (str): Clave de STAR_LAYOUTS; se detecta si es None
+            
+        Returns:
+            StarSchema: Esquema en estrella
+        """
+        layout = layout or _detect_layout(df.columns)
+        spec = STAR_LAYOUTS[layout]
+        
+        def _dimension(key, cols):
+            codes, uniques = pd.factorize(df[key])
+            first = pd.Series(np.arange(len(df))).groupby(codes).first()
+            first = first[first.index >= 0].to_numpy()
+            present = [c for c in cols if c in df.columns]
+            dim = df[present].iloc[first].reset_index(drop=True)
+            dim.index.name = 'id'
+            return codes, dim
+        
+        location_ids, locations = _dimension(spec['location_key'], spec['location_cols'])
+        parameter_ids, parameters = _dimension(spec['parameter_key'], spec['parameter_cols'])
+        
+        times = pd.to_datetime(df[spec['time']], utc=True)
+        seconds = times.values.astype('datetime64[s]').view(np.int64)
+        
+        # Sensores: cada serie (sensor, ubicación, parámetro) con su período típico
+        sensor_col = spec['sensor_key']
+        sensor_values = df[sensor_col] if sensor_col in df.columns else pd.Series(np.nan, index=df.index)
+        series_frame = pd.DataFrame({
+            sensor_col: sensor_values.to_numpy(),
+            'location_id': location_ids,
+            'parameter_id': parameter_ids,
+        })
+        sensor_ids = series_frame.groupby(list(series_frame.columns), dropna=False, sort=False).ngroup()
+        sensor_ids = sensor_ids.to_numpy()
+        sensors = series_frame.groupby(sensor_ids).first()
+        period = None
+        if spec['time_to'] in df.columns:
+            period = (pd.to_datetime(df[spec['time_to']], utc=True) - times).dt.total_seconds()
+            sensors['periodo_s'] = period.groupby(sensor_ids).median().to_numpy()
+        sensors.index.name = 'id'
+        
+        fact = pd.DataFrame({
+            'location_id': location_ids.astype(_smallest_int(len(locations))),
+            'parameter_id': parameter_ids.astype(_smallest_int(len(parameters))),
+            'sensor_id': sensor_ids.astype(_smallest_int(len(sensors))),
+            'time': seconds,
+            spec['value']: df[spec['value']].to_numpy(dtype=np.float64),
+        })
+        # Período de cada fila (no se asume constante por sensor: hay promedios
+        # de 1 y 24 horas y horas parciales); -1 si no hay fecha de término
+        if period is not None:
+            fact['periodo_s'] = period.fillna(-1).round().to_numpy().astype(np.int32)
+        for col in spec['fact_cols']:
+            if col in df.columns:
+                fact[col] = df[col].to_numpy()
+        
+        return cls(fact, locations, parameters, sensors, layout, list(df.columns))
+    
+    def widen(self, columns=None, timezone=DEFAULT_TIMEZONE):
+        """
+        Reconstruir el formato ancho uniendo las dimensiones por id
+        
+        Las fechas de término salen del período de cada fila y las
+        columnas locales se derivan del UTC con la zona horaria indicada.
+        
+        Args:
+            columns (list): Columnas pedidas (por defecto las originales)
+            timezone (str): Zona horaria de las columnas locales
+            
+        Returns:
+            pd.DataFrame: Mediciones en formato ancho
+        """
+        spec = STAR_LAYOUTS[self.layout]
+        wanted = list(columns) if columns is not None else self.columns
+        parts = {}
+        
+        # Gathers por id: cada dimensión se expande con take sobre la columna de hechos
+        for dim, id_col in ((self.locations, 'location_id'), (self.parameters, 'parameter_id')):
+            rows = self.fact[id_col].to_numpy()
+            for col in dim.columns:
+                if col in wanted:
+                    parts[col] = dim[col].to_numpy()[rows]
+        
+        sensor_rows = self.fact['sensor_id'].to_numpy()
+        if spec['sensor_key'] in wanted:
+            parts[spec['sensor_key']] = self.sensors[spec['sensor_key']].to_numpy()[sensor_rows]
+        
+        start = pd.to_datetime(self.fact['time'].to_numpy(), unit='s', utc=True)
+        utc_times = {spec['time']: start}
+        if 'periodo_s' in self.fact.columns:
+            period = self.fact['periodo_s'].to_numpy().astype(np.float64)
+            period[period < 0] = np.nan
+            utc_times[spec['time_to']] = start + pd.to_timedelta(period, unit='s')
+        elif 'periodo_s' in self.sensors.columns:
+            # Esquemas guardados sin período por fila: período típico del sensor
+            period = self.sensors['periodo_s'].to_numpy()[sensor_rows]
+            utc_times[spec['time_to']] = start + pd.to_timedelta(period, unit='s')
+        for col, values in utc_times.items():
+            if col in wanted:
+                parts[col] = values
+        for local_col, utc_col in spec['local_times'].items():
+            if local_col in wanted and utc_col in utc_times:
+                parts[local_col] = utc_times[utc_col].tz_convert(timezone)
+        
+        for col in self.fact.columns:
+            if col in wanted and col not in parts:
+                parts[col] = self.fact[col].to_numpy()
+        
+        return pd.DataFrame({col: parts[col] for col in wanted if col in parts})
+    
+    def memory_usage(self):
+        """
+        Bytes en memoria de cada tabla
+        
+        Returns:
+            dict: Tabla -> bytes (incluye el contenido de las cadenas)
+        """
+        tables = {'hechos': self.fact, 'ubicaciones': self.locations,
+                  'parametros': self.parameters, 'sensores': self.sensors}
+        return {name: int(table.memory_usage(deep=True).sum()) for name, table in tables.items()}
+    
+    def save(self, directory, fact_format='tsc'):
+        """
+        Guardar las tablas en un directorio (escrituras atómicas)
+        
+        Args:
+            directory (str): Directorio destino
+            fact_format (str): Extensión de la tabla de hechos ('tsc' para
+                el códec columnar de timeseries_codec, 'csv.gz',
+                'csv' o 'parquet')
+        """
+        os.makedirs(directory, exist_ok=True)
+        fact_path = os.path.join(directory, f'hechos.{fact_format}')
+        if fact_format == 'tsc':
+            blob = encode_columns({col: self.fact[col].to_numpy() for col in self.fact.columns},
+                                  time_columns=('time',))
+            atomic_write(fact_path, lambda f: f.write(blob))
+        else:
+            write_frame(self.fact, fact_path)
+        write_frame(self.locations, os.path.join(directory, 'ubicaciones.csv'), index=True)
+        write_frame(self.parameters, os.path.join(directory, 'parametros.csv'), index=True)
+        write_frame(self.sensors, os.path.join(directory, 'sensores.csv'), index=True)
+        
+        metadata = {
+            'layout': self.layout,
+            'columns': self.columns,
+            'fact_format': fact_format,
+            'fact_dtypes': {col: str(dtype) for col, dtype in self.fact.dtypes.items()},
+        }
+        atomic_write(os.path.join(directory, 'esquema.json'),
+                     lambda f: json.dump(metadata, f, ensure_ascii=False, indent=2), mode='w')
+        print(f"✓ Esquema en estrella guardado en: {directory} ({len(self.fact):,} hechos)")
+    
+    @classmethod
+    def load(cls, directory):
+        """
+        Cargar un esquema guardado con save()
+        
+        Args:
+            directory (str): Directorio del esquema
+            
+        Returns:
+            StarSchema: Esquema en estrella
+        """
+        with open(os.path.join(directory, 'esquema.json'), encoding='utf-8') as f:
+            metadata = json.load(f)
+        
+        fact_path = os.path.join(directory, f"hechos.{metadata['fact_format']}")
+        if metadata['fact_format'] == 'tsc':
+            with open(fact_path, 'rb') as f:
+                fact = pd.DataFrame(decode_columns(f.read()))
+        elif metadata['fact_format'] == 'parquet':
+            fact = pd.read_parquet(fact_path)
+        else:
+            fact = pd.read_csv(fact_path, dtype=metadata['fact_dtypes'])
+        
+        dims = [pd.read_csv(os.path.join(directory, name), index_col='id')
+                for name in ('ubicaciones.csv', 'parametros.csv', 'sensores.csv')]
+        return cls(fact, *dims, metadata['layout'], metadata['columns'])
+
+def build_star_schema(df, layout=None):
+    """
+    Separar mediciones en formato ancho en un esquema en estrella
+    
+    Args:
+        df (pd.DataFrame): Mediciones
+        layout (str): 'santiago' o 'localidades'; se detecta si es None
+        
+    Returns:
+        StarSchema: Esquema en estrella
+    """
+    return StarSchema.from_frame(df, layout)
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Normalización de unidades al momento de la ingesta
+
+Convierte cada parámetro a su unidad canónica (la de la tabla de umbrales:
+µg/m³ para material particulado, ppb para O3, NO2 y SO2, ppm para CO)
+usando pesos moleculares, y guarda el valor normalizado junto con su código
+de unidad para que clasificación y modelado no reconviertan en cada llamada.
+"""
+
+import numpy as np
+import pandas as pd
+
+# Unidad canónica de cada parámetro (coincide con UMBRALES_CONTAMINACION)
+CANONICAL_UNITS = {
+    'pm25': 'µg/m³',
+    'pm10': 'µg/m³',
+    'o3': 'ppb',
+    'no2': 'ppb',
+    'so2': 'ppb',
+    'co': 'ppm',
+}
+
+# Códigos enteros de unidad que se almacenan junto al valor normalizado
+UNIT_CODES = ['µg/m³', 'mg/m³', 'ppb', 'ppm']
+
+# Pesos moleculares (g/mol) de los gases
+MOLECULAR_WEIGHTS = {
+    'o3': 48.00,
+    'no2': 46.0055,
+    'so2': 64.066,
+    'co': 28.010,
+}
+
+# Volumen molar a 25 °C y 1 atm (L/mol)
+MOLAR_VOLUME = 24.45
+
+# Variantes de escritura de cada unidad
+_UNIT_ALIASES = {
+    'µg/m³': 'µg/m³', 'μg/m³': 'µg/m³', 'ug/m3': 'µg/m³', 'µg/m3': 'µg/m³',
+    'μg/m3': 'µg/m³', 'ug/m³': 'µg/m³',
+    'mg/m³': 'mg/m³', 'mg/m3': 'mg/m³',
+    'ppb': 'ppb',
+    'ppm': 'ppm',
+}
+
+def canonical_unit_name(unit):
+    """
+    Normalizar la escritura de una unidad
+    
+    Args:
+        unit (str): Unidad tal como viene en los datos
+        
+    Returns:
+        str: Nombre de UNIT_CODES, o None si no se reconoce
+    """
+    if not isinstance(unit, str):
+        return None
+    return _UNIT_ALIASES.get(unit.strip().lower().replace(' ', ''))
+
+def conversion_factor(parameter, unit):
+    """
+    Factor que lleva un valor en `unit` a la unidad canónica del parámetro
+    
+    Args:
+        parameter (str): Nombre del parámetro
+        unit (str): Unidad de origen
+        
+    Returns:
+        float: Factor multiplicativo (NaN si la conversión no es posible)
+    """
+    param = str(parameter).lower()
+    source = canonical_unit_name(unit)
+    target = CANONICAL_UNITS.get(param)
+    if source is None or target is None:
+        return np.nan
+    if source == target:
+        return 1.0
+    
+    # Pasar por µg/m³; las razones de mezcla necesitan el peso molecular
+    weight = MOLECULAR_WEIGHTS.get(param)
+    to_ugm3 = {'µg/m³': 1.0, 'mg/m³': 1000.0}
+    if weight is not None:
+        to_ugm3['ppb'] = weight / MOLAR_VOLUME
+        to_ugm3['ppm'] = 1000.0 * weight / MOLAR_VOLUME
+    
+    if source not in to_ugm3 or target not in to_ugm3:
+        return np.nan
+    return to_ugm3[source] / to_ugm3[target]
+
+def normalize_units(df, parameter_col='parameter_name', unit_col='unit', value_col='value',
+                    normalized_col='value_normalized', code_col='unit_code'):
+    """
+    Agregar el valor en unidad canónica y su código de unidad
+    
+    El factor se calcula una vez por combinación (parámetro, unidad) y se
+    aplica a todas las filas con una sola operación vectorizada.
+    
+    Args:
+        df (pd.DataFrame): DataFrame en formato largo
+        parameter_col (str): Columna de parámetro
+        unit_col (str): Columna de unidad
+        value_col (str): Columna de valor
+        normalized_col (str): Columna de salida con el valor normalizado
+        code_col (str): Columna de salida con el código de unidad (int8,
+            índice en UNIT_CODES; -1 si no se pudo convertir)
+            
+    Returns:
+        pd.DataFrame: DataFrame con las columnas normalizadas agregadas
+    """
+    if unit_col not in df.columns:
+        print(f"⚠ Columna '{unit_col}' no encontrada, no se normalizan unidades")
+        return df
+    
+    pair_codes, pairs = pd.MultiIndex.from_arrays(
+        [df[parameter_col].astype(str).str.lower(), df[unit_col]]
+    ).factorize()
+    
+    factors = np.array([conversion_factor(param, unit) for param, unit in pairs], dtype=np.float64)
+    targets = np.array([
+        UNIT_CODES.index(CANONICAL_UNITS[param]) if not np.isnan(factor) else -1
+        for (param, _), factor in zip(pairs, factors)
+    ], dtype=np.int8)
+    
+    # Código -1 de factorize (parámetro o unidad faltante) -> sin conversión
+    factors = np.append(factors, np.nan)
+    targets = np.append(targets, np.int8(-1))
+    
+    df[normalized_col] = df[value_col].to_numpy(dtype=np.float64) * factors[pair_codes]
+    df[code_col] = targets[pair_codes]
+    
+    n_missing = int((df[code_col] < 0).sum())
+    print(f"✓ Unidades normalizadas: {len(pairs)} combinaciones parámetro/unidad")
+    if n_missing:
+        print(f"  ⚠ {n_missing:,} filas sin conversión conocida")
+    return df